@@ -0,0 +1,90 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+'''
+Benchmark of the surface extraction engines and of the mesh formats of `Nifti2StlConverter.nifti2stl_vtk_multi_class` on a synthetic label map.
+For each engine and format, the time to mesh and write all the classes, the size of the output and the time to read all the meshes back are reported.
+It is run as a module from the root of the repository, so that `pycad` is imported from the checkout:
+
+    python -m benchmarks.nifti2stl_benchmark --labels 100 --shape 256 256 200
+    python -m benchmarks.nifti2stl_benchmark --engines discrete --formats stl ply npz --smoothing
+'''
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import vtk
+import nibabel as nib
+from pycad.converters import Nifti2StlConverter
+from pycad.converters.nifti_to_stl import read_quantized_meshes
+
+
+def make_label_map(path, shape=(256, 256, 200), n_labels=100, seed=0):
+    '''
+    Writes a label map with `n_labels` ellipsoids of random sizes and positions (the later labels can cover the earlier ones).
+    '''
+    rng = np.random.default_rng(seed)
+    labels = np.zeros(shape, dtype=np.uint8 if n_labels < 256 else np.uint16)
+    for label in range(1, n_labels + 1):
+        radii = rng.uniform(4, 20, 3)
+        center = [rng.uniform(radius, size - radius) for radius, size in zip(radii, shape)]
+        box = tuple(slice(int(max(0, c - r)), int(min(size, c + r + 1))) for c, r, size in zip(center, radii, shape))
+        grid = np.ogrid[box]
+        inside = sum(((axis - c) / r) ** 2 for axis, c, r in zip(grid, center, radii)) <= 1
+        labels[box][inside] = label
+    nib.save(nib.Nifti1Image(labels, np.eye(4)), path)
+    return len(np.unique(labels)) - 1
+
+
+def read_meshes(out_dir):
+    '''
+    Reads all the meshes of a directory, returns the number of triangles.
+    '''
+    n_triangles = 0
+    for file in os.listdir(out_dir):
+        path = os.path.join(out_dir, file)
+        if file.endswith('.npz'):
+            n_triangles += sum(len(triangles) for _, triangles in read_quantized_meshes(path).values())
+            continue
+        reader = vtk.vtkPLYReader() if file.endswith('.ply') else vtk.vtkSTLReader()
+        reader.SetFileName(path)
+        reader.Update()
+        n_triangles += reader.GetOutput().GetNumberOfPolys()
+    return n_triangles
+
+
+def run(shape, n_labels, engines, mesh_formats=('stl',), **options):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'labels.nii.gz')
+        n_labels = make_label_map(path, shape, n_labels)
+        print(f'Label map {shape} with {n_labels} labels, options {options}')
+        for engine in engines:
+            for mesh_format in mesh_formats:
+                out_dir = os.path.join(tmp_dir, f'{engine}_{mesh_format}')
+                start = time.perf_counter()
+                Nifti2StlConverter(path, out_dir).nifti2stl_vtk_multi_class(engine=engine, mesh_format=mesh_format, **options)
+                elapsed = time.perf_counter() - start
+                size = sum(os.path.getsize(os.path.join(out_dir, file)) for file in os.listdir(out_dir))
+                start = time.perf_counter()
+                n_triangles = read_meshes(out_dir)
+                read_time = time.perf_counter() - start
+                print(f'{engine:>10} {mesh_format:>4}: {elapsed:8.2f} s, {len(os.listdir(out_dir))} files, {size / 1e6:.2f} MB, '
+                      f'read in {read_time:.2f} s ({n_triangles} triangles)')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shape', type=int, nargs=3, default=[256, 256, 200])
+    parser.add_argument('--labels', type=int, default=100)
+    parser.add_argument('--engines', nargs='+', default=['contour', 'discrete'])
+    parser.add_argument('--formats', nargs='+', default=['stl'], help='the mesh formats: stl, ply, npz')
+    parser.add_argument('--smoothing', action='store_true', help='smooth and reduce the meshes as well (the same cost for both engines)')
+    args = parser.parse_args()
+    run(tuple(args.shape), args.labels, args.engines, args.formats, smoothing=args.smoothing, reduce_meshes=args.smoothing)
@@ -12,4 +12,11 @@ from .nrrd_to_nifti import NrrdToNiftiConverter
 from .nrrd_to_dicom import NrrdToDicomConverter
 from .dicom_to_nrrd import DicomToNrrdConverter
 from .nifti_to_dicom_seg import NiftiToDicomSeg
-from .nifti_to_dicom_rt import NiftiToDicomRT
\ No newline at end of file
+from .nifti_to_dicom_rt import NiftiToDicomRT
+from .dicom_seg_to_nifti import DicomSegToNifti
+from .dicom_rt_to_nifti import DicomRTToNifti
+from .dicom_index import DicomIndex, DicomSeries
+from .conversion_catalog import ConversionCatalog
+from .nifti_stream_writer import StreamingNiftiWriter
+from .dicom_series_writer import DicomSeriesWriter
+from .engine import convert, read_volume, write_volume, Volume, register_reader, register_writer
\ No newline at end of file
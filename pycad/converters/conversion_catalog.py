@@ -0,0 +1,134 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import os
+import time
+import sqlite3
+import hashlib
+from .dicom_index import DicomSeries
+
+
+class ConversionCatalog:
+    '''
+    The class ConversionCatalog is a small SQLite database that remembers which DICOM series have already been converted, so that a new run only converts the new or changed series.
+    Each series is stored with its key (the SeriesInstanceUID, or the series directory when the series was not found by a `DicomIndex`, together with the output directory and extension of the conversion), the fingerprint of its input files (count, sizes and modification times), the output path and the checksum of the output.\n
+
+    Params:
+    - db_path: the path to the SQLite file, it is created if it does not exist.
+    - verify: also check the checksum of the existing outputs before skipping a series (slower, but it detects modified outputs).\n
+
+    ## Example of usage:
+    ```Python
+    from pycad.converters import DicomToNiftiConverter
+
+    converter = DicomToNiftiConverter()
+    converter.convert(input_dir, output_dir, incremental=True)  # the catalog is saved in the output directory by default
+    ```
+    '''
+
+    DEFAULT_NAME = '.pycad_catalog.sqlite'
+
+    def __init__(self, db_path, verify=False):
+        self.db_path = db_path
+        self.verify = verify
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS series ('
+            'series_key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, output TEXT NOT NULL, '
+            'checksum TEXT NOT NULL, converted_at REAL NOT NULL)'
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def series_key(dicom_series, target=''):
+        """
+        Returns the key of a series: its SeriesInstanceUID when known, otherwise its absolute directory, followed by the target of the conversion.
+        The target (see `conversion_target`) tells the outputs of the same series apart, so converting a series to NRRD after NIFTI, or to another directory, is not skipped.
+        """
+        if isinstance(dicom_series, DicomSeries):
+            key = dicom_series.series_uid
+        else:
+            key = 'dir:' + os.path.abspath(dicom_series[0])
+        return f'{key}|{target}' if target else key
+
+    @staticmethod
+    def conversion_target(output_dir, extension, output_filename=None):
+        """
+        Returns the target of a conversion, from the output directory and the extension (or the file name) of the output.
+        """
+        return os.path.join(os.path.abspath(output_dir), output_filename or '*' + extension)
+
+    @staticmethod
+    def fingerprint(files):
+        """
+        Computes the fingerprint of the input files from their number, paths, sizes and modification times (the files are not read).
+        """
+        digest = hashlib.sha1(str(len(files)).encode())
+        for path in sorted(files):
+            stat = os.stat(path)
+            digest.update(f'\0{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}'.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def checksum(path, chunk_size=1 << 20):
+        """
+        Computes the SHA-256 checksum of a file.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def lookup(self, series_key):
+        """
+        Returns the stored (fingerprint, output, checksum) of a series, or None if it has never been converted.
+        """
+        return self.connection.execute(
+            'SELECT fingerprint, output, checksum FROM series WHERE series_key = ?', (series_key,)
+        ).fetchone()
+
+    def is_up_to_date(self, series_key, fingerprint):
+        """
+        Checks whether a series has already been converted with the same input files and whether its output still exists.
+        """
+        row = self.lookup(series_key)
+        if row is None or row[0] != fingerprint or not os.path.exists(row[1]):
+            return False
+        if self.verify and self.checksum(row[1]) != row[2]:
+            return False
+        return True
+
+    def record(self, series_key, fingerprint, output):
+        """
+        Stores (or replaces) the conversion of a series, with the checksum of its output.
+        """
+        self.connection.execute(
+            'INSERT OR REPLACE INTO series (series_key, fingerprint, output, checksum, converted_at) VALUES (?, ?, ?, ?, ?)',
+            (series_key, fingerprint, output, self.checksum(output), time.time())
+        )
+        self.connection.commit()
+
+    def split_series(self, series_paths, target=''):
+        """
+        Splits the series into the ones that need to be converted and the ones that are up to date.
+        Returns the list of (index, series, key, fingerprint) to convert and the list of results in the order of `series_paths`, in the format of the converters results:
+        the results of the skipped series are filled, and the results of the series to convert are None.
+        """
+        pending, results = [], []
+        for i, series in enumerate(series_paths):
+            key = self.series_key(series, target)
+            fingerprint = self.fingerprint(series[1])
+            if self.is_up_to_date(key, fingerprint):
+                output = self.lookup(key)[1]
+                results.append({'series': series[0], 'series_uid': series.series_uid if isinstance(series, DicomSeries) else None,
+                                'output': output, 'seconds': 0.0, 'bytes': os.path.getsize(output), 'error': None, 'skipped': True})
+            else:
+                pending.append((i, series, key, fingerprint))
+                results.append(None)
+        return pending, results
+
+    def close(self):
+        self.connection.close()
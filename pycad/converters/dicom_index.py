@@ -0,0 +1,156 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import os
+import logging
+from collections import defaultdict, namedtuple
+import numpy as np
+from pydicom import dcmread
+from ..utils.parallel import run_jobs
+
+
+# One DICOM series found by the index: `files` are already sorted along the slice axis and can be given to `ImageSeriesReader.SetFileNames`.
+DicomSeries = namedtuple('DicomSeries', ['directory', 'files', 'series_uid', 'name'])
+
+
+class DicomIndex:
+    '''
+    The class DicomIndex is used to find the DICOM series of a directory tree by reading only the headers of the files (the pixel data is never read).
+    The instances are grouped by their SeriesInstanceUID, whatever the folders layout is (one series split in multiple folders or multiple series in the same folder), and sorted by their position along the slice axis.\n
+
+    Params:
+    - root_dir: the directory to scan recursively.
+    - workers: the number of threads used to read the headers, by default it is the default of `ThreadPoolExecutor`.
+    - use_processes: read the headers in a pool of processes instead of threads, this is faster on local disks since the parsing is done in python.
+    - extensions: a list of extensions to consider (for example `['.dcm']`), by default all the files are read and the ones that are not DICOM are skipped.
+    - force: the `force` flag of `pydicom.dcmread`, for the files without the DICOM preamble.\n
+
+    ## Example of usage:
+    ```Python
+    from pycad.converters import DicomIndex
+
+    index = DicomIndex("path/to/dicom/tree", workers=16)
+    for series in index.get_series(min_images=5):
+        print(series.name, series.series_uid, len(series.files))
+    ```
+    '''
+
+    HEADER_TAGS = ['SeriesInstanceUID', 'SeriesNumber', 'InstanceNumber', 'ImagePositionPatient', 'ImageOrientationPatient', 'SOPInstanceUID']
+    CHUNK_SIZE = 256
+
+    def __init__(self, root_dir, workers=None, use_processes=False, extensions=None, force=False):
+        self.root_dir = root_dir
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.use_processes = use_processes
+        self.extensions = tuple(ext.lower() for ext in extensions) if extensions else None
+        self.force = force
+        self.instances = None
+        self.logger = logging.getLogger('DicomIndex')
+
+    def list_files(self):
+        """
+        Lists all the candidate files of the tree, filtered by extension if `extensions` is set.
+        """
+        paths = []
+        for subdir, dirs, files in os.walk(self.root_dir):
+            for file in files:
+                if self.extensions is None or file.lower().endswith(self.extensions):
+                    paths.append(os.path.join(subdir, file))
+        return paths
+
+    @staticmethod
+    def read_headers(paths, force=False):
+        """
+        Reads the series related tags of a list of files, the files that cannot be read as DICOM are skipped.
+        Returns a list of tuples (path, series uid, series number, instance number, position, orientation, SOP instance uid).
+        """
+        headers = []
+        for path in paths:
+            try:
+                ds = dcmread(path, stop_before_pixels=True, specific_tags=DicomIndex.HEADER_TAGS, force=force)
+            except Exception:
+                continue
+
+            series_uid = ds.get('SeriesInstanceUID')
+            if not series_uid:
+                continue
+            position = ds.get('ImagePositionPatient')
+            orientation = ds.get('ImageOrientationPatient')
+            headers.append((
+                path,
+                str(series_uid),
+                ds.get('SeriesNumber'),
+                ds.get('InstanceNumber'),
+                tuple(float(v) for v in position) if position else None,
+                tuple(float(v) for v in orientation) if orientation else None,
+                str(ds.get('SOPInstanceUID', '')) or None,
+            ))
+        return headers
+
+    def scan(self):
+        """
+        Reads the headers of all the files of the tree in parallel and groups the instances by SeriesInstanceUID.
+        """
+        paths = self.list_files()
+        chunks = [(paths[i:i + self.CHUNK_SIZE], self.force) for i in range(0, len(paths), self.CHUNK_SIZE)]
+        results = run_jobs(DicomIndex.read_headers, chunks, workers=self.workers, use_processes=self.use_processes)
+
+        self.instances = defaultdict(list)
+        for headers in results:
+            for header in headers:
+                self.instances[header[1]].append(header)
+
+        self.logger.info(f'Indexed {sum(len(v) for v in self.instances.values())} DICOM files in {len(self.instances)} series.')
+        return self.instances
+
+    @staticmethod
+    def sort_instances(instances):
+        """
+        Sorts the instances of one series by their position along the normal of the slices (computed from ImageOrientationPatient),
+        then by InstanceNumber. The instances without a position are sorted by InstanceNumber only.
+        """
+        orientation = next((instance[5] for instance in instances if instance[5]), None)
+        normal = np.cross(orientation[:3], orientation[3:]) if orientation else None
+
+        def key(instance):
+            path, _, _, instance_number, position = instance[:5]
+            distance = float(np.dot(normal, position)) if normal is not None and position else 0.0
+            number = int(instance_number) if instance_number is not None else 0
+            return (distance, number, path)
+
+        return sorted(instances, key=key)
+
+    def get_series(self, min_images=1):
+        """
+        Returns the list of `DicomSeries` having at least `min_images` instances, the files of each series are sorted along the slice axis.
+        The name of the series is the name of its directory, followed by the SeriesNumber when the directory contains more than one series.
+        """
+        if self.instances is None:
+            self.scan()
+
+        found = []
+        for series_uid, instances in self.instances.items():
+            if len(instances) < min_images:
+                continue
+            instances = self.sort_instances(instances)
+            files = [instance[0] for instance in instances]
+            directory = os.path.commonpath([os.path.dirname(f) for f in files])
+            found.append((directory, files, series_uid, instances[0][2]))
+
+        per_directory = defaultdict(int)
+        for directory, _, _, _ in found:
+            per_directory[directory] += 1
+
+        series = []
+        used_names = set()
+        for idx, (directory, files, series_uid, series_number) in enumerate(sorted(found, key=lambda s: (s[0], s[2]))):
+            name = os.path.basename(os.path.normpath(directory))
+            if per_directory[directory] > 1:
+                name = f'{name}_{series_number if series_number is not None else idx}'
+            if name in used_names:
+                name = f'{name}_{idx}'
+            used_names.add(name)
+            series.append(DicomSeries(directory, files, series_uid, name))
+        return series
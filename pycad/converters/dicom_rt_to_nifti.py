@@ -0,0 +1,120 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+from collections import defaultdict
+import cv2
+import numpy as np
+from pydicom import dcmread
+from .reference_geometry import ReferenceGeometry
+from ..utils.parallel import run_jobs
+
+
+class DicomRTToNifti:
+    '''
+    The class DicomRTToNifti converts a DICOM RTSTRUCT file (for example one written by `NiftiToDicomRT`) to a nifti label map, in the geometry of the series it was drawn on.
+    The contours of each ROI are grouped by slice, and all the polygons of a slice are filled at once (the holes are contours inside the others), only in the bounding box of the polygons.
+    The ROIs are rasterized in parallel processes, and the geometry of the series is read from the headers only (see `ReferenceGeometry`).\n
+
+    Params:
+    - workers: the number of processes rasterizing the ROIs, by default the ROIs are done one after the other.
+    - header_workers: the number of threads reading the headers of the reference series.\n
+
+    ## Example of usage:
+    ```Python
+    from pycad.converters import DicomRTToNifti
+
+    converter = DicomRTToNifti(workers=4)
+    labels = converter.convert('path/to/rtstruct.dcm', 'path/to/dicom/series', 'path/to/labels.nii.gz')
+    print(labels)  # {1: 'liver', 2: 'spleen'}
+
+    # only some ROIs, with chosen label values
+    converter.convert('path/to/rtstruct.dcm', 'path/to/dicom/series', 'path/to/labels.nii.gz', roi_labels={'liver': 1, 'spleen': 5})
+    ```
+    '''
+
+    def __init__(self, workers=None, header_workers=None):
+        self.workers = workers
+        self.header_workers = header_workers
+
+    def convert(self, rt_path, dicom_dir, output_path, roi_labels=None):
+        '''
+        Converts an RTSTRUCT file to a nifti label map.\n
+        - `rt_path`: the path to the RTSTRUCT file
+        - `dicom_dir`: the directory of the reference series
+        - `output_path`: the path of the nifti file
+        - `roi_labels`: a dict {ROI name: label value} of the ROIs to convert, by default all the ROIs are converted with the values 1 to N in the order of the structure set
+
+        The overlapping ROIs are written in the order of the labels, so the last one wins. Returns the names of the labels {label value: ROI name}.
+        '''
+        rtstruct = dcmread(rt_path)
+        geometry = ReferenceGeometry(dicom_dir, self.referenced_series_uid(rtstruct), workers=self.header_workers)
+
+        names = {int(roi.ROINumber): str(roi.ROIName) for roi in rtstruct.StructureSetROISequence}
+        if roi_labels is None:
+            roi_labels = {name: value for value, name in enumerate(names.values(), start=1)}
+
+        rois = []
+        for roi_contour in rtstruct.get('ROIContourSequence', []):
+            name = names.get(int(roi_contour.ReferencedROINumber))
+            if name in roi_labels:
+                rois.append((roi_labels[name], name, self.slice_polygons(roi_contour, geometry)))
+        rois.sort(key=lambda roi: roi[0])
+
+        volume = np.zeros(geometry.shape, dtype=np.uint8 if max(roi_labels.values(), default=0) < 256 else np.uint16)
+        jobs = [(polygons, geometry.shape) for _, _, polygons in rois]
+        for (value, _, _), crops in zip(rois, run_jobs(self.rasterize_roi, jobs, workers=self.workers)):
+            for slice_index, y, x, crop in crops:
+                volume[slice_index, y:y + crop.shape[0], x:x + crop.shape[1]][crop] = value
+
+        geometry.save_nifti(volume, output_path)
+        return {value: name for value, name, _ in rois}
+
+    @staticmethod
+    def referenced_series_uid(rtstruct):
+        '''
+        Returns the SeriesInstanceUID of the series referenced by the RTSTRUCT, or None if it is not given.
+        '''
+        for frame_of_reference in rtstruct.get('ReferencedFrameOfReferenceSequence', []):
+            for study in frame_of_reference.get('RTReferencedStudySequence', []):
+                for series in study.get('RTReferencedSeriesSequence', []):
+                    return series.SeriesInstanceUID
+        return None
+
+    @staticmethod
+    def slice_polygons(roi_contour, geometry):
+        '''
+        Groups the contours of an ROI by slice, as (n, 2) arrays of (column, row) pixel coordinates.
+        The slice of a contour is its referenced image, or the slice closest to its points when it does not reference an image.
+        '''
+        polygons = defaultdict(list)
+        for contour in roi_contour.get('ContourSequence', []):
+            points = geometry.to_pixels(np.asarray(contour.ContourData, dtype=np.float64))
+            slice_index = None
+            for image in contour.get('ContourImageSequence', []):
+                slice_index = geometry.index.get(image.ReferencedSOPInstanceUID, slice_index)
+            if slice_index is None:
+                slice_index = int(np.rint(points[:, 2].mean()))
+            if 0 <= slice_index < geometry.shape[0]:
+                polygons[slice_index].append(points[:, :2])
+        return dict(polygons)
+
+    @staticmethod
+    def rasterize_roi(polygons, shape):
+        '''
+        Fills the polygons of each slice of an ROI (`slice_polygons`) in the bounding box of the polygons of the slice.
+        Returns a list of (slice index, first row, first column, boolean crop).
+        '''
+        crops = []
+        for slice_index, slice_polygons in sorted(polygons.items()):
+            points = [np.rint(polygon).astype(np.int32) for polygon in slice_polygons]
+            stacked = np.concatenate(points)
+            x0, y0 = np.clip(stacked.min(axis=0), 0, None)
+            x1, y1 = np.minimum(stacked.max(axis=0) + 1, (shape[2], shape[1]))
+            if x1 <= x0 or y1 <= y0:
+                continue
+            crop = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(crop, [(polygon - (x0, y0)).astype(np.int32) for polygon in points], 1)
+            crops.append((slice_index, int(y0), int(x0), crop.astype(bool)))
+        return crops
@@ -0,0 +1,94 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import numpy as np
+from pydicom import dcmread
+from .reference_geometry import ReferenceGeometry
+
+
+class DicomSegToNifti:
+    '''
+    The class DicomSegToNifti converts a DICOM SEG file (for example one written by `NiftiToDicomSeg`) back to a nifti label map, in the geometry of the series it was segmented from.
+    Each segment becomes a label with its segment number as value, the SEG frames (only the frames with foreground are stored in a SEG) are decoded one by one straight into the label volume, and the geometry of the series is read from the headers only (see `ReferenceGeometry`).\n
+
+    Params:
+    - workers: the number of threads reading the headers of the reference series.\n
+
+    ## Example of usage:
+    ```Python
+    from pycad.converters import DicomSegToNifti
+
+    converter = DicomSegToNifti()
+    labels = converter.convert('path/to/seg.dcm', 'path/to/dicom/series', 'path/to/labels.nii.gz')
+    print(labels)  # {1: 'liver', 2: 'spleen'}
+    ```
+    '''
+
+    def __init__(self, workers=None):
+        self.workers = workers
+
+    def convert(self, seg_path, dicom_dir, output_path):
+        '''
+        Converts a SEG file to a nifti label map.\n
+        - `seg_path`: the path to the SEG file
+        - `dicom_dir`: the directory of the reference series
+        - `output_path`: the path of the nifti file
+
+        The overlapping segments are written in the order of the frames, so the last one wins. Returns the names of the labels {segment number: segment label}.
+        '''
+        seg = dcmread(seg_path)
+        referenced_series = seg.get('ReferencedSeriesSequence')
+        series_uid = referenced_series[0].SeriesInstanceUID if referenced_series else None
+        geometry = ReferenceGeometry(dicom_dir, series_uid, workers=self.workers)
+
+        labels = {int(segment.SegmentNumber): str(segment.SegmentLabel) for segment in seg.SegmentSequence}
+        if (int(seg.Rows), int(seg.Columns)) != geometry.shape[1:]:
+            raise ValueError(f'The frames of the SEG ({seg.Rows}, {seg.Columns}) do not match the slices of the series {geometry.shape[1:]}.')
+
+        volume = np.zeros(geometry.shape, dtype=np.uint8 if max(labels) < 256 else np.uint16)
+        for i, (segment_number, slice_index) in enumerate(self.frame_positions(seg, geometry)):
+            if 0 <= slice_index < geometry.shape[0]:
+                volume[slice_index][self.decode_frame(seg, i)] = segment_number
+
+        geometry.save_nifti(volume, output_path)
+        return labels
+
+    @staticmethod
+    def frame_positions(seg, geometry):
+        '''
+        Yields the segment number and the slice index of each frame of the SEG: the slice is found from the source image of the frame, or from its position when the frame does not reference a source image.
+        '''
+        shared = seg.SharedFunctionalGroupsSequence[0] if 'SharedFunctionalGroupsSequence' in seg else None
+        for frame in seg.PerFrameFunctionalGroupsSequence:
+            segment = frame.SegmentIdentificationSequence[0] if 'SegmentIdentificationSequence' in frame else shared.SegmentIdentificationSequence[0]
+            slice_index = None
+            for derivation in frame.get('DerivationImageSequence', []):
+                for source in derivation.get('SourceImageSequence', []):
+                    slice_index = geometry.index.get(source.ReferencedSOPInstanceUID, slice_index)
+            if slice_index is None:
+                slice_index = geometry.slice_of(frame.PlanePositionSequence[0].ImagePositionPatient)
+            yield int(segment.ReferencedSegmentNumber), slice_index
+
+    @staticmethod
+    def decode_frame(seg, i):
+        '''
+        Returns the foreground of the frame `i` as a boolean array. The uncompressed frames are read directly from the pixel data (the binary frames are unpacked bit by bit, and a frame can start in the middle of a byte), without decoding all the frames at once.
+        The fractional frames are thresholded at half of the maximum value.
+        '''
+        rows, columns = int(seg.Rows), int(seg.Columns)
+        n_pixels = rows * columns
+        if seg.file_meta.TransferSyntaxUID.is_compressed:
+            frames = seg.pixel_array.reshape(-1, rows, columns)
+            frame = frames[i]
+        elif seg.BitsAllocated == 1:
+            start = i * n_pixels
+            data = np.frombuffer(seg.PixelData, dtype=np.uint8, count=(start % 8 + n_pixels + 7) // 8, offset=start // 8)
+            frame = np.unpackbits(data, bitorder='little')[start % 8:start % 8 + n_pixels].reshape(rows, columns)
+        else:
+            frame = np.frombuffer(seg.PixelData, dtype=np.uint8, count=n_pixels, offset=i * n_pixels).reshape(rows, columns)
+
+        if seg.SegmentationType == 'FRACTIONAL':
+            return frame >= max(int(seg.get('MaximumFractionalValue', 255)), 1) / 2
+        return frame > 0
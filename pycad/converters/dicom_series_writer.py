@@ -0,0 +1,378 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import os
+import struct
+import time
+import numpy as np
+import SimpleITK as sitk
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.filebase import DicomBytesIO
+from pydicom.filewriter import write_dataset
+from pydicom.uid import ExplicitVRLittleEndian, CTImageStorage, EnhancedCTImageStorage, EnhancedMRImageStorage, PYDICOM_IMPLEMENTATION_UID, generate_uid
+from pydicom.valuerep import DSfloat
+from ..utils.parallel import run_jobs
+from ..utils.dicom_encoding import transfer_syntax, encode_frame, deflate, save_dicom
+
+
+def new_series_uid():
+    '''
+    Returns a new random Series Instance UID, so the series created in the same second (or in parallel processes) never share it.
+    '''
+    return generate_uid()
+
+
+def derived_uid(series_uid, name):
+    '''
+    Returns a UID derived from the series UID (for example the Study Instance UID), the same series UID always gives the same UIDs.
+    '''
+    return generate_uid(entropy_srcs=[series_uid, name])
+
+
+def instance_uid(series_uid, i):
+    '''
+    Returns the SOP Instance UID of the slice `i` of a series, derived from the series UID (it stays a valid UID whatever the length of the series UID).
+    '''
+    return derived_uid(series_uid, f'instance.{i + 1}')
+
+
+def ds_values(values):
+    # The decimal strings are limited to 16 characters
+    return [DSfloat(float(v), auto_format=True) for v in values]
+
+
+def encode_elements(elements):
+    '''
+    Encodes data elements as explicit VR little endian bytes.
+    '''
+    ds = Dataset()
+    for element in elements:
+        ds.add(element)
+    fp = DicomBytesIO()
+    fp.is_little_endian = True
+    fp.is_implicit_VR = False
+    write_dataset(fp, ds)
+    return fp.getvalue()
+
+
+def encode_element(tag, vr, value):
+    '''
+    Encodes one element as explicit VR little endian bytes, faster than pydicom for the few elements written for every slice.
+    The text values are padded to an even length (with a null byte for the UIs, a space otherwise).
+    '''
+    if isinstance(value, str):
+        value = value.encode('ascii')
+    if len(value) % 2:
+        value += b'\x00' if vr == 'UI' else b' '
+    if vr in ('OB', 'OW', 'UN', 'SQ', 'UT'):
+        return struct.pack('<HH2sHI', tag >> 16, tag & 0xFFFF, vr.encode(), 0, len(value)) + value
+    return struct.pack('<HH2sH', tag >> 16, tag & 0xFFFF, vr.encode(), len(value)) + value
+
+
+class DicomSeriesWriter:
+    '''
+    The class DicomSeriesWriter writes a SimpleITK image as a dicom series, it is the fast path of `NiftiToDicomConverter` and `NrrdToDicomConverter`.
+    The intensities are rescaled and cast once for the whole volume with NumPy, and the tags shared by the series are built and encoded once in a template.
+    For each slice, only the slice specific elements (position, instance number, UIDs and pixel data) are encoded and inserted between the template bytes.
+    The volume can also be written as a single Enhanced CT or Enhanced MR multi-frame instance with `write_multiframe`.\n
+
+    Params:
+    - image: the SimpleITK image to write.
+    - series_description: the Series Description of the output series.
+    - series_uid: the Series Instance UID, by default a new random UID. All the other UIDs (study, frame of reference, instances) are derived from it, so the output does not depend on the order in which the slices are written.
+    - encoding: the lossless encoding of the pixel data ('rle', 'deflate', or 'jpeg-ls', 'jpeg2000', 'jpeg-lossless' when an encoder is installed), by default the pixel data is not compressed.\n
+
+    ### Example of usage:
+    ```Python
+    import SimpleITK as sitk
+    from pycad.converters import DicomSeriesWriter
+
+    writer = DicomSeriesWriter(sitk.ReadImage('path/to/volume.nii.gz'))
+    writer.write('path/to/dicom/folder', workers=4)
+
+    # or one multi-frame file for the whole volume
+    writer.write_multiframe('path/to/dicom/folder/volume.dcm', modality='CT')
+    ```
+    '''
+
+    # The elements that change from one slice to the other, in the order of their tags
+    SLICE_TAGS = (0x00080018,  # SOP Instance UID
+                  0x00200013,  # Instance Number
+                  0x00200032,  # Image Position (Patient)
+                  0x7FE00010)  # Pixel Data
+    META_SLICE_TAGS = (0x00020003,)  # Media Storage SOP Instance UID
+    ENHANCED_SOP_CLASSES = {'CT': EnhancedCTImageStorage, 'MR': EnhancedMRImageStorage}
+
+    def __init__(self, image, series_description='Created-Pycad', series_uid=None, encoding=None):
+        self.image = image
+        self.series_description = series_description
+        self.encoding = encoding
+        self.transfer_syntax = transfer_syntax(encoding)
+        self.modification_time = time.strftime("%H%M%S")
+        self.modification_date = time.strftime("%Y%m%d")
+        self.series_uid = series_uid or new_series_uid()
+        self.pixels = self.rescale_volume(sitk.GetArrayFromImage(image))
+        self.chunks = self.split_template(self.build_template(), self.SLICE_TAGS)
+        self.meta_chunks = self.split_template(self.build_file_meta(), self.META_SLICE_TAGS)
+
+    @staticmethod
+    def rescale_volume(array):
+        '''
+        Rescales each slice from [min, max] to [int(min), int(max)] and casts to int16, like the slice by slice path does, but for the whole volume at once.
+        The integer volumes are not changed by the rescale, so they are only cast.
+        '''
+        if np.issubdtype(array.dtype, np.integer):
+            return array.astype(np.int16, copy=False)
+
+        dtype = array.dtype
+        array = array.astype(np.float64, copy=False)
+        minimum = array.min(axis=(1, 2), keepdims=True)
+        maximum = array.max(axis=(1, 2), keepdims=True)
+        out_minimum = np.trunc(minimum)
+        out_maximum = np.trunc(maximum)
+
+        value_range = maximum - minimum
+        scale = np.divide(out_maximum - out_minimum, value_range, out=np.zeros_like(value_range), where=value_range != 0)
+        # Same arithmetic as the ITK linear intensity transform, which clamps to the output range
+        rescaled = array * scale + (out_minimum - minimum * scale)
+        np.clip(rescaled, out_minimum, out_maximum, out=rescaled)
+        # The rescaled slice keeps the input pixel type before the cast, as in the slice by slice path
+        return rescaled.astype(dtype).astype(np.int16)
+
+    def build_template(self):
+        '''
+        Builds the dataset holding all the tags shared by the slices of the series.
+        '''
+        image = self.image
+        direction = image.GetDirection()
+        spacing = image.GetSpacing()
+
+        ds = Dataset()
+        ds.ImageType = ['DERIVED', 'SECONDARY']
+        ds.InstanceCreationDate = self.modification_date
+        ds.InstanceCreationTime = self.modification_time
+        ds.SOPClassUID = CTImageStorage
+        ds.StudyDate = self.modification_date
+        ds.SeriesDate = self.modification_date
+        ds.StudyTime = self.modification_time
+        ds.SeriesTime = self.modification_time
+        ds.AccessionNumber = ''
+        ds.Modality = 'CT'  # set the type to CT so the thickness is carried over
+        ds.ReferringPhysicianName = ''
+        ds.SeriesDescription = self.series_description
+        ds.PatientName = ''
+        ds.PatientID = ''
+        ds.PatientBirthDate = ''
+        ds.PatientSex = ''
+        ds.SliceThickness = ds_values(spacing[2:])[0]
+        ds.StudyInstanceUID = derived_uid(self.series_uid, 'study')
+        ds.SeriesInstanceUID = self.series_uid
+        ds.StudyID = ''
+        ds.FrameOfReferenceUID = derived_uid(self.series_uid, 'frame')
+        ds.ImageOrientationPatient = ds_values((direction[0], direction[3], direction[6], direction[1], direction[4], direction[7]))
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.Rows = self.pixels.shape[1]
+        ds.Columns = self.pixels.shape[2]
+        ds.PixelSpacing = ds_values((spacing[1], spacing[0]))
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 1
+        ds.RescaleIntercept = 0
+        ds.RescaleSlope = 1
+        ds.RescaleType = 'US'
+        return ds
+
+    def build_file_meta(self):
+        '''
+        Builds the file meta information shared by the slices, without the group length which depends on the slice.
+        '''
+        ds = Dataset()
+        ds.FileMetaInformationVersion = b'\x00\x01'
+        ds.MediaStorageSOPClassUID = CTImageStorage
+        ds.TransferSyntaxUID = self.transfer_syntax
+        ds.ImplementationClassUID = PYDICOM_IMPLEMENTATION_UID
+        return ds
+
+    def encode_pixels(self, i):
+        '''
+        Returns the encoded pixel data element of the slice `i`, the compressed frames are encapsulated (undefined length).
+        '''
+        if self.encoding in (None, 'deflate'):
+            return encode_element(0x7FE00010, 'OW', self.pixels[i].tobytes())
+        header = struct.pack('<HH2sHI', 0x7FE0, 0x0010, b'OB', 0, 0xFFFFFFFF)
+        delimiter = struct.pack('<HHI', 0xFFFE, 0xE0DD, 0)  # sequence delimitation item
+        return header + encode_frame(self.pixels[i], self.encoding) + delimiter
+
+    @staticmethod
+    def split_template(template, slice_tags):
+        '''
+        Encodes the template once, as the byte chunks found before, between and after the slice specific tags.
+        '''
+        chunks, start = [], -1
+        for bound in list(slice_tags) + [0xFFFFFFFF]:
+            chunks.append(encode_elements(element for element in template if start < element.tag < bound))
+            start = bound
+        return chunks
+
+    @staticmethod
+    def join(chunks, elements):
+        '''
+        Inserts the encoded slice elements between the chunks of the template.
+        '''
+        parts = [chunks[0]]
+        for element, chunk in zip(elements, chunks[1:]):
+            parts.append(element)
+            parts.append(chunk)
+        return b''.join(parts)
+
+    def slice_uid(self, i):
+        return instance_uid(self.series_uid, i)
+
+    def encode_slice(self, i):
+        '''
+        Returns the content of the dicom file of the slice `i`.
+        '''
+        sop_instance_uid = self.slice_uid(i)
+        # (0020, 0032) image position patient determines the 3D spacing between slices.
+        position = ds_values(self.image.TransformIndexToPhysicalPoint((0, 0, i)))
+        elements = [encode_element(0x00080018, 'UI', sop_instance_uid),
+                    encode_element(0x00200013, 'IS', str(i)),
+                    encode_element(0x00200032, 'DS', '\\'.join(str(v) for v in position)),
+                    self.encode_pixels(i)]
+
+        meta = self.join(self.meta_chunks, [encode_element(0x00020003, 'UI', sop_instance_uid)])
+        group_length = encode_element(0x00020000, 'UL', struct.pack('<I', len(meta)))
+        body = self.join(self.chunks, elements)
+        if self.encoding == 'deflate':
+            body = deflate(body)
+        return b'\x00' * 128 + b'DICM' + group_length + meta + body
+
+    def write_slice(self, i, out_dir):
+        path = os.path.join(out_dir, 'slice' + str(i).zfill(4) + '.dcm')
+        with open(path, 'wb') as f:
+            f.write(self.encode_slice(i))
+        return path
+
+    def write(self, out_dir, workers=None, progress=None):
+        '''
+        Writes all the slices of the series in `out_dir` and returns their paths.\n
+        - `workers`: the number of threads writing the slices, `None` or `1` writes them one after the other
+        - `progress`: an optional callable called as `progress(done, total)` every time a slice is written
+        '''
+        os.makedirs(out_dir, exist_ok=True)
+        jobs = [(i, out_dir) for i in range(len(self.pixels))]
+        return run_jobs(self.write_slice, jobs, workers=workers, use_processes=False, progress=progress)
+
+    def build_multiframe(self, modality='CT'):
+        '''
+        Builds an Enhanced CT or Enhanced MR multi-frame dataset holding the whole volume.
+        The geometry shared by the frames (pixel spacing, orientation, rescale) is in the shared functional groups and the position of each frame is in its per-frame functional groups.
+        '''
+        if modality not in self.ENHANCED_SOP_CLASSES:
+            raise ValueError(f'The modality {modality} is not supported, choose one of {sorted(self.ENHANCED_SOP_CLASSES)}.')
+
+        image = self.image
+        spacing = image.GetSpacing()
+        ds = self.build_template()
+        frame_type = ['DERIVED', 'SECONDARY', 'VOLUME', 'NONE']
+
+        # These attributes are moved to the functional groups in the enhanced objects
+        for keyword in ['SliceThickness', 'ImageOrientationPatient', 'PixelSpacing', 'RescaleIntercept', 'RescaleSlope', 'RescaleType']:
+            delattr(ds, keyword)
+
+        sop_instance_uid = derived_uid(self.series_uid, 'multiframe')
+        ds.SOPClassUID = self.ENHANCED_SOP_CLASSES[modality]
+        ds.SOPInstanceUID = sop_instance_uid
+        ds.Modality = modality
+        ds.ImageType = frame_type
+        ds.ContentDate = self.modification_date
+        ds.ContentTime = self.modification_time
+        ds.AcquisitionDateTime = self.modification_date + self.modification_time
+        ds.InstanceNumber = 1
+        ds.AcquisitionNumber = 1
+        ds.PixelPresentation = 'MONOCHROME'
+        ds.VolumetricProperties = 'VOLUME'
+        ds.VolumeBasedCalculationTechnique = 'NONE'
+        ds.ContentQualification = 'RESEARCH'
+        ds.BurnedInAnnotation = 'NO'
+        ds.LossyImageCompression = '00'
+        ds.PresentationLUTShape = 'IDENTITY'
+        if modality == 'MR':
+            ds.ComplexImageComponent = 'MAGNITUDE'
+            ds.AcquisitionContrast = 'UNKNOWN'
+        ds.NumberOfFrames = len(self.pixels)
+
+        # The frames are indexed by their position
+        dimension_uid = derived_uid(self.series_uid, 'dimension')
+        organization = Dataset()
+        organization.DimensionOrganizationUID = dimension_uid
+        ds.DimensionOrganizationSequence = [organization]
+        dimension = Dataset()
+        dimension.DimensionOrganizationUID = dimension_uid
+        dimension.DimensionIndexPointer = 0x00200032  # Image Position (Patient)
+        dimension.FunctionalGroupPointer = 0x00209113  # Plane Position Sequence
+        ds.DimensionIndexSequence = [dimension]
+
+        shared = Dataset()
+        pixel_measures = Dataset()
+        pixel_measures.PixelSpacing = ds_values((spacing[1], spacing[0]))
+        pixel_measures.SliceThickness = ds_values(spacing[2:])[0]
+        pixel_measures.SpacingBetweenSlices = ds_values(spacing[2:])[0]
+        shared.PixelMeasuresSequence = [pixel_measures]
+        orientation = Dataset()
+        direction = image.GetDirection()
+        orientation.ImageOrientationPatient = ds_values((direction[0], direction[3], direction[6], direction[1], direction[4], direction[7]))
+        shared.PlaneOrientationSequence = [orientation]
+        transformation = Dataset()
+        transformation.RescaleIntercept = 0
+        transformation.RescaleSlope = 1
+        transformation.RescaleType = 'US'
+        shared.PixelValueTransformationSequence = [transformation]
+        frame_type_item = Dataset()
+        frame_type_item.FrameType = frame_type
+        frame_type_item.PixelPresentation = 'MONOCHROME'
+        frame_type_item.VolumetricProperties = 'VOLUME'
+        frame_type_item.VolumeBasedCalculationTechnique = 'NONE'
+        if modality == 'MR':
+            frame_type_item.ComplexImageComponent = 'MAGNITUDE'
+            frame_type_item.AcquisitionContrast = 'UNKNOWN'
+            shared.MRImageFrameTypeSequence = [frame_type_item]
+        else:
+            shared.CTImageFrameTypeSequence = [frame_type_item]
+        ds.SharedFunctionalGroupsSequence = [shared]
+
+        per_frame = []
+        for i in range(len(self.pixels)):
+            frame = Dataset()
+            content = Dataset()
+            content.DimensionIndexValues = [i + 1]
+            content.StackID = '1'
+            content.InStackPositionNumber = i + 1
+            frame.FrameContentSequence = [content]
+            position = Dataset()
+            position.ImagePositionPatient = ds_values(image.TransformIndexToPhysicalPoint((0, 0, i)))
+            frame.PlanePositionSequence = [position]
+            per_frame.append(frame)
+        ds.PerFrameFunctionalGroupsSequence = per_frame
+
+        ds.PixelData = self.pixels.tobytes()
+
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+        ds.file_meta.MediaStorageSOPInstanceUID = sop_instance_uid
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.file_meta.ImplementationClassUID = PYDICOM_IMPLEMENTATION_UID
+        ds.is_little_endian = True
+        ds.is_implicit_VR = False
+        return ds
+
+    def write_multiframe(self, path, modality='CT'):
+        '''
+        Writes the whole volume as one Enhanced CT (or Enhanced MR) multi-frame file and returns its path.
+        '''
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return save_dicom(self.build_multiframe(modality), path, encoding=self.encoding)
@@ -5,7 +5,13 @@
 
 import SimpleITK as sitk
 import os
+import time
 import logging
+from ..utils.parallel import run_jobs
+from .dicom_index import DicomIndex, DicomSeries
+from .conversion_catalog import ConversionCatalog
+from .nifti_stream_writer import StreamingNiftiWriter
+from ..utils.nifti_writer import write_nifti
 
 class DicomToNiftiConverter:
 
@@ -13,7 +19,9 @@ class DicomToNiftiConverter:
     The class DicomToNiftiConverter is used to convert dicom series into nifti file, it can be used for one patient (one folder of dicom series) or multiple patient (multiple folders of dicom series).\n
 
     Params:
-    - min_images_per_series: the minimum number of dicom series to validate the conversion, so if for example the folder or subfolder contains only one or two dicoms, then there is no need to validate the conversion because we can't convert one dicom to a nifti file.\n
+    - min_images_per_series: the minimum number of dicom series to validate the conversion, so if for example the folder or subfolder contains only one or two dicoms, then there is no need to validate the conversion because we can't convert one dicom to a nifti file.
+    - compress_level: the gzip compression level of the `.nii.gz` outputs, which are compressed by blocks on multiple threads. With 0, the outputs are written as uncompressed `.nii` files (the fastest, for scratch outputs).
+    - threads: the number of threads compressing the outputs, by default the number of CPUs.\n
 
     ## Example of usage:
     ```Python
@@ -23,13 +31,19 @@ class DicomToNiftiConverter:
     output_dir = "path/to/output/folder"
     converter = DicomToNiftiConverter(min_images_per_series=10)  # Set the minimum number of images per series.
     converter.convert(input_dir, output_dir)
+
+    # The series can also be converted in parallel, one process per series
+    results = converter.convert(input_dir, output_dir, workers=8)
     ```
 
 
     """
 
-    def __init__(self, min_images_per_series=5):
+    def __init__(self, min_images_per_series=5, compress_level=6, threads=None):
         self.min_images_per_series = min_images_per_series  # Minimum number of DICOM images to consider a directory a valid series.
+        self.compress_level = compress_level
+        self.threads = threads
+        self.extension = '.nii.gz' if compress_level else '.nii'
         # Initialize the logger
         self.logger = logging.getLogger('DicomToNiftiConverter')
         self.logger.setLevel(logging.INFO)
@@ -50,40 +64,100 @@ class DicomToNiftiConverter:
                 series_paths.append((subdir, dicom_files))
         return series_paths
 
-    def convert_series_to_nifti(self, dicom_series, output_path, output_filename=None):
+    def convert_series_to_nifti(self, dicom_series, output_path, output_filename=None, streaming=False):
         """
         Converts a DICOM series to a NIFTI file, naming the output based on the parent directory of the DICOM series.
+        With `streaming`, the series is written slice by slice with the `StreamingNiftiWriter` instead of being loaded in memory as one image.
+        Returns a dict with the series directory, the output path, the conversion time in seconds, the number of bytes written and the error (None if the conversion succeeded).
         """
+        start = time.perf_counter()
+        is_indexed = isinstance(dicom_series, DicomSeries)
+        result = {'series': dicom_series[0], 'series_uid': dicom_series.series_uid if is_indexed else None,
+                  'output': None, 'seconds': 0.0, 'bytes': 0, 'error': None, 'skipped': False}
         try:
             reader = sitk.ImageSeriesReader()
-            dicom_names = reader.GetGDCMSeriesFileNames(dicom_series[0])
-            reader.SetFileNames(dicom_names)
-            image = reader.Execute()
+            if is_indexed:
+                # The files found by the DicomIndex are already grouped by series and sorted, no need to parse them again.
+                dicom_names = dicom_series.files
+            else:
+                dicom_names = reader.GetGDCMSeriesFileNames(dicom_series[0])
 
             # Use the directory name of the DICOM series as the file name for the NIfTI image.
             if output_filename:
                 output_filename = os.path.join(output_path, output_filename)
+            elif is_indexed:
+                output_filename = os.path.join(output_path, dicom_series.name+self.extension)
             else:
                 dir_name = os.path.basename(os.path.normpath(dicom_series[0]))    
-                output_filename = os.path.join(output_path, dir_name+'.nii.gz')
-                
-            sitk.WriteImage(image, output_filename)
+                output_filename = os.path.join(output_path, dir_name+self.extension)
+
+            if streaming:
+                StreamingNiftiWriter(compress_level=self.compress_level, threads=self.threads).write(dicom_names, output_filename)
+            else:
+                reader.SetFileNames(dicom_names)
+                image = reader.Execute()
+                write_nifti(image, output_filename, compress_level=self.compress_level, threads=self.threads)
+            result['output'] = output_filename
+            result['bytes'] = os.path.getsize(output_filename)
             self.logger.info(f'Converted: {output_filename}')
         except Exception as e:
+            result['error'] = str(e)
             self.logger.error(f'Failed conversion for series {dicom_series[0]}: {e}')
 
-    def convert(self, input_dir, output_dir, output_filename=None):
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    def find_dicom_series_indexed(self, root_dir, workers=None):
+        """
+        Finds the DICOM series of the given directory with a `DicomIndex`, reading only the headers of the files.
+        The series are grouped by SeriesInstanceUID (so mixed-series folders are fully converted) and their files are sorted by position.
+        """
+        return DicomIndex(root_dir, workers=workers).get_series(min_images=self.min_images_per_series)
+
+    def convert(self, input_dir, output_dir, output_filename=None, workers=None, executor=None, use_index=False,
+                incremental=False, catalog_path=None, streaming=False):
         """
         Converts all valid DICOM series found in the input directory to NIFTI files in the output directory,
         using the directory names as file names.
+
+        - `workers`: the number of processes used to convert the series in parallel, by default (None) the series are converted one after the other
+        - `executor`: an existing `concurrent.futures` executor to run the conversions on, instead of creating a process pool from `workers`
+        - `use_index`: find the series with a header-only `DicomIndex` instead of the folders containing `.dcm` files, the headers are read by `workers` threads
+        - `incremental`: convert only the new or changed series, the converted series are remembered in a `ConversionCatalog`
+        - `catalog_path`: the path to the SQLite catalog used by the incremental mode, by default it is saved in the output directory
+        - `streaming`: write each series slice by slice (bounded memory) instead of loading it as one image, this is useful for the very large series (whole-body CT, 4D perfusion)
+
+        Returns the list of the per series results (see `convert_series_to_nifti`), in the same order as the serial mode.
+        In the incremental mode, the results of the skipped series have `skipped` set to True.
         """
-        series_paths = self.find_dicom_series(input_dir)
+        if use_index:
+            series_paths = self.find_dicom_series_indexed(input_dir, workers=workers)
+        else:
+            series_paths = self.find_dicom_series(input_dir)
         if not series_paths:
             self.logger.warning('No valid DICOM series found.')
-            return
+            return []
 
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        for series in series_paths:
-            self.convert_series_to_nifti(series, output_dir, output_filename)
\ No newline at end of file
+        if not incremental:
+            jobs = [(series, output_dir, output_filename, streaming) for series in series_paths]
+            return run_jobs(self.convert_series_to_nifti, jobs, workers=workers, executor=executor)
+
+        catalog = ConversionCatalog(catalog_path or os.path.join(output_dir, ConversionCatalog.DEFAULT_NAME))
+        try:
+            target = catalog.conversion_target(output_dir, self.extension, output_filename)
+            pending, results = catalog.split_series(series_paths, target)
+            self.logger.info(f'{len(results) - len(pending)} series up to date, {len(pending)} series to convert.')
+
+            jobs = [(series, output_dir, output_filename, streaming) for _, series, _, _ in pending]
+            converted = run_jobs(self.convert_series_to_nifti, jobs, workers=workers, executor=executor)
+            for (i, _, key, fingerprint), result in zip(pending, converted):
+                results[i] = result
+                if result['error'] is None:
+                    catalog.record(key, fingerprint, result['output'])
+        finally:
+            catalog.close()
+
+        return results
@@ -0,0 +1,257 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import os
+import time
+import numpy as np
+import SimpleITK as sitk
+from ..utils.nifti_writer import write_nifti
+
+
+class Volume:
+    '''
+    The in-memory volume shared by all the readers and writers of the conversion engine.\n
+
+    Params:
+    - array: the pixel array in the SimpleITK order (slices, rows, columns), with the components last for the multi-component images.
+    - spacing, origin, direction: the geometry in the SimpleITK convention (x, y, z order, LPS physical space), by default the identity geometry of the dimension of the array (2D, 3D or 4D).
+    - name: the name of the case, used to name the outputs that are directories (png, dicom).
+    - is_vector: the last axis of the array is the components of the pixels (RGB, vector fields).
+    - metadata: the header metadata of the input (the SimpleITK metadata dictionary), it is written back in the outputs that support it.
+    '''
+
+    def __init__(self, array, spacing=None, origin=None, direction=None, name='volume', is_vector=False, metadata=None):
+        self.array = array
+        self.is_vector = is_vector
+        dimension = array.ndim - 1 if is_vector else array.ndim
+        self.spacing = tuple(spacing) if spacing is not None else (1.0,) * dimension
+        self.origin = tuple(origin) if origin is not None else (0.0,) * dimension
+        self.direction = tuple(direction) if direction is not None else tuple(np.eye(dimension).ravel())
+        self.name = name
+        self.metadata = dict(metadata or {})
+
+    @property
+    def dimension(self):
+        return len(self.spacing)
+
+    @classmethod
+    def from_sitk(cls, image, name='volume'):
+        metadata = {key: image.GetMetaData(key) for key in image.GetMetaDataKeys()}
+        return cls(sitk.GetArrayFromImage(image), image.GetSpacing(), image.GetOrigin(), image.GetDirection(), name,
+                   is_vector=image.GetNumberOfComponentsPerPixel() > 1, metadata=metadata)
+
+    def to_sitk(self):
+        image = sitk.GetImageFromArray(self.array, isVector=self.is_vector)
+        image.SetSpacing(self.spacing)
+        image.SetOrigin(self.origin)
+        image.SetDirection(self.direction)
+        for key, value in self.metadata.items():
+            image.SetMetaData(key, value)
+        return image
+
+    def index_to_physical(self):
+        """
+        Returns the 4x4 matrix mapping the (x, y, z) indices to the LPS physical coordinates, for the 3D volumes.
+        """
+        if self.dimension != 3:
+            raise ValueError(f'The volume has {self.dimension} dimensions, a 3D volume is expected.')
+        matrix = np.eye(4)
+        matrix[:3, :3] = np.asarray(self.direction, dtype=float).reshape(3, 3) * np.asarray(self.spacing)
+        matrix[:3, 3] = self.origin
+        return matrix
+
+
+READERS = {}
+WRITERS = {}
+EXTENSIONS = {}
+
+
+def register_reader(fmt, func, extensions=()):
+    '''
+    Registers a reader for a format: `func(src, **options)` returns a `Volume`. The extensions are used to guess the format of the paths.
+    '''
+    READERS[fmt] = func
+    for extension in extensions:
+        EXTENSIONS[extension] = fmt
+
+
+def register_writer(fmt, func, extensions=()):
+    '''
+    Registers a writer for a format: `func(volume, dst, **options)` writes the volume and returns the path to the output.
+    '''
+    WRITERS[fmt] = func
+    for extension in extensions:
+        EXTENSIONS[extension] = fmt
+
+
+def guess_format(path):
+    '''
+    Guesses the format of a path from its extension, the directories are considered as dicom series.
+    '''
+    lower = str(path).lower()
+    for extension in sorted(EXTENSIONS, key=len, reverse=True):
+        if lower.endswith(extension):
+            return EXTENSIONS[extension]
+    if os.path.isdir(path) or not os.path.splitext(lower)[1]:
+        return 'dicom'
+    raise ValueError(f'Cannot guess the format of {path}, please give it explicitly.')
+
+
+def case_name(path):
+    return os.path.basename(os.path.normpath(str(path))).split('.')[0]
+
+
+def read_image(src, **options):
+    return Volume.from_sitk(sitk.ReadImage(src), name=case_name(src))
+
+
+def read_dicom(src, **options):
+    reader = sitk.ImageSeriesReader()
+    if isinstance(src, (list, tuple)):
+        files = list(src)
+        name = case_name(os.path.dirname(files[0]))
+    else:
+        files = reader.GetGDCMSeriesFileNames(src)
+        name = case_name(src)
+    reader.SetFileNames(files)
+    return Volume.from_sitk(reader.Execute(), name=name)
+
+
+def write_nifti_volume(volume, dst, compress_level=6, threads=None, **options):
+    return write_nifti(volume.to_sitk(), dst, compress_level=compress_level, threads=threads)
+
+
+def write_nrrd_volume(volume, dst, **options):
+    sitk.WriteImage(volume.to_sitk(), dst, useCompression=options.get('compress', False))
+    return dst
+
+
+def write_dicom_volume(volume, dst, fast=False, workers=None, series_uid=None, multiframe=False, modality='CT', encoding=None, **options):
+    from .nifti_to_dicom import NiftiToDicomConverter
+    NiftiToDicomConverter().image2dicom(volume.to_sitk(), dst, fast=fast, workers=workers, series_uid=series_uid,
+                                        multiframe=multiframe, modality=modality, encoding=encoding)
+    return dst
+
+
+def write_png_volume(volume, dst, data_type='vol', max_v=None, min_v=None, mode='rgb', workers=None, compress_level=6, **options):
+    from .nifti_to_png import NiftiToPngConverter
+    converter = NiftiToPngConverter(max_v=max_v, min_v=min_v, mode=mode, workers=workers, compress_level=compress_level)
+    # prepare_volume clips the array in place, the volume belongs to the caller so it gets a copy
+    converter.write_png_slices(volume.array.copy(), dst, volume.name, data_type)
+    return dst
+
+
+def write_stl_volume(volume, dst, smoothing_iterations=0, **options):
+    '''
+    Writes the surface of the foreground (all the non zero voxels) as a binary STL file, in the LPS physical space of the volume.
+    '''
+    import vtk
+    from vtk.util.numpy_support import numpy_to_vtk
+
+    mask = np.ascontiguousarray(volume.array > 0, dtype=np.uint8)
+    image_data = vtk.vtkImageData()
+    image_data.SetDimensions(mask.shape[2], mask.shape[1], mask.shape[0])
+    image_data.GetPointData().SetScalars(numpy_to_vtk(mask.ravel(), deep=True))
+
+    surface = vtk.vtkFlyingEdges3D()
+    surface.SetInputData(image_data)
+    surface.SetValue(0, 0.5)
+    output = surface.GetOutputPort()
+
+    if smoothing_iterations:
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetInputConnection(output)
+        smoother.SetNumberOfIterations(smoothing_iterations)
+        smoother.SetPassBand(0.05)
+        smoother.NonManifoldSmoothingOn()
+        smoother.NormalizeCoordinatesOn()
+        output = smoother.GetOutputPort()
+
+    # From the voxel indices to the physical space
+    transform = vtk.vtkTransform()
+    transform.SetMatrix(volume.index_to_physical().ravel())
+    transform_filter = vtk.vtkTransformPolyDataFilter()
+    transform_filter.SetInputConnection(output)
+    transform_filter.SetTransform(transform)
+
+    if not dst.lower().endswith('.stl'):
+        os.makedirs(dst, exist_ok=True)
+        dst = os.path.join(dst, f'{volume.name}.stl')
+    writer = vtk.vtkSTLWriter()
+    writer.SetInputConnection(transform_filter.GetOutputPort())
+    writer.SetFileTypeToBinary()
+    writer.SetFileName(dst)
+    writer.Write()
+    return dst
+
+
+register_reader('nifti', read_image, ('.nii', '.nii.gz'))
+register_reader('nrrd', read_image, ('.nrrd', '.nhdr'))
+register_reader('dicom', read_dicom, ('.dcm',))
+register_writer('nifti', write_nifti_volume)
+register_writer('nrrd', write_nrrd_volume)
+register_writer('dicom', write_dicom_volume)
+register_writer('png', write_png_volume)
+register_writer('stl', write_stl_volume, ('.stl',))
+
+
+def read_volume(src, fmt=None, **options):
+    '''
+    Reads any supported input (a file, a dicom directory or a list of dicom files) into a `Volume`.
+    '''
+    if isinstance(src, Volume):
+        return src
+    if isinstance(src, (list, tuple)):
+        fmt = fmt or 'dicom'
+    fmt = fmt or guess_format(src)
+    if fmt not in READERS:
+        raise ValueError(f'No reader registered for the format {fmt}, available formats: {sorted(READERS)}')
+    return READERS[fmt](src, **options)
+
+
+def write_volume(volume, dst, to=None, **options):
+    '''
+    Writes a `Volume` in any supported format, the format is guessed from `dst` when `to` is not given.
+    '''
+    to = to or guess_format(dst)
+    if to not in WRITERS:
+        raise ValueError(f'No writer registered for the format {to}, available formats: {sorted(WRITERS)}')
+
+    parent = os.path.dirname(os.path.normpath(dst))
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    return WRITERS[to](volume, dst, **options)
+
+
+def convert(src, dst, to=None, src_format=None, **options):
+    '''
+    This function converts any supported input into any supported output directly, the volume is kept in memory between the reading and the writing (no intermediate files).\n
+    - `src`: the input, it can be a file (.nii, .nii.gz, .nrrd), a dicom directory, a list of dicom files or a `Volume`
+    - `dst`: the output file or directory
+    - `to`: the output format ('nifti', 'nrrd', 'dicom', 'png', 'stl' or any registered format), by default it is guessed from `dst`
+    - `src_format`: the input format, by default it is guessed from `src`
+    - `options`: the options of the writer (for example `compress_level` for nifti, `data_type`, `max_v` and `min_v` for png)
+
+    Returns a report with the output path and the timings of each stage in seconds.
+
+    ### Example of usage:
+    ```Python
+    from pycad.converters import convert
+
+    report = convert('path/to/dicom/series', 'path/to/png/folder', to='png', max_v=200, min_v=-200)
+    print(report['timings'])
+    ```
+    '''
+    timings = {}
+
+    start = time.perf_counter()
+    volume = read_volume(src, fmt=src_format)
+    timings['read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output = write_volume(volume, dst, to=to, **options)
+    timings['write'] = time.perf_counter() - start
+
+    return {'src': src if not isinstance(src, Volume) else volume.name, 'dst': output, 'to': to or guess_format(dst), 'timings': timings}
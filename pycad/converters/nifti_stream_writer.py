@@ -0,0 +1,177 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+from collections import defaultdict
+import numpy as np
+import nibabel as nib
+from pydicom import dcmread
+from ..utils.nifti_writer import BlockGzipWriter
+
+
+class StreamingNiftiWriter:
+    '''
+    The class StreamingNiftiWriter writes a DICOM series into a NIfTI file without loading the whole volume in memory.
+    The NIfTI header is computed from the geometry of the first and last slices, then the slices are decoded in order by small slabs and written directly in the file, so the peak memory is a few slices instead of the full volume.
+    The series with multiple instances at the same position (4D series, like perfusion) are written as 4D NIfTI files.\n
+
+    Params:
+    - slab_size: the number of slices decoded and written at once.
+    - compress_level: the gzip compression level used for the `.nii.gz` outputs (the `.nii` outputs are not compressed).
+    - threads: the number of threads compressing the `.nii.gz` outputs, by default the number of CPUs.
+    - force: the `force` flag of `pydicom.dcmread`.\n
+
+    ### Example of usage:
+    ```Python
+    from pycad.converters import StreamingNiftiWriter, DicomIndex
+
+    writer = StreamingNiftiWriter(slab_size=8)
+    for series in DicomIndex('path/to/dicoms').get_series(min_images=5):
+        writer.write(series.files, f'path/to/output/{series.name}.nii.gz')
+    ```
+    '''
+
+    HEADER_TAGS = ['Rows', 'Columns', 'PixelSpacing', 'SliceThickness', 'ImagePositionPatient', 'ImageOrientationPatient',
+                   'RescaleSlope', 'RescaleIntercept', 'BitsAllocated', 'BitsStored', 'PixelRepresentation',
+                   'SamplesPerPixel', 'NumberOfFrames', 'TemporalPositionIdentifier', 'AcquisitionNumber', 'InstanceNumber']
+    VOX_OFFSET = 352
+
+    def __init__(self, slab_size=8, compress_level=6, threads=None, force=False):
+        self.slab_size = slab_size
+        self.compress_level = compress_level
+        self.threads = threads
+        self.force = force
+
+    def read_headers(self, files):
+        return [dcmread(f, stop_before_pixels=True, specific_tags=self.HEADER_TAGS, force=self.force) for f in files]
+
+    def order_files(self, files, headers):
+        """
+        Groups the files by position (the input files are expected to be sorted by position, like the output of `DicomIndex`).
+        Returns the files as a list of volumes (one per time point), each volume being a list of slices ordered along the slice axis.
+        """
+        positions = defaultdict(list)
+        for f, ds in zip(files, headers):
+            position = tuple(np.round(np.asarray(ds.get('ImagePositionPatient', (0, 0, 0)), dtype=float), 3))
+            positions[position].append((f, ds))
+
+        # dict keeps the insertion order, so the positions are in the order of the input files
+        slices = list(positions.values())
+        n_times = len(slices[0])
+        if any(len(instances) != n_times for instances in slices):
+            raise ValueError('The series has a different number of instances per position, it cannot be written as a 3D or 4D volume.')
+
+        def time_key(instance):
+            ds = instance[1]
+            return (int(ds.get('TemporalPositionIdentifier') or 0), int(ds.get('AcquisitionNumber') or 0), int(ds.get('InstanceNumber') or 0))
+
+        slices = [sorted(instances, key=time_key) for instances in slices]
+        return [[instances[t] for instances in slices] for t in range(n_times)]
+
+    @staticmethod
+    def output_dtype(headers):
+        """
+        Chooses the output data type: an integer type when all the slices have an integer rescale, otherwise float32.
+        """
+        slopes = {float(ds.get('RescaleSlope', 1) or 1) for ds in headers}
+        intercepts = {float(ds.get('RescaleIntercept', 0) or 0) for ds in headers}
+        if slopes != {1.0} or any(not intercept.is_integer() for intercept in intercepts):
+            return np.dtype(np.float32)
+
+        ds = headers[0]
+        bits = int(ds.get('BitsStored') or ds.BitsAllocated)
+        if int(ds.get('PixelRepresentation', 0)) == 1:
+            low, high = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+        else:
+            low, high = 0, (1 << bits) - 1
+        low, high = low + min(intercepts), high + max(intercepts)
+        for dtype in (np.uint8, np.int16, np.uint16, np.int32):
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return np.dtype(dtype)
+        return np.dtype(np.float32)
+
+    @staticmethod
+    def compute_affine(first, last, n_slices):
+        """
+        Computes the NIfTI (RAS) affine of the volume from the headers of its first and last slices.
+        """
+        orientation = np.asarray(first.ImageOrientationPatient, dtype=float)
+        row_spacing, column_spacing = (float(v) for v in first.PixelSpacing)
+        origin = np.asarray(first.ImagePositionPatient, dtype=float)
+
+        affine = np.eye(4)
+        affine[:3, 0] = orientation[:3] * column_spacing
+        affine[:3, 1] = orientation[3:] * row_spacing
+        if n_slices > 1:
+            affine[:3, 2] = (np.asarray(last.ImagePositionPatient, dtype=float) - origin) / (n_slices - 1)
+        else:
+            affine[:3, 2] = np.cross(orientation[:3], orientation[3:]) * float(first.get('SliceThickness') or 1)
+        affine[:3, 3] = origin
+
+        # DICOM is in LPS and NIfTI in RAS
+        return np.diag([-1, -1, 1, 1]) @ affine
+
+    def make_header(self, volumes, dtype):
+        first, last = volumes[0][0][1], volumes[0][-1][1]
+        n_slices = len(volumes[0])
+        shape = (int(first.Columns), int(first.Rows), n_slices)
+        if len(volumes) > 1:
+            shape += (len(volumes),)
+
+        affine = self.compute_affine(first, last, n_slices)
+        header = nib.Nifti1Header()
+        header.set_data_shape(shape)
+        header.set_data_dtype(dtype)
+        header.set_sform(affine, code=1)
+        header.set_qform(affine, code=1)
+        header.set_xyzt_units('mm', 'sec')
+        header['vox_offset'] = self.VOX_OFFSET
+        return header
+
+    def open_output(self, output_path, total_size):
+        if output_path.endswith('.gz'):
+            return BlockGzipWriter(output_path, compress_level=self.compress_level, threads=self.threads)
+        f = open(output_path, 'wb')
+        f.truncate(total_size)  # pre-size the file, the slices are then written in place
+        return f
+
+    def write(self, files, output_path):
+        """
+        Writes the DICOM files of one series (sorted by position) into `output_path` (.nii or .nii.gz), slab by slab.
+        Returns the path to the written file.
+        """
+        headers = self.read_headers(files)
+        if any(int(ds.get('NumberOfFrames') or 1) > 1 for ds in headers):
+            raise ValueError('The multi-frame DICOM files are not supported by the streaming writer.')
+        if any(int(ds.get('SamplesPerPixel') or 1) > 1 for ds in headers):
+            raise ValueError('The color DICOM files are not supported by the streaming writer.')
+
+        volumes = self.order_files(files, headers)
+        dtype = self.output_dtype(headers)
+        header = self.make_header(volumes, dtype)
+        total_size = self.VOX_OFFSET + int(np.prod(header.get_data_shape())) * dtype.itemsize
+
+        with self.open_output(output_path, total_size) as f:
+            header.write_to(f)  # writes the header and the extension flag
+            f.write(b'\0' * (self.VOX_OFFSET - f.tell()))
+
+            instances = [instance for volume in volumes for instance in volume]
+            for start in range(0, len(instances), self.slab_size):
+                slab = [self.decode_slice(path, dtype) for path, _ in instances[start:start + self.slab_size]]
+                f.write(np.stack(slab).tobytes())
+
+        return output_path
+
+    def decode_slice(self, path, dtype):
+        """
+        Decodes one slice and applies its own rescale slope and intercept.
+        """
+        ds = dcmread(path, force=self.force)
+        pixels = ds.pixel_array
+        slope = float(ds.get('RescaleSlope', 1) or 1)
+        intercept = float(ds.get('RescaleIntercept', 0) or 0)
+        if dtype.kind == 'f':
+            return (pixels.astype(np.float32) * slope + intercept).astype(dtype, copy=False)
+        return (pixels.astype(np.int64) + int(intercept)).astype(dtype)
@@ -8,6 +8,8 @@ import os
 import time
 from glob import glob
 from tqdm import tqdm
+from ..utils.parallel import run_jobs
+from .dicom_series_writer import DicomSeriesWriter, new_series_uid, derived_uid, instance_uid
 
 
 class NiftiToDicomConverter:
@@ -60,24 +62,62 @@ class NiftiToDicomConverter:
 
         # (0020, 0032) image position patient determines the 3D spacing between slices.
         image_slice.SetMetaData("0020|0032", '\\'.join(map(str,new_img.TransformIndexToPhysicalPoint((0,0,i))))) # Image Position (Patient)
-        image_slice.SetMetaData("0020,0013", str(i)) # Instance Number
+        image_slice.SetMetaData("0020|0013", str(i)) # Instance Number
+        image_slice.SetMetaData("0008|0018", instance_uid(dict(series_tag_values)["0020|000e"], i)) # SOP Instance UID, derived from the series UID
 
         # Write to the output directory and add the extension dcm, to force writing in DICOM format.
         writer.SetFileName(os.path.join(out_dir,'slice' + str(i).zfill(4) + '.dcm'))
         writer.Execute(image_slice)
 
 
-    def nifti2dicom_1file(self, in_dir, out_dir):
+    def nifti2dicom_1file(self, in_dir, out_dir, fast=False, workers=None, progress=None, series_uid=None, multiframe=False, modality='CT', encoding=None):
         """
         This function is to convert only one nifti file into dicom series
 
         `nifti_dir`: the path to the one nifti file
         `out_dir`: the path to output
+        `fast`: if True, the slices are written by `DicomSeriesWriter` (volume-level rescale and one template dataset for the series)
+        `workers`: the number of threads writing the slices, by default the slices are written one after the other
+        `progress`: an optional callable called as `progress(done, total)` every time a slice is written
+        `series_uid`: the Series Instance UID, by default a new random UID
+        `multiframe`: if True, the volume is written as one Enhanced CT/MR multi-frame file (`volume.dcm`) instead of one file per slice, it cannot be used with `fast`, `workers` or `progress` (see `image2dicom`)
+        `modality`: the modality of the multi-frame file, 'CT' or 'MR'
+        `encoding`: the lossless encoding of the pixel data ('rle', 'deflate', or 'jpeg-ls', 'jpeg2000', 'jpeg-lossless' when an encoder is installed), by default the pixel data is not compressed
         """
 
+        new_img = sitk.ReadImage(in_dir)
+        self.image2dicom(new_img, out_dir, fast=fast, workers=workers, progress=progress, series_uid=series_uid, multiframe=multiframe, modality=modality, encoding=encoding)
+
+    def image2dicom(self, new_img, out_dir, fast=False, workers=None, progress=None, series_uid=None, multiframe=False, modality='CT', encoding=None):
+        """
+        This function writes a SimpleITK image (already loaded in memory) as a dicom series
+
+        `new_img`: the SimpleITK image
+        `out_dir`: the path to output
+        `fast`: if True, the slices are written by `DicomSeriesWriter` instead of one SimpleITK writer per slice
+        `workers`: the number of threads writing the slices, by default the slices are written one after the other
+        `progress`: an optional callable called as `progress(done, total)` every time a slice is written
+        `series_uid`: the Series Instance UID, by default a new random UID. The study and instance UIDs are derived from it.
+        `multiframe`: if True, the volume is written as one Enhanced CT/MR multi-frame file (`volume.dcm`) instead of one file per slice.
+        The multi-frame file is written at once, so `fast`, `workers` and `progress` cannot be used with it (a ValueError is raised).
+        `modality`: the modality of the multi-frame file, 'CT' or 'MR'
+        `encoding`: the lossless encoding of the pixel data, for example 'rle' (the encoded series are always written by `DicomSeriesWriter`)
+        """
+
+        if multiframe and (fast or workers or progress is not None):
+            raise ValueError('The options fast, workers and progress apply to the series written slice by slice, they cannot be used with multiframe=True.')
+
+        series_uid = series_uid or new_series_uid()
+        if multiframe:
+            writer = DicomSeriesWriter(new_img, series_uid=series_uid, encoding=encoding)
+            writer.write_multiframe(os.path.join(out_dir, 'volume.dcm'), modality=modality)
+            return
+        if fast or encoding:
+            DicomSeriesWriter(new_img, series_uid=series_uid, encoding=encoding).write(out_dir, workers=workers, progress=progress)
+            return
+
         os.makedirs(out_dir, exist_ok=True)
 
-        new_img = sitk.ReadImage(in_dir) 
         modification_time = time.strftime("%H%M%S")
         modification_date = time.strftime("%Y%m%d")
 
@@ -85,29 +125,45 @@ class NiftiToDicomConverter:
         series_tag_values = [("0008|0031",modification_time), # Series Time
                         ("0008|0021",modification_date), # Series Date
                         ("0008|0008","DERIVED\\SECONDARY"), # Image Type
-                        ("0020|000e", "1.2.826.0.1.3680043.2.1125."+modification_date+".1"+modification_time), # Series Instance UID
+                        ("0020|000e", series_uid), # Series Instance UID
+                        ("0020|000d", derived_uid(series_uid, 'study')), # Study Instance UID
                         ("0020|0037", '\\'.join(map(str, (direction[0], direction[3], direction[6],# Image Orientation (Patient)
                                                             direction[1],direction[4],direction[7])))),
                         ("0008|103e", "Created-Pycad")] # Series Description
 
 
         # Write slices to output directory
-        list(map(lambda i: self.writeSlices(series_tag_values, new_img, i, out_dir), range(new_img.GetDepth())))
+        jobs = [(series_tag_values, new_img, i, out_dir) for i in range(new_img.GetDepth())]
+        run_jobs(self.writeSlices, jobs, workers=workers, use_processes=False, progress=progress)
 
-    def nifti2dicom_mfiles(self, nifti_dir, out_dir=''):
+    def nifti2dicom_mfiles(self, nifti_dir, out_dir='', fast=False, workers=None, slice_workers=None, progress=None, multiframe=False, modality='CT', encoding=None):
         """
         This function is to convert multiple nifti files into dicom files
 
         `nifti_dir`: You enter the global path to all of the nifti files here.
         `out_dir`: Put the path to where you want to save all the dicoms here.
+        `fast`: if True, the slices are written by `DicomSeriesWriter` (see `nifti2dicom_1file`)
+        `workers`: the number of processes converting the nifti files in parallel, by default the files are converted one after the other
+        `slice_workers`: the number of threads writing the slices of each file (see `workers` in `nifti2dicom_1file`)
+        `progress`: an optional callable called as `progress(done, total)` every time a file is converted, by default a progress bar is shown
+        `multiframe`, `modality`: write each volume as one Enhanced CT/MR multi-frame file (see `nifti2dicom_1file`), `fast` and `slice_workers` cannot be used with it
+        `encoding`: the lossless encoding of the pixel data (see `nifti2dicom_1file`)
 
         PS: Each nifti file's folders will be created automatically, so you do not need to create an empty folder for each patient.
         """
 
-        images = glob(nifti_dir + '/*.nii.gz')
+        images = sorted(glob(nifti_dir + '/*.nii.gz'))
 
-        for image in tqdm(images):
+        jobs = []
+        for image in images:
             o_path = out_dir + '/' + os.path.basename(image)[:-7]
             os.makedirs(o_path, exist_ok=True)
-
-            self.nifti2dicom_1file(image, o_path)
+            jobs.append((image, o_path, fast, slice_workers, None, new_series_uid(), multiframe, modality, encoding))
+
+        bar = None
+        if progress is None:
+            bar = tqdm(total=len(jobs))
+            progress = lambda done, total: bar.update()
+        run_jobs(self.nifti2dicom_1file, jobs, workers=workers, progress=progress)
+        if bar is not None:
+            bar.close()
@@ -4,10 +4,17 @@
 
 
 from rt_utils import RTStructBuilder
+from rt_utils import ds_helper, image_helper
+from rt_utils.utils import ROIData
+from pydicom.dataset import Dataset
+from pydicom.sequence import Sequence
+from scipy import ndimage
 import logging
 from tqdm import tqdm
 import numpy as np
 import nibabel as nib
+from ..utils.parallel import run_jobs
+from ..utils.labels import load_labels
 
 class NiftiToDicomRT:
     def __init__(self, nifti_path, dicom_series_path, output_path, selected_classes):
@@ -28,19 +35,30 @@ class NiftiToDicomRT:
         # Configure logging
         logging.basicConfig(level=logging.WARNING)  # avoid messages from rt_utils
         
-        # Load and preprocess NIfTI data
+        # Load and preprocess NIfTI data, as integer labels (uint8, or uint16 for more than 255 labels)
         nifti_file = nib.load(self.nifti_path)
-        array = nifti_file.get_fdata()
+        array = load_labels(nifti_file)
         self.mask_array = np.transpose(array, (2, 1, 0))
         self.mask_array = np.rot90(self.mask_array, k=-1)
         
         print("Loaded mask shape: ", self.mask_array.shape)
 
-    def convert(self):
-        """Convert NIfTI mask to DICOM RTSTRUCT"""
+    def convert(self, fast=False, workers=None):
+        """
+        Convert NIfTI mask to DICOM RTSTRUCT
+
+        Args:
+            fast: If True, the bounding box of each class is found in one pass over the mask, and the contours are only extracted in the occupied slices of the box (see `add_rois`), instead of comparing the whole mask to each class
+            workers: The number of processes extracting the contours of the classes in parallel (fast mode), by default the classes are done one after the other
+        """
         # Create new RT Struct
         rtstruct = RTStructBuilder.create_new(dicom_series_path=self.dicom_path)
 
+        if fast:
+            self.add_rois(rtstruct, workers)
+            rtstruct.save(str(self.output_path))
+            return
+
         # Add each class as an ROI
         for class_idx, class_name in tqdm(self.selected_classes.items()):
             binary_img = self.mask_array == class_idx
@@ -51,4 +69,61 @@ class NiftiToDicomRT:
                 )
 
         # Save the RTSTRUCT file
-        rtstruct.save(str(self.output_path))
\ No newline at end of file
+        rtstruct.save(str(self.output_path))
+
+    def add_rois(self, rtstruct, workers=None):
+        """
+        Add the selected classes to the RT Struct as ROIs, with the same contours as `rt_utils`.
+        The bounding boxes of all the classes are found in one pass over the mask (`ndimage.find_objects`), then the contours of each class are extracted by `roi_contours` in its box only, on the slices that contain the class.
+        The empty classes are skipped.
+        """
+        transformation_matrix = image_helper.get_pixel_to_patient_transformation_matrix(rtstruct.series_data)
+        boxes = ndimage.find_objects(self.mask_array)
+
+        jobs, names = [], []
+        for class_idx, class_name in self.selected_classes.items():
+            if not 0 < class_idx <= len(boxes) or boxes[class_idx - 1] is None:
+                continue
+            # One pixel of margin in the slices, so the contours are the same as in the whole slices
+            box = tuple(
+                slice(max(axis.start - 1, 0), min(axis.stop + 1, size)) if i < 2 else axis
+                for i, (axis, size) in enumerate(zip(boxes[class_idx - 1], self.mask_array.shape))
+            )
+            offset = (box[1].start, box[0].start, box[2].start)  # the contour points are (column, row, slice)
+            jobs.append((self.mask_array[box] == class_idx, offset, transformation_matrix))
+            names.append(class_name)
+
+        for class_name, contours in zip(names, run_jobs(self.roi_contours, jobs, workers=workers)):
+            roi_data = ROIData(None, None, len(rtstruct.ds.StructureSetROISequence) + 1, class_name, rtstruct.frame_of_reference_uid)
+            roi_contour = self.create_roi_contour(roi_data, contours, rtstruct.series_data)
+            rtstruct.ds.ROIContourSequence.append(roi_contour)
+            rtstruct.ds.StructureSetROISequence.append(ds_helper.create_structure_set_roi(roi_data))
+            rtstruct.ds.RTROIObservationsSequence.append(ds_helper.create_rtroi_observation(roi_data))
+
+    @staticmethod
+    def roi_contours(mask, offset, transformation_matrix):
+        """
+        Extract the contours of a class cropped to its bounding box (a boolean array), only in the slices that contain the class.
+        Returns a list of (slice index, contour data in patient coordinates) in the order of the slices, like `rt_utils`.
+        """
+        contours = []
+        for i in np.flatnonzero(mask.any(axis=(0, 1))):
+            slice_contours, _ = image_helper.find_mask_contours(mask[:, :, i], approximate_contours=True)
+            image_helper.validate_contours(slice_contours)
+            for contour in slice_contours:
+                points = np.asarray(contour, dtype=np.float64) + offset[:2]
+                points = np.concatenate((points, np.full((len(points), 1), i + offset[2])), axis=1)
+                transformed_contour = image_helper.apply_transformation_to_3d_points(points, transformation_matrix)
+                contours.append((i + offset[2], np.ravel(transformed_contour).tolist()))
+        return contours
+
+    @staticmethod
+    def create_roi_contour(roi_data, contours, series_data):
+        """
+        Create the ROI Contour item of a class from the contours of `roi_contours`.
+        """
+        roi_contour = Dataset()
+        roi_contour.ROIDisplayColor = roi_data.color
+        roi_contour.ContourSequence = Sequence([ds_helper.create_contour(series_data[i], contour_data) for i, contour_data in contours])
+        roi_contour.ReferencedROINumber = str(roi_data.number)
+        return roi_contour
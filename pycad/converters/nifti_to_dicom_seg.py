@@ -4,22 +4,60 @@
 # More information can be found in the original documentation: https://highdicom.readthedocs.io/en/latest/quickstart.html#creating-segmentation-seg-images
 
 
+import os
+import json
+import time
+from glob import glob
 from pathlib import Path
 import highdicom as hd
 import numpy as np
 from pydicom.sr.codedict import codes
 from pydicom.filereader import dcmread
 import nibabel as nib
+from ..utils.parallel import run_jobs
+from ..utils.labels import load_labels, to_labels
 
 
 class NiftiToDicomSeg:
-    def __init__(self, dicom_dir, nifti_file):
+    '''
+    This class creates a DICOM SEG file from a nifti mask and the dicom series it was segmented from, using highdicom.
+
+    ### Params
+    - dicom_dir: the path to the dicom series (.dcm files)
+    - nifti_file: the path to the nifti mask
+    - lazy: if True, only the headers of the dicom files are read (without the pixel data, which is not needed to build the SEG), the mask is loaded as uint8 labels instead of float64, and only the frames with foreground are given to highdicom. This divides the memory and the time by several times for long series, for the same SEG file.
+
+    With `segment_labels` ({label value: name}), `create_segmentation` writes all the labels of a multi-label mask (for example the classes of TotalSegmentator) as the segments of one SEG, in one pass over the mask.
+    `convert_dir` converts a whole directory of masks, in parallel processes.
+
+    ### Example of usage:
+    ```
+    from pycad.converters import NiftiToDicomSeg
+
+    converter = NiftiToDicomSeg('path/to/dicom/series', 'path/to/mask.nii.gz', lazy=True)
+    converter.align_mask()
+    converter.create_segmentation(segment_label='liver')
+    converter.save_segmentation('seg.dcm')
+
+    # multi-label masks
+    converter.create_segmentation(segment_labels={1: 'spleen', 2: 'kidney_right', 3: 'kidney_left'})
+
+    # a directory of masks (case.nii.gz) with their series (dicom_root/case), with 4 processes
+    manifest = NiftiToDicomSeg.convert_dir('path/to/dicom/root', 'path/to/masks', 'path/to/segs', segment_labels={1: 'spleen', 2: 'kidney_right'}, workers=4)
+    ```
+    '''
+    def __init__(self, dicom_dir, nifti_file, lazy=False):
         self.series_dir = Path(dicom_dir)
         self.image_files = self.series_dir.glob('*.dcm')
         self.nifti_file = nib.load(nifti_file)
-        self.mask_array = self.nifti_file.get_fdata()
-        self.image_datasets = [dcmread(str(f)) for f in self.image_files]
-        
+        self.lazy = lazy
+        if lazy:
+            self.mask_array = load_labels(self.nifti_file)
+            self.image_datasets = [dcmread(str(f), stop_before_pixels=True) for f in self.image_files]
+        else:
+            self.mask_array = self.nifti_file.get_fdata()
+            self.image_datasets = [dcmread(str(f)) for f in self.image_files]
+
     def print_dimensions(self):
         print("DICOM", len(self.image_datasets))
         print("DICOM", self.image_datasets[0].Rows)
@@ -33,6 +71,15 @@ class NiftiToDicomSeg:
         mask = np.transpose(self.mask_array, (2, 1, 0))  # Transpose to match DICOM dimensions
         mask = np.flip(mask, axis=0)  # Flip along the z-axis if needed
         mask = np.flip(mask, axis=1)  # Flip along the y-axis if needed
+
+        # The labels of the multi-label segmentations
+        self.labels = mask
+
+        if self.lazy:
+            # The labels are kept as a view, the frames are converted to bool only when they contain foreground (see `foreground_frames`)
+            self.mask = mask
+            print("Updated mask shape:", mask.shape)
+            return
         
         # Debug info
         print("Updated mask shape:", mask.shape)
@@ -56,7 +103,22 @@ class NiftiToDicomSeg:
     def create_segmentation(self, segment_label='liver', algorithm_name='test', 
                           algorithm_version='v1.0', manufacturer='Manufacturer',
                           model_name='Model', software_version='v1', 
-                          device_serial='Device XYZ'):
+                          device_serial='Device XYZ', segment_labels=None):
+        '''
+        Creates the SEG dataset from the aligned mask.\n
+        - `segment_label`: the name of the segment, all the labels of the mask are one segment
+        - `segment_labels`: a dict {label value: name} to write each label of a multi-label mask as its own segment instead, the labels missing from the mask are skipped and the segments are numbered from 1 in the order of the values
+        '''
+        if segment_labels is not None:
+            source_images, pixel_array, values = self.segment_frames(segment_labels)
+            segment_names = [segment_labels[value] for value in values]
+        elif self.lazy:
+            source_images, pixel_array = self.foreground_frames()
+            segment_names = [segment_label]
+        else:
+            source_images, pixel_array = self.image_datasets, self.mask
+            segment_names = [segment_label]
+
         # Describe the algorithm that created the segmentation
         algorithm_identification = hd.AlgorithmIdentificationSequence(
             name=algorithm_name,
@@ -64,24 +126,27 @@ class NiftiToDicomSeg:
             family=codes.cid7162.ArtificialIntelligence
         )
 
-        # Describe the segment
-        description_segment_1 = hd.seg.SegmentDescription(
-            segment_number=1,
-            segment_label=segment_label,
-            segmented_property_category=codes.cid7150.Tissue,
-            segmented_property_type=codes.cid7166.ConnectiveTissue,
-            algorithm_type=hd.seg.SegmentAlgorithmTypeValues.AUTOMATIC,
-            algorithm_identification=algorithm_identification,
-            tracking_uid=hd.UID(),
-            tracking_id='test segmentation of computed tomography image'
-        )
+        # Describe the segments
+        segment_descriptions = [
+            hd.seg.SegmentDescription(
+                segment_number=segment_number,
+                segment_label=segment_name,
+                segmented_property_category=codes.cid7150.Tissue,
+                segmented_property_type=codes.cid7166.ConnectiveTissue,
+                algorithm_type=hd.seg.SegmentAlgorithmTypeValues.AUTOMATIC,
+                algorithm_identification=algorithm_identification,
+                tracking_uid=hd.UID(),
+                tracking_id='test segmentation of computed tomography image'
+            )
+            for segment_number, segment_name in enumerate(segment_names, start=1)
+        ]
 
         # Create the Segmentation instance
         self.seg_dataset = hd.seg.Segmentation(
-            source_images=self.image_datasets,
-            pixel_array=self.mask,
+            source_images=source_images,
+            pixel_array=pixel_array,
             segmentation_type=hd.seg.SegmentationTypeValues.BINARY,
-            segment_descriptions=[description_segment_1],
+            segment_descriptions=segment_descriptions,
             series_instance_uid=hd.UID(),
             series_number=2,
             sop_instance_uid=hd.UID(),
@@ -92,7 +157,91 @@ class NiftiToDicomSeg:
             device_serial_number=device_serial,
         )
 
+    def foreground_frames(self):
+        '''
+        Returns the frames of the aligned mask that contain foreground (as bool) and their source images.
+        The empty frames are not written in the SEG anyway, so highdicom only gets the frames it keeps, and each frame still references its source image.
+        '''
+        frames = [i for i in range(self.mask.shape[0]) if self.mask[i].any()] or [0]
+        pixel_array = np.stack([self.mask[i] > 0 for i in frames])
+        return [self.image_datasets[i] for i in frames], pixel_array
+
+    def segment_frames(self, segment_labels):
+        '''
+        Returns the source images, the frames and the label values of the segments of a multi-label mask.
+        The label map is read once: the labels of each frame are counted to find the frames with foreground (lazy mode) and the labels present in the mask, then the labels of `segment_labels` are mapped to the segment numbers (1 to N) with a lookup table, and the other labels to 0.
+        '''
+        labels = to_labels(self.labels)
+        counts = np.zeros(np.iinfo(labels.dtype).max + 1, dtype=np.int64)
+        frames = []
+        for i in range(labels.shape[0]):
+            frame_counts = np.bincount(labels[i].ravel(), minlength=len(counts))
+            if frame_counts[1:].any() or not self.lazy:
+                frames.append(i)
+                counts += frame_counts
+
+        values = [value for value in sorted(segment_labels) if 0 < value < len(counts) and counts[value] > 0]
+        if not values:
+            raise ValueError(f'None of the labels {sorted(segment_labels)} is in the mask.')
+        lut = np.zeros(len(counts), dtype=np.uint8 if len(values) < 256 else np.uint16)
+        lut[values] = np.arange(1, len(values) + 1)
+        return [self.image_datasets[i] for i in frames], lut[labels[frames]], values
+
     def save_segmentation(self, output_file="seg.dcm"):
         self.seg_dataset.save_as(output_file)
         print("Segmentation DICOM file saved successfully!")
 
+    @staticmethod
+    def convert_case(dicom_dir, nifti_file, output_file, segment_labels=None, lazy=True, options=None):
+        '''
+        Converts one mask to a SEG file, this is the job of `convert_dir`.
+        Returns the record of the case: the case name, the SEG path, the status ('done' or 'error' with the error message), the number of segments and frames, and the time.
+        '''
+        start = time.perf_counter()
+        case_name = os.path.basename(nifti_file).split('.')[0]
+        record = {'case': case_name, 'path': output_file, 'status': 'done', 'n_segments': 0, 'n_frames': 0}
+        try:
+            if not os.path.isdir(dicom_dir):
+                raise FileNotFoundError(f'missing dicom series {dicom_dir}')
+            converter = NiftiToDicomSeg(dicom_dir, nifti_file, lazy=lazy)
+            converter.align_mask()
+            converter.create_segmentation(segment_labels=segment_labels, **(options or {}))
+            converter.save_segmentation(output_file)
+            record['n_segments'] = len(converter.seg_dataset.SegmentSequence)
+            record['n_frames'] = int(converter.seg_dataset.NumberOfFrames)
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+        record['seconds'] = round(time.perf_counter() - start, 3)
+        return record
+
+    @staticmethod
+    def convert_dir(dicom_root, nifti_dir, out_dir, segment_labels=None, lazy=True, workers=None, **options):
+        '''
+        Converts all the masks of a directory to SEG files, the mask `nifti_dir/case.nii.gz` is matched to the series `dicom_root/case` and written to `out_dir/case.dcm`.\n
+        - `segment_labels`: a dict {label value: name} to write each label as a segment (see `create_segmentation`), by default each mask is one segment
+        - `lazy`: the lazy mode of the converter, default=True
+        - `workers`: the number of processes converting the cases in parallel, by default the cases are converted one after the other
+        - `options`: the other arguments of `create_segmentation` (algorithm name, manufacturer...)
+
+        The records of the cases (see `convert_case`) are saved in `out_dir/manifest.json`, returns the manifest.
+        '''
+        os.makedirs(out_dir, exist_ok=True)
+        masks = sorted(path for path in glob(os.path.join(nifti_dir, '*')) if path.endswith('.nii') or path.endswith('.nii.gz'))
+        jobs = []
+        for nifti_file in masks:
+            case_name = os.path.basename(nifti_file).split('.')[0]
+            jobs.append((os.path.join(dicom_root, case_name), nifti_file, os.path.join(out_dir, f'{case_name}.dcm'), segment_labels, lazy, options))
+
+        start = time.perf_counter()
+        records = run_jobs(NiftiToDicomSeg.convert_case, jobs, workers=workers)
+        manifest = {
+            'cases': len(records),
+            'errors': sum(record['status'] == 'error' for record in records),
+            'seconds': round(time.perf_counter() - start, 3),
+            'records': records,
+        }
+        with open(os.path.join(out_dir, 'manifest.json'), 'w') as outfile:
+            json.dump(manifest, outfile, indent=4)
+        return manifest
+
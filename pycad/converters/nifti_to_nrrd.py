@@ -3,10 +3,10 @@
 # https://github.com/amine0110/pycad/blob/main/LICENSE
 
 
-import SimpleITK as sitk
 import os
 import logging
 from glob import glob
+from .engine import convert
 
 class NiftiToNrrdConverter:
 
@@ -48,16 +48,13 @@ class NiftiToNrrdConverter:
         Converts a single NIfTI file to an NRRD file.
         """
         try:
-            # Read the NIfTI image
-            nifti_image = sitk.ReadImage(input_file_path)
-
             # Generate the corresponding output file path with .nrrd extension
             base_name = os.path.basename(input_file_path).split('.')[0]
             output_file_path = os.path.join(output_dir, f'{base_name}.nrrd')
 
-            # Write the image as an NRRD file
-            sitk.WriteImage(nifti_image, output_file_path)
-            self.logger.info(f'Converted {input_file_path} to {output_file_path}')
+            # Read the NIfTI image and write it as an NRRD file
+            report = convert(input_file_path, output_file_path, to='nrrd', src_format='nifti')
+            self.logger.info(f'Converted {input_file_path} to {output_file_path} ({report["timings"]})')
         except Exception as e:
             self.logger.error(f'Failed to convert {input_file_path}: {e}')
 
@@ -5,16 +5,25 @@
 
 import SimpleITK as sitk
 import os
+import json
+import io
+import zlib
 from glob import glob
 import numpy as np
 from tqdm import tqdm
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from ..utils.parallel import run_jobs
 
 
 class NiftiToPngConverter:
     '''
     The nifti to png converter can be used to convert one or multiple nifti files into png images. It can be called `from pycad.converters import NiftiToPngConverter`.\n
     `max_v` and `min_v` needs to be checked before doing the conversion. Please see the plan [here](https://www.notion.so/What-to-do-before-training-a-model-with-Yolov8-443dd35fd3974770a3d17759ec1d3de4?pvs=4).\n
+    `mode` is the mode of the png images, 'rgb' (3 identical channels, the default), 'gray' (one channel, 3 times less data to encode and write) or '2.5d' (the slices i-1, i and i+1 of the volume in the red, green and blue channels, the labels are the ones of the slice i).\n
+    `planes` are the planes of the exported slices, any of 'axial' (the default), 'coronal' and 'sagittal', they are all sliced from the same loaded array.\n
+    `workers` is the number of threads encoding and saving the slices of a case (Pillow releases the GIL while encoding), and `compress_level` is the zlib level of the png files, from 0 to 9 (1 is several times faster to encode than the default 6, for slightly bigger files).\n
+    `sampling` selects the slices written in the paired mode from the segmentation: 'all' (the default), 'foreground' (only the slices with labels), 'foreground+random' (plus `n_negatives` random empty slices, drawn with `seed`) or 'foreground+strided' (plus every `negative_step`-th empty slice).\n
 
     ### Example of usage:
     ```
@@ -26,13 +35,37 @@ class NiftiToPngConverter:
     converter = NiftiToPngConverter(max_v=200, min_v=-200)
 
     converter.run(image_paths, seg_paths, output_path)
+
+    # or case by case, the volume and its segmentation are written only if both of them can be converted
+    converter.run(image_paths, seg_paths, output_path, paired=True)
     
     ```
     '''
 
-    def __init__(self, max_v=None, min_v=None):
+    MODES = {'rgb': 'RGB', 'gray': 'L', '2.5d': 'RGB'}
+    PLANES = ('axial', 'coronal', 'sagittal')
+    SAMPLINGS = ('all', 'foreground', 'foreground+random', 'foreground+strided')
+
+    def __init__(self, max_v=None, min_v=None, mode='rgb', workers=None, compress_level=6,
+                 sampling='all', n_negatives=0, negative_step=10, seed=0, planes=('axial',)):
+        if mode not in self.MODES:
+            raise ValueError(f'The mode {mode} is not supported, choose one of {list(self.MODES)}.')
+        if isinstance(planes, str):
+            planes = (planes,)
+        if not planes or any(plane not in self.PLANES for plane in planes):
+            raise ValueError(f'The planes {planes} are not supported, choose some of {list(self.PLANES)}.')
+        if sampling not in self.SAMPLINGS:
+            raise ValueError(f'The sampling {sampling} is not supported, choose one of {list(self.SAMPLINGS)}.')
         self.max_v = max_v
         self.min_v = min_v
+        self.mode = mode
+        self.workers = workers
+        self.compress_level = compress_level
+        self.sampling = sampling
+        self.n_negatives = n_negatives
+        self.negative_step = negative_step
+        self.seed = seed
+        self.planes = tuple(planes)
         self.rejected_cases = []
 
     def prepare_image(self, image_data, data_type='vol'):
@@ -55,59 +88,373 @@ class NiftiToPngConverter:
         elif data_type == 'seg':
             return np.uint8(image_data)
 
+    def prepare_volume(self, img_array, data_type='vol', slab_size=64):
+        '''
+        This function is the whole volume version of `prepare_image`, it gives the same result as calling `prepare_image` on each slice (the min and max are still computed per slice when `max_v` or `min_v` are not given).
+        The windowing is done in place in `img_array` and by slabs of `slab_size` slices, so that the floating point copy stays small.
+        '''
+        if data_type == 'seg':
+            return img_array.astype(np.uint8)
+
+        prepared = np.empty(img_array.shape, dtype=np.uint8)
+        for start in range(0, len(img_array), slab_size):
+            slab = img_array[start:start + slab_size]
+            if self.max_v: HOUNSFIELD_MAX = int(float(self.max_v))
+            else: HOUNSFIELD_MAX = slab.max(axis=(1, 2), keepdims=True)
+            if self.min_v: HOUNSFIELD_MIN = int(float(self.min_v))
+            else: HOUNSFIELD_MIN = slab.min(axis=(1, 2), keepdims=True)
+
+            HOUNSFIELD_RANGE = HOUNSFIELD_MAX - HOUNSFIELD_MIN
+
+            np.clip(slab, HOUNSFIELD_MIN, HOUNSFIELD_MAX, out=slab, casting='unsafe')
+            with np.errstate(divide='ignore', invalid='ignore'):  # the uniform slices, as in prepare_image
+                normalized_slab = (slab - HOUNSFIELD_MIN) / HOUNSFIELD_RANGE
+                normalized_slab *= 255
+                prepared[start:start + slab_size] = normalized_slab
+        return prepared
+
     def convert_nifti_to_png(self, in_dir:str, out_dir:str, data_type:str):
         '''
         This function is to take one nifti file and then convert it into png series, it keeps the same casename and then adds _indexID.\n
         - `in_dir`: the path to one nifti file: nii | nii.gz\n
         - `out_dir`: the path to save the png series\n
         - `data_type`: the type of the input nifti file, is it a volume or segmentation? This value is expecting either 'seg' for segmentation or 'vol' for volume.
+
+        Returns True if the file has been converted, otherwise the case is added to `rejected_cases` and False is returned.
+        '''
+        converted = self.convert_case(in_dir, out_dir, data_type)
+        if not converted:
+            self.rejected_cases.append(os.path.basename(in_dir).split('.')[0])
+        return converted
+
+    def convert_case(self, in_dir:str, out_dir:str, data_type:str):
+        '''
+        This function does the conversion of `convert_nifti_to_png` without changing the converter, so it can run in another process. It returns True if the file has been converted.
         '''
         try:
             new_img = sitk.ReadImage(in_dir)
             img_array = sitk.GetArrayFromImage(new_img)
             case_name = os.path.basename(in_dir).split('.')[0]
 
-            if not os.path.exists(out_dir):
-                os.makedirs(out_dir)
-
-            for i, img_slice in enumerate(img_array):
-                prepared_image = self.prepare_image(img_slice, data_type=data_type)
-                prepared_image = np.rot90(prepared_image, 2)
-                img = Image.fromarray(prepared_image)
-                img = img.convert('RGB')
-                img.save(f"{out_dir}/{case_name}_{str(i).zfill(4)}.png")
-        except:
+            self.write_png_slices(img_array, out_dir, case_name, data_type)
+            return True
+        except Exception:
             print('Error with the file:', in_dir)
-            self.rejected_cases.append(os.path.basename(in_dir).split('.')[0])
+            return False
+
+    def write_png_slices(self, img_array, out_dir:str, case_name:str, data_type:str):
+        '''
+        This function writes the slices of an array (in the SimpleITK order: slices, rows, columns) as png images named `case_name` + _indexID, in each plane of `planes`.\n
+        - `img_array`: the array of the volume or segmentation
+        - `out_dir`: the path to save the png series\n
+        - `case_name`: the name of the case used to name the png files\n
+        - `data_type`: 'seg' for segmentation or 'vol' for volume.
+        '''
+        # All the planes are sliced from the same loaded array, each plane is prepared at once and then its slices are only encoded
+        paths = []
+        for plane in self.planes:
+            prepared_array = self.prepare_plane(img_array, plane, data_type=data_type)
+            paths += self.save_png_slices(prepared_array, out_dir, case_name, plane=plane)
+        return paths
+
+    @staticmethod
+    def plane_view(img_array, plane:str = 'axial'):
+        '''
+        This function returns a view of an array (slices, rows, columns) with the slices of `plane` along the first axis, oriented as in the png images (no copy is done).
+        The axial slices are rotated like np.rot90(slice, 2), and the coronal and sagittal slices have the superior side at the top.
+        The coronal and sagittal slices are not resampled, so they keep the spacing of the volume between the axial slices.
+        '''
+        if plane == 'axial':
+            return img_array[:, ::-1, ::-1]
+        if plane == 'coronal':
+            return img_array.transpose(1, 0, 2)[:, ::-1]
+        return img_array.transpose(2, 0, 1)[:, ::-1]
+
+    def prepare_plane(self, img_array, plane:str = 'axial', data_type:str = 'vol', indices=None):
+        '''
+        This function prepares the slices `indices` (by default all of them) of a plane of the volume with `prepare_volume`.
+        In the '2.5d' mode, each volume slice i is returned with the slices i-1 and i+1 in the red and blue channels (the edge slices are repeated), the segmentations keep one channel.
+        '''
+        view = self.plane_view(img_array, plane)
+        if indices is None:
+            indices = np.arange(len(view))
+
+        if self.mode == '2.5d' and data_type == 'vol':
+            neighbors = np.clip(np.stack([indices - 1, indices, indices + 1], axis=1), 0, len(view) - 1)
+            # Each needed slice is prepared once, even if it is the neighbor of two slices
+            needed_indices, positions = np.unique(neighbors, return_inverse=True)
+            prepared = self.prepare_volume(view[needed_indices], data_type=data_type)
+            return np.moveaxis(prepared[positions.reshape(neighbors.shape)], 1, -1)
+
+        if len(indices) < len(view):
+            view = view[indices]
+        return self.prepare_volume(view, data_type=data_type)
+
+    @staticmethod
+    def slice_path(out_dir:str, case_name:str, index:int, plane:str = 'axial'):
+        '''
+        This function returns the path of the png image of the slice `index` of a case, the coronal and sagittal slices have the name of the plane after the case name.
+        '''
+        if plane != 'axial':
+            case_name = f"{case_name}_{plane}"
+        return f"{out_dir}/{case_name}_{str(index).zfill(4)}.png"
+
+    def save_png_slices(self, prepared_array, out_dir:str, case_name:str, indices=None, plane:str = 'axial'):
+        '''
+        This function saves the slices of a prepared array (uint8) on the threads of the converter and returns the paths of the png images.\n
+        - `indices`: the indices in the volume of the slices of `prepared_array` (when only some slices have been prepared), they are used to name the png files. By default the array is the whole volume.\n
+        - `plane`: the plane of the slices, used to name the png files.
+        '''
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
 
-    def convert_nifti_to_png_dir(self, in_dir:str, out_dir:str, data_type:str):
+        if indices is None:
+            indices = range(len(prepared_array))
+        jobs = [(prepared_image, self.slice_path(out_dir, case_name, i, plane)) for prepared_image, i in zip(prepared_array, indices)]
+        run_jobs(self.save_png, jobs, workers=self.workers, use_processes=False)
+        return [path for _, path in jobs]
+
+    def save_png(self, prepared_image, path):
+        '''
+        This function saves one prepared slice (uint8) as a png image in the mode of the converter.
+        The image is written in a temporary file first and then renamed, so an interrupted conversion does not leave truncated png files.
+        '''
+        with open(path + '.tmp', 'wb') as outfile:
+            outfile.write(self.encode_png(prepared_image))
+        os.replace(path + '.tmp', path)
+
+    def encode_png(self, prepared_image):
+        '''
+        This function encodes one prepared slice (uint8) as png bytes in the mode of the converter.
+        '''
+        img = Image.fromarray(np.ascontiguousarray(prepared_image))
+        if self.MODES[self.mode] == 'RGB':
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', compress_level=self.compress_level)
+        return buffer.getvalue()
+
+    def sample_slices(self, seg_array, case_name:str = ''):
+        '''
+        This function returns the sorted indices of the slices to convert following the `sampling` of the converter.
+        The label index of the case (which slices contain labels) is computed once from the segmentation `seg_array` (slices, rows, columns).
+        The random negatives only depend on `seed` and `case_name`, so they do not change with the order or the process in which the cases are converted.
+        '''
+        if self.sampling == 'all':
+            return np.arange(len(seg_array))
+
+        foreground = seg_array.any(axis=(1, 2))
+        foreground_indices = np.flatnonzero(foreground)
+        negative_indices = np.flatnonzero(~foreground)
+        if self.sampling == 'foreground':
+            negative_indices = negative_indices[:0]
+        elif self.sampling == 'foreground+random':
+            rng = np.random.default_rng([self.seed, zlib.crc32(case_name.encode())])
+            negative_indices = rng.choice(negative_indices, min(self.n_negatives, len(negative_indices)), replace=False)
+        elif self.sampling == 'foreground+strided':
+            negative_indices = negative_indices[::self.negative_step]
+        return np.sort(np.concatenate([foreground_indices, negative_indices]))
+
+    def read_pair(self, vol_path:str, seg_path:str):
+        '''
+        This function reads a volume and its segmentation, checks that the shapes match and prepares the slices selected by `sampling` in each plane of `planes`.
+        It returns the record of the case for the manifest (see `convert_pair`) and the list of the prepared planes (plane, indices of the slices in the volume, prepared volume, prepared segmentation), empty if the case is rejected.
+        '''
+        case_name = os.path.basename(vol_path or seg_path).split('.')[0]
+        record = {'case': case_name, 'status': 'rejected', 'reason': None, 'n_slices': 0, 'n_foreground': 0}
+        if vol_path is None or seg_path is None:
+            record['reason'] = 'missing volume' if vol_path is None else 'missing segmentation'
+            return record, []
+
+        try:
+            vol_array = sitk.GetArrayFromImage(sitk.ReadImage(vol_path))
+            seg_array = sitk.GetArrayFromImage(sitk.ReadImage(seg_path))
+        except Exception as e:
+            record['reason'] = f'read error: {e}'
+            return record, []
+        if vol_array.shape != seg_array.shape:
+            record['reason'] = f'shape mismatch: volume {vol_array.shape}, segmentation {seg_array.shape}'
+            return record, []
+
+        planes = []
+        for plane in self.planes:
+            seg_view = self.plane_view(seg_array, plane)
+            indices = self.sample_slices(seg_view, case_name if plane == 'axial' else f'{case_name}_{plane}')
+            record['n_slices'] += len(indices)
+            record['n_foreground'] += int(seg_view.any(axis=(1, 2)).sum())  # the sampled slices always include the foreground
+            planes.append((plane, indices,
+                           self.prepare_plane(vol_array, plane, data_type='vol', indices=indices),
+                           self.prepare_plane(seg_array, plane, data_type='seg', indices=indices)))
+        return record, planes
+
+    def convert_pair(self, vol_path:str, seg_path:str, out_dir:str):
+        '''
+        This function converts a volume and its segmentation together: both files are read and prepared, and the slices are written only if the shapes match.
+        If a write fails, the files already written for the case are removed, so a case is either complete in `out_dir/images` and `out_dir/labels` or absent.\n
+        - `vol_path`: the path to the volume nifti file (or None if it is missing)\n
+        - `seg_path`: the path to the segmentation nifti file (or None if it is missing)\n
+        - `out_dir`: the path where the `images` and `labels` folders are written
+
+        Only the slices selected by `sampling` are prepared and written, the png files keep the index of the slice in the volume.
+        Returns the record of the case for the manifest: the case name, the status ('converted' or 'rejected'), the reason of the rejection, the number of slices written and the number of slices with labels.
+        '''
+        record, planes = self.read_pair(vol_path, seg_path)
+        if not planes:
+            return record
+
+        written = []
+        try:
+            for plane, indices, prepared_vol, prepared_seg in planes:
+                for prepared_array, folder in ((prepared_vol, 'images'), (prepared_seg, 'labels')):
+                    written += [self.slice_path(os.path.join(out_dir, folder), record['case'], i, plane) for i in indices]
+                    self.save_png_slices(prepared_array, os.path.join(out_dir, folder), record['case'], indices, plane=plane)
+        except Exception as e:
+            # Only the files of this case are removed, no need to search the output folders
+            for path in written:
+                for file_path in (path, path + '.tmp'):
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+            record['reason'] = f'write error: {e}'
+            record['n_slices'] = 0
+            return record
+
+        record['status'] = 'converted'
+        return record
+
+    def encode_pair(self, vol_path:str, seg_path:str, shard_format:str = 'tar'):
+        '''
+        This function is the version of `convert_pair` for the shards: it returns the record of the case and its samples (key, members) instead of writing png files.
+        For the 'tar' shards the slices are encoded as png images ('png' and 'label.png'), for the 'npz' shards they are kept as uint8 arrays ('image' and 'label').
+        '''
+        record, planes = self.read_pair(vol_path, seg_path)
+        samples = []
+        for plane, indices, prepared_vol, prepared_seg in planes:
+            if shard_format == 'tar':
+                extensions = ('png', 'label.png')
+                jobs = [(prepared_image,) for prepared_image in prepared_vol] + [(prepared_label,) for prepared_label in prepared_seg]
+                encoded = run_jobs(self.encode_png, jobs, workers=self.workers, use_processes=False)
+                images, labels = encoded[:len(indices)], encoded[len(indices):]
+            else:
+                extensions = ('image', 'label')
+                images, labels = np.ascontiguousarray(prepared_vol), np.ascontiguousarray(prepared_seg)
+
+            for i, image, label in zip(indices, images, labels):
+                key = os.path.basename(self.slice_path('', record['case'], i, plane))[:-4]
+                samples.append((key, {extensions[0]: image, extensions[1]: label}))
+
+        if planes:
+            record['status'] = 'converted'
+        return record, samples
+
+    def write_pairs_shards(self, pairs, out_dir:str, processes=None, shard_format='tar', shard_size=1000):
+        '''
+        This function encodes the cases with `encode_pair` (in parallel processes if `processes` is given) and writes their samples in shards with `ShardWriter`, in the order of the cases.
+        The samples of a case are written as one group (see `ShardWriter.write_group`), so a case is only split between shards when it has more than `shard_size` slices, and these shards are kept in the same split by `DataSplitter`.
+        The cases are encoded by batches of `processes` cases, so only a few cases are kept in memory. It returns the records of the cases.
+        '''
+        from ..datasets.shard_writer import ShardWriter
+
+        records = []
+        executor = ProcessPoolExecutor(max_workers=processes) if processes and processes > 1 else None
+        try:
+            with ShardWriter(out_dir, shard_size=shard_size, shard_format=shard_format, compress_level=self.compress_level) as writer, tqdm(total=len(pairs)) as bar:
+                batch_size = processes or 1
+                for start in range(0, len(pairs), batch_size):
+                    jobs = [(vol_path, seg_path, shard_format) for vol_path, seg_path in pairs[start:start + batch_size]]
+                    for record, samples in run_jobs(self.encode_pair, jobs, executor=executor):
+                        writer.write_group(record['case'], samples)
+                        records.append(record)
+                        bar.update()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return records
+
+    def convert_pairs_dir(self, in_dir_vol:str, in_dir_seg:str, out_dir:str, processes=None, shard_format=None, shard_size=1000):
+        '''
+        This function converts the volumes and the segmentations of two directories case by case with `convert_pair`, the files are paired by case name.
+        The record of each case is saved in `out_dir/manifest.json`, and the rejected cases are added to `rejected_cases`.\n
+        - `in_dir_vol`: the directory to the volume nifti files (.nii or .nii.gz)\n
+        - `in_dir_seg`: the directory to the segmentation nifti files (.nii or .nii.gz)\n
+        - `out_dir`: the path where the `images` and `labels` folders and the manifest are written\n
+        - `processes`: the number of processes converting the cases in parallel, by default the cases are converted one after the other\n
+        - `shard_format`: if 'tar' or 'npz', the slices are written in shards of `shard_size` slices with their index (see `pycad.datasets.ShardWriter`) instead of one png file per slice
+
+        Returns the manifest.
+        '''
+        def list_cases(in_dir):
+            cases_list = [case for case in glob(os.path.join(in_dir, '*')) if case.endswith('.nii') or case.endswith('.nii.gz')]
+            return {os.path.basename(case).split('.')[0]: case for case in cases_list}
+
+        vol_cases = list_cases(in_dir_vol)
+        seg_cases = list_cases(in_dir_seg)
+        case_names = sorted(set(vol_cases) | set(seg_cases))
+
+        pairs = [(vol_cases.get(name), seg_cases.get(name)) for name in case_names]
+        if shard_format:
+            records = self.write_pairs_shards(pairs, out_dir, processes=processes, shard_format=shard_format, shard_size=shard_size)
+        else:
+            jobs = [(vol_path, seg_path, out_dir) for vol_path, seg_path in pairs]
+            with tqdm(total=len(jobs)) as bar:
+                records = run_jobs(self.convert_pair, jobs, workers=processes, progress=lambda done, total: bar.update())
+
+        self.rejected_cases += [record['case'] for record in records if record['status'] == 'rejected']
+        manifest = {
+            'converted': sum(record['status'] == 'converted' for record in records),
+            'rejected': sum(record['status'] == 'rejected' for record in records),
+            'cases': records,
+        }
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, 'manifest.json'), 'w') as outfile:
+            json.dump(manifest, outfile, indent=4)
+        return manifest
+
+    def convert_nifti_to_png_dir(self, in_dir:str, out_dir:str, data_type:str, processes=None):
         '''
         This function is the directory version of `convert_nifti_to_png`, and it can be used to convert a whole directory of nifti files either for volumes or segmentations.\n
         - `in_dir`: the directory to the nifti files (.nii or .nii.gz)\n
         - `out_dir`: the directory to save the png outputs\n
-        - `data_type`: the type of the input, either vol for volumes or seg for segmentations, any mistake on this will cause wrong png files
+        - `data_type`: the type of the input, either vol for volumes or seg for segmentations, any mistake on this will cause wrong png files\n
+        - `processes`: the number of processes converting the cases in parallel, by default the cases are converted one after the other
         '''
         cases_list = glob(os.path.join(in_dir, '*'))
         cases_list = [case for case in cases_list if case.endswith('.nii') or case.endswith('.nii.gz')]
 
-        for case in tqdm(cases_list):
-            self.convert_nifti_to_png(case, out_dir, data_type)
+        jobs = [(case, out_dir, data_type) for case in cases_list]
+        with tqdm(total=len(jobs)) as bar:
+            results = run_jobs(self.convert_case, jobs, workers=processes, progress=lambda done, total: bar.update())
+
+        # The rejected cases are collected here, the processes cannot update the converter
+        self.rejected_cases += [os.path.basename(case).split('.')[0] for case, converted in zip(cases_list, results) if not converted]
 
-    def run(self, in_dir_vol:str = None, in_dir_seg:str = None, out_dir:str = None, delete_none_converted=False):
+    def run(self, in_dir_vol:str = None, in_dir_seg:str = None, out_dir:str = None, delete_none_converted=False, processes=None, paired=False, shard_format=None, shard_size=1000):
         '''
         This function is the main function to call the conversion function for the volumes and segmentations.\n
         - `in_dir_vol`: path to the input dir containing the volume files (nifti)\n
         - `in_dir_seg`: path to the input dir containing the segmentation files (nifti)\n
         - `out_dir`: path to save the converted png files for the volumes and the segmentations\n
+        - `processes`: the number of processes converting the cases in parallel, by default the cases are converted one after the other\n
+        - `paired`: if True, each volume is converted together with its segmentation (see `convert_pairs_dir`), the rejected cases are never written and the results are saved in `out_dir/manifest.json`, so `delete_none_converted` is not needed\n
+        - `shard_format`, `shard_size`: in the paired mode, write the slices in 'tar' (WebDataset) or 'npz' shards of `shard_size` slices instead of png files (see `convert_pairs_dir`)\n
         '''
+        if shard_format and not paired:
+            raise ValueError('The shards are written in the paired mode only, use paired=True.')
+
+        if paired:
+            if not (in_dir_vol and in_dir_seg):
+                raise ValueError('The paired mode needs both the volume and the segmentation directories.')
+            print("Converting volume and segmentation files")
+            manifest = self.convert_pairs_dir(in_dir_vol, in_dir_seg, out_dir, processes=processes, shard_format=shard_format, shard_size=shard_size)
+            print(f"INFO: the conversions is done with {manifest['converted']} cases converted and {manifest['rejected']} cases rejected.")
+            return
 
         if in_dir_vol:
             print("Converting volume files")
-            self.convert_nifti_to_png_dir(in_dir_vol, out_dir + '/images', 'vol') # convert the volumes
+            self.convert_nifti_to_png_dir(in_dir_vol, out_dir + '/images', 'vol', processes=processes) # convert the volumes
         
         if in_dir_seg:
             print("Converting segmentation files")
-            self.convert_nifti_to_png_dir(in_dir_seg, out_dir + '/labels', 'seg') # convert the segmentation files
+            self.convert_nifti_to_png_dir(in_dir_seg, out_dir + '/labels', 'seg', processes=processes) # convert the segmentation files
 
         # Delete the none converted files
         if delete_none_converted:
@@ -4,21 +4,86 @@
 
 
 import os
+import json
+import time
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 import vtk
 import vedo
 import nibabel as nib
+from scipy import ndimage
 from skimage import measure, transform
-from vtk.util.numpy_support import vtk_to_numpy
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+from tqdm import tqdm
+from ..utils.parallel import run_jobs
 
 
+# The mesh formats: 'stl' and 'ply' write one binary file per class, 'npz' writes all the classes of a case in one compressed file with quantized vertices
+MESH_FORMATS = ('stl', 'ply', 'npz')
+
+
+def write_mesh(polydata, path, mesh_format='stl'):
+    '''
+    Writes a surface (vtkPolyData) as a binary stl or ply file, `path` is given without the extension. Returns the path of the file.
+    '''
+    writer = vtk.vtkPLYWriter() if mesh_format == 'ply' else vtk.vtkSTLWriter()
+    writer.SetInputData(polydata)
+    writer.SetFileTypeToBinary()
+    writer.SetFileName(f'{path}.{mesh_format}')
+    writer.Write()
+    return f'{path}.{mesh_format}'
+
+
+def polydata_to_arrays(polydata):
+    '''
+    Returns the vertices (n, 3) and the triangles (m, 3) of a triangulated surface (vtkPolyData).
+    '''
+    if polydata.GetNumberOfPoints() == 0:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int64)
+    vertices = vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float32)
+    triangles = vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    return vertices, triangles
+
+
+def write_quantized_meshes(meshes, path, bits=16):
+    '''
+    Writes the meshes of all the classes of a case in one compressed npz file, `meshes` is a dict {class value: (vertices, triangles)}.
+    The vertices are quantized on `bits` bits (16 or 8) in the bounding box of all the meshes: the error is at most half of the size of the box divided by 2**bits - 1.
+    The triangles are stored with the smallest unsigned integer type that fits. The file can be read with `read_quantized_meshes`.
+    '''
+    vertices_dtype = np.uint16 if bits == 16 else np.uint8
+    all_vertices = [vertices for vertices, _ in meshes.values() if len(vertices)]
+    origin = np.min([vertices.min(axis=0) for vertices in all_vertices], axis=0) if all_vertices else np.zeros(3)
+    extent = np.max([vertices.max(axis=0) for vertices in all_vertices], axis=0) - origin if all_vertices else np.zeros(3)
+    scale = np.where(extent > 0, extent, 1) / (2 ** bits - 1)
+
+    arrays = {'labels': np.array(sorted(meshes), dtype=np.int64), 'origin': origin.astype(np.float64), 'scale': scale.astype(np.float64)}
+    for class_value, (vertices, triangles) in meshes.items():
+        arrays[f'vertices_{class_value}'] = np.rint((vertices - origin) / scale).astype(vertices_dtype)
+        arrays[f'triangles_{class_value}'] = triangles.astype(np.min_scalar_type(max(len(vertices) - 1, 0)))
+    np.savez_compressed(path if path.endswith('.npz') else f'{path}.npz', **arrays)
+    return path if path.endswith('.npz') else f'{path}.npz'
+
+
+def read_quantized_meshes(path):
+    '''
+    Reads a file written by `write_quantized_meshes` and returns a dict {class value: (vertices (float32), triangles)}.
+    '''
+    with np.load(path) as archive:
+        origin, scale = archive['origin'], archive['scale']
+        return {int(class_value): ((archive[f'vertices_{class_value}'] * scale + origin).astype(np.float32), archive[f'triangles_{class_value}'].astype(np.int64))
+                for class_value in archive['labels']}
+
 
 class Nifti2StlConverter:
     '''
     This converter is for nifti to stl file(s). There are multiple methods done here, some using vtk and another using vedo.\n
     - `nifti2stl_vtk`: convert one nifti file to one stl file (all the classes will be considered as one class and color)
-    - `nifti2stl_vedo`: convert one nifti file to one or multiple stl files (depending on the number of classes), this approach helps create an stl file with small file size (but a small mesh also)
-    - `nifti2stl_vtk_multi_class`: convert one nifti file to one or multiple stl files by keeping the exact mesh size, but this can lead to a large file size.\n
+    - `nifti2stl_vedo`: convert one nifti file to one or multiple stl files (depending on the number of classes), this approach helps create an stl file with small file size (but a small mesh also). Each class is meshed only in its bounding box, and the classes can be meshed in parallel processes (`workers`). `nifti2stl_vedo_dir` does the same for a whole directory of label maps.
+    - `nifti2stl_vtk_multi_class`: convert one nifti file to one or multiple stl files by keeping the exact mesh size, but this can lead to a large file size. With `engine='discrete'` the surfaces of all the classes are extracted in one pass.\n
+    With `lod_levels`, `nifti2stl_vtk_multi_class` writes several levels of detail of each class from a single extraction, with an index file.\n
+    All the methods take a `mesh_format`: 'stl' (binary, default) or 'ply' (binary) for one file per class, or 'npz' for all the classes of a case in one compressed file with quantized vertices.\n
 
     ### Example of usage:
     ```
@@ -39,7 +104,13 @@ class Nifti2StlConverter:
         self.case_name = os.path.basename(in_dir).split('.')[0]
         os.makedirs(self.out_dir, exist_ok=True)
 
-    def nifti2stl_vtk(self):
+    def nifti2stl_vtk(self, mesh_format='stl'):
+        '''
+        This function converts the foreground of the nifti file to one mesh.\n
+        - `mesh_format`: 'stl' (binary), 'ply' (binary) or 'npz' (compressed file with quantized vertices, see `write_quantized_meshes`)
+        '''
+        if mesh_format not in MESH_FORMATS:
+            raise ValueError(f'The mesh format {mesh_format} is not supported, choose one of {list(MESH_FORMATS)}.')
         reader = vtk.vtkNIFTIImageReader()
         reader.SetFileName(self.in_dir)
         reader.Update()
@@ -65,52 +136,203 @@ class Nifti2StlConverter:
         smoother.NormalizeCoordinatesOn()
         smoother.Update()
 
-        writer = vtk.vtkSTLWriter()
-        writer.SetInputConnection(smoother.GetOutputPort())
-        writer.SetFileName(f'{self.out_dir}/{self.case_name}.stl')
-        writer.Write()
-
-    def nifti2stl_vedo(self):
-        nifti_img = nib.load(self.in_dir)
-        volume = nifti_img.get_fdata()
-
-        classes = np.unique(volume)[1:]
-
-        for class_value in classes:
-            if int(class_value) != 0:
-                segmented_volume = np.zeros(volume.shape)
-                segmented_volume[volume == int(class_value)] = 1
+        if mesh_format == 'npz':
+            write_quantized_meshes({1: polydata_to_arrays(smoother.GetOutput())}, f'{self.out_dir}/{self.case_name}')
+        else:
+            write_mesh(smoother.GetOutput(), f'{self.out_dir}/{self.case_name}', mesh_format)
 
-                temp = transform.downscale_local_mean(segmented_volume, (2, 2, 2))
-
-                verts, faces, normals, _ = measure.marching_cubes(temp, 0)
-
-                mesh = vedo.Mesh([verts, faces])
-
-                smoother = vtk.vtkWindowedSincPolyDataFilter()
-                smoother.SetInputData(mesh.polydata())
-                smoother.SetNumberOfIterations(150)
-                smoother.BoundarySmoothingOn()
-                smoother.FeatureEdgeSmoothingOff()
-                smoother.SetFeatureAngle(120.0)
-                smoother.SetPassBand(0.05)
-                smoother.NonManifoldSmoothingOn()
-                smoother.NormalizeCoordinatesOn()
-                smoother.Update()
-
-                mesh_smoothed = vedo.Mesh(smoother.GetOutput())
+    @staticmethod
+    def label_bounding_boxes(labels, pad=2, align=2):
+        '''
+        This function returns the bounding box of each class of a label map (integer array) as a tuple of slices, all the boxes are found in one pass over the volume.\n
+        - `pad`: the number of background voxels kept around each class, so that the surfaces stay closed
+        - `align`: the starts of the boxes are multiples of `align`, so that the downsampling blocks of a box are the ones of the whole volume
+        '''
+        boxes = {}
+        for class_value, box in enumerate(ndimage.find_objects(labels), start=1):
+            if box is None:
+                continue
+            boxes[class_value] = tuple(slice(max(0, (axis.start - pad) // align * align), min(size, -(-(axis.stop + pad) // align) * align))
+                                       for axis, size in zip(box, labels.shape))
+        return boxes
 
-                filename = f"{self.out_dir}/{self.case_name}_{int(class_value)}.stl"
-                mesh_smoothed.write(filename)
+    def nifti2stl_vedo(self, workers=None, mesh_format='stl'):
+        '''
+        This function converts each class of the nifti file to a mesh (downsampled by 2, then smoothed with 150 iterations).\n
+        - `workers`: the number of processes meshing the classes in parallel, by default the classes are meshed one after the other
+        - `mesh_format`: 'stl' (binary) or 'ply' (binary) for one file per class, or 'npz' for all the classes in one compressed file with quantized vertices (see `write_quantized_meshes`)
 
-    def nifti2stl_vtk_multi_class(self, smoothing=True, reduce_meshes=True, number_of_iterations=50, percent_reductions=0.5):
+        Returns the record of each class (see `mesh_class`).
+        '''
+        if mesh_format not in MESH_FORMATS:
+            raise ValueError(f'The mesh format {mesh_format} is not supported, choose one of {list(MESH_FORMATS)}.')
+        jobs = [job + (150, mesh_format) for job in self.class_jobs(self.in_dir, self.out_dir)]
+        records = run_jobs(self.mesh_class, jobs, workers=workers)
+        if mesh_format == 'npz':
+            self.write_case_meshes(self.case_name, records, self.out_dir)
+        return records
+
+    def nifti2stl_vedo_dir(self, in_dir=None, workers=None, number_of_iterations=150, mesh_format='stl'):
+        '''
+        This function is the directory version of `nifti2stl_vedo`: all the classes of all the label maps of a directory are meshed as (case, class) jobs, in a pool of `workers` processes.
+        The meshes are written by the processes as soon as they are ready, and the records of the meshes (vertex and face counts, timings) are saved in `out_dir/manifest.json`.
+        A label map that cannot be loaded gets one error record (with `label` None), and the manifest is always written, even if the run is interrupted.\n
+        - `in_dir`: the directory of the nifti label maps (.nii or .nii.gz), by default the `in_dir` of the converter
+        - `workers`: the number of processes, by default the meshes are done one after the other
+        - `number_of_iterations`: the number of iterations of the smoothing
+        - `mesh_format`: 'stl', 'ply' or 'npz' (see `nifti2stl_vedo`), the npz file of a case is written as soon as all its classes are meshed
+
+        Returns the manifest.
+        '''
+        if mesh_format not in MESH_FORMATS:
+            raise ValueError(f'The mesh format {mesh_format} is not supported, choose one of {list(MESH_FORMATS)}.')
+        in_dir = in_dir or self.in_dir
+        cases = sorted(case for case in glob(os.path.join(in_dir, '*')) if case.endswith('.nii') or case.endswith('.nii.gz'))
+
+        start = time.perf_counter()
+        records = []
+        case_records = {}  # the records of the cases that are not complete yet (npz)
+        case_sizes = {}  # the number of classes of each case, known once all its jobs are submitted
+
+        def collect(record, bar):
+            records.append(record)
+            bar.update()
+            if mesh_format == 'npz':
+                case_records.setdefault(record['case'], []).append(record)
+                write_complete_case(record['case'])
+
+        def write_complete_case(case_name):
+            if case_name in case_records and len(case_records[case_name]) == case_sizes.get(case_name):
+                self.write_case_meshes(case_name, case_records.pop(case_name), self.out_dir)
+
+        try:
+            with tqdm(desc='Meshes') as bar:
+                pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+                try:
+                    # The cases are loaded while the processes mesh the classes of the previous ones, with a limited number of crops waiting in the queue
+                    pending = set()
+                    for case in cases:
+                        case_name = os.path.basename(case).split('.')[0]
+                        case_start = time.perf_counter()
+                        n_jobs = 0
+                        try:
+                            for job in self.class_jobs(case, self.out_dir):
+                                n_jobs += 1
+                                if pool is None:
+                                    collect(self.mesh_class(*job, number_of_iterations, mesh_format), bar)
+                                    continue
+                                pending.add(pool.submit(self.mesh_class, *job, number_of_iterations, mesh_format))
+                                if len(pending) >= 2 * workers:
+                                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                                    for future in done:
+                                        collect(future.result(), bar)
+                        except Exception as e:
+                            # The label map cannot be loaded, the case is recorded as an error and the next cases are meshed
+                            records.append({'case': case_name, 'label': None, 'path': case, 'status': 'error', 'n_vertices': 0, 'n_faces': 0,
+                                            'error': str(e), 'seconds': round(time.perf_counter() - case_start, 3)})
+                        case_sizes[case_name] = n_jobs
+                        write_complete_case(case_name)
+                    for future in wait(pending)[0]:
+                        collect(future.result(), bar)
+                finally:
+                    if pool is not None:
+                        pool.shutdown()
+        finally:
+            # The manifest is written even if the run is interrupted, with the records of the meshes done so far
+            records.sort(key=lambda record: (record['case'], -1 if record['label'] is None else record['label']))
+            manifest = {
+                'cases': len(cases),
+                'meshes': sum(record['label'] is not None for record in records),
+                'errors': sum(record['status'] == 'error' for record in records),
+                'seconds': round(time.perf_counter() - start, 3),
+                'records': records,
+            }
+            with open(os.path.join(self.out_dir, 'manifest.json'), 'w') as outfile:
+                json.dump(manifest, outfile, indent=4)
+        return manifest
+
+    def class_jobs(self, in_path, out_dir):
+        '''
+        This function loads a label map and yields the arguments of `mesh_class` for each class: the class is cropped to its bounding box (see `label_bounding_boxes`), so only a small boolean array is sent to the processes.
+        '''
+        case_name = os.path.basename(in_path).split('.')[0]
+        labels = np.asanyarray(nib.load(in_path).dataobj)
+        if labels.dtype.kind not in 'iu':
+            labels = np.rint(labels).astype(np.int32)
+
+        for class_value, box in self.label_bounding_boxes(labels).items():
+            # The offset moves the vertices back to the (downsampled) grid of the whole volume
+            offset = [axis.start // 2 for axis in box]
+            yield case_name, class_value, labels[box] == class_value, offset, f"{out_dir}/{case_name}_{int(class_value)}"
+
+    @staticmethod
+    def mesh_class(case_name, class_value, segmented_volume, offset, path, number_of_iterations=150, mesh_format='stl'):
+        '''
+        This function meshes one class (a boolean array cropped around the class) and writes it in `path` (without the extension) as an stl or ply file.
+        For the 'npz' format nothing is written, the vertices and the triangles are returned in the record ('mesh') to be written with the other classes by `write_case_meshes`.
+        Returns the record of the mesh: the case, the class, the file path, the vertex and face counts, the time and the status ('done' or 'error' with the error message).
+        '''
+        start = time.perf_counter()
+        record = {'case': case_name, 'label': int(class_value), 'path': None, 'status': 'done', 'n_vertices': 0, 'n_faces': 0}
+        try:
+            temp = transform.downscale_local_mean(segmented_volume, (2, 2, 2))
+
+            verts, faces, normals, _ = measure.marching_cubes(temp, 0)
+            verts += np.array(offset, dtype=verts.dtype)
+
+            mesh = vedo.Mesh([verts, faces])
+
+            smoother = vtk.vtkWindowedSincPolyDataFilter()
+            smoother.SetInputData(mesh.polydata())
+            smoother.SetNumberOfIterations(number_of_iterations)
+            smoother.BoundarySmoothingOn()
+            smoother.FeatureEdgeSmoothingOff()
+            smoother.SetFeatureAngle(120.0)
+            smoother.SetPassBand(0.05)
+            smoother.NonManifoldSmoothingOn()
+            smoother.NormalizeCoordinatesOn()
+            smoother.Update()
+
+            if mesh_format == 'npz':
+                record['mesh'] = polydata_to_arrays(smoother.GetOutput())
+            else:
+                record['path'] = write_mesh(smoother.GetOutput(), path, mesh_format)
+
+            record['n_vertices'] = smoother.GetOutput().GetNumberOfPoints()
+            record['n_faces'] = smoother.GetOutput().GetNumberOfPolys()
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+        record['seconds'] = round(time.perf_counter() - start, 3)
+        return record
+
+    @staticmethod
+    def write_case_meshes(case_name, records, out_dir):
+        '''
+        This function writes the meshes returned in the records of `mesh_class` (npz format) in one file `out_dir/case_name.npz`, and sets the path of the records.
+        '''
+        meshes = {record['label']: record.pop('mesh') for record in records if 'mesh' in record}
+        path = write_quantized_meshes(meshes, f'{out_dir}/{case_name}')
+        for record in records:
+            if record['status'] == 'done':
+                record['path'] = path
+        return path
+
+    def nifti2stl_vtk_multi_class(self, smoothing=True, reduce_meshes=True, number_of_iterations=50, percent_reductions=0.5, engine='contour', mesh_format='stl', lod_levels=None):
         '''
         This function is to convert one nifti file to stl file(s) using vtk only. This function require additional arguments to control the smoothing...\n
         - `smoothing`: a boolean to indicate whether you want to apply smoothing or not
         - `reduce_meshes`: a boolean to indicate whether you want to reduce the mesh, this helps you get a small file size (if you have a large mesh)
         - `number_of_interations`: this coefficient belongs to the smoothing algorithm, more iterations applied means more smooth mesh
         - `percent_reductions`: this coefficient belongs to the reduction algorithm, which means how much you want to reduce the mesh
+        - `engine`: 'contour' thresholds the volume and extracts a contour for each class (one pass over the volume per class), 'discrete' extracts the surfaces of all the classes in one pass with the discrete marching cubes of vtk and then splits them by class
+        - `mesh_format`: 'stl' (binary) or 'ply' (binary) for one file per class, or 'npz' for all the classes in one compressed file with quantized vertices (see `write_quantized_meshes`)
+        - `lod_levels`: the fractions of the triangles kept in each level of detail, for example (1.0, 0.25, 0.05). The surface of each class is extracted and smoothed once, then decimated level after level (`reduce_meshes` and `percent_reductions` are not used), and the levels are listed in `case_lod.json` (see `write_lod_levels`)
         '''
+        if mesh_format not in MESH_FORMATS:
+            raise ValueError(f'The mesh format {mesh_format} is not supported, choose one of {list(MESH_FORMATS)}.')
+        if lod_levels is not None and not all(0 < fraction <= 1 for fraction in lod_levels):
+            raise ValueError(f'The levels of detail {lod_levels} should be fractions of the triangles, between 0 (excluded) and 1.')
         reader = vtk.vtkNIFTIImageReader()
         reader.SetFileName(self.in_dir)
         reader.Update()
@@ -118,76 +340,163 @@ class Nifti2StlConverter:
         image_data = reader.GetOutput()
         np_array = vtk_to_numpy(image_data.GetPointData().GetScalars())
         unique_values = np.unique(np_array)
+        unique_values = unique_values[unique_values != 0]
+
+        if engine == 'discrete':
+            surfaces = self.discrete_surfaces(reader.GetOutputPort(), unique_values)
+        elif engine == 'contour':
+            surfaces = ((value, self.contour_surface(reader.GetOutputPort(), value)) for value in unique_values)
+        else:
+            raise ValueError(f"The engine {engine} is not supported, choose 'contour' or 'discrete'.")
+
+        if lod_levels is not None:
+            surfaces = ((value, self.process_surface(surface, smoothing, False, number_of_iterations)) for value, surface in surfaces)
+            return self.write_lod_levels(surfaces, lod_levels, mesh_format)
+
+        meshes = {}
+        for value, surface in surfaces:
+            output = self.process_surface(surface, smoothing, reduce_meshes, number_of_iterations, percent_reductions)
+            if mesh_format == 'npz':
+                meshes[int(value)] = polydata_to_arrays(output)
+            else:
+                write_mesh(output, f"{self.out_dir}/{self.case_name}_{int(value)}", mesh_format)
+        if mesh_format == 'npz':
+            write_quantized_meshes(meshes, f"{self.out_dir}/{self.case_name}")
 
-        for value in unique_values:
-            if value == 0:
-                continue
+    def write_lod_levels(self, surfaces, lod_levels, mesh_format='stl'):
+        '''
+        This function writes the levels of detail of the surfaces of the classes, `surfaces` yields (class value, vtkPolyData) and `lod_levels` are the fractions of the triangles kept in each level.
+        The levels are sorted from the finest (lod0) to the coarsest, and each level is decimated from the previous one, so the surfaces are extracted only once.
+        The files are named `case_value_lod0.stl` ('stl' and 'ply') or `case_lod0.npz` (all the classes of a level in one file for 'npz'), and the index `case_lod.json` gives for each level its fraction, and for each class its files with their vertex and face counts (the paths are relative to the index).
 
-            thresh = vtk.vtkImageThreshold ()
-            thresh.SetInputConnection(reader.GetOutputPort())
-            thresh.ThresholdBetween(value, value)
-            thresh.ReplaceInOn()
-            thresh.SetInValue(value)
-            thresh.ReplaceOutOn()
-            thresh.SetOutValue(0)
-            thresh.Update()
-
-            contour = vtk.vtkContourFilter()
-            contour.SetInputConnection(thresh.GetOutputPort())
-            contour.SetValue(0, value)
-        
-            if smoothing and reduce_meshes:
-                smoother = vtk.vtkWindowedSincPolyDataFilter()
-                smoother.SetInputConnection(contour.GetOutputPort())
-                smoother.SetNumberOfIterations(number_of_iterations)
-                smoother.BoundarySmoothingOn()
-                smoother.FeatureEdgeSmoothingOff()
-                smoother.SetFeatureAngle(120.0)
-                smoother.SetPassBand(0.05)
-                smoother.NonManifoldSmoothingOn()
-                smoother.NormalizeCoordinatesOn()
-                smoother.Update()
-
-                decimate = vtk.vtkDecimatePro()
-                decimate.SetInputConnection(smoother.GetOutputPort())
-                decimate.SetTargetReduction(percent_reductions)
-                decimate.Update()
-
-                writer = vtk.vtkSTLWriter()
-                writer.SetInputConnection(decimate.GetOutputPort())
-                writer.SetFileName(f"{self.out_dir}/{self.case_name}_{int(value)}.stl")
-                writer.Write()
-        
-            elif smoothing:
-                smoother = vtk.vtkWindowedSincPolyDataFilter()
-                smoother.SetInputConnection(contour.GetOutputPort())
-                smoother.SetNumberOfIterations(number_of_iterations)
-                smoother.BoundarySmoothingOn()
-                smoother.FeatureEdgeSmoothingOff()
-                smoother.SetFeatureAngle(120.0)
-                smoother.SetPassBand(0.05)
-                smoother.NonManifoldSmoothingOn()
-                smoother.NormalizeCoordinatesOn()
-                smoother.Update()
-
-                writer = vtk.vtkSTLWriter()
-                writer.SetInputConnection(smoother.GetOutputPort())
-                writer.SetFileName(f"{self.out_dir}/{self.case_name}_{int(value)}.stl")
-                writer.Write()
-        
-            elif reduce_meshes:
-                decimate = vtk.vtkDecimatePro()
-                decimate.SetInputConnection(contour.GetOutputPort())
-                decimate.SetTargetReduction(percent_reductions)
-                decimate.Update()
-
-                writer = vtk.vtkSTLWriter()
-                writer.SetInputConnection(decimate.GetOutputPort())
-                writer.SetFileName(f"{self.out_dir}/{self.case_name}_{int(value)}.stl")
-                writer.Write()
-        
-            else:
-                writer = vtk.vtkSTLWriter()
-                writer.SetInputConnection(contour.GetOutputPort())
-                writer.SetFileName(f"{self.out_dir}/{self.case_name}_{int(value)}.stl")
-                writer.Write()
\ No newline at end of file
+        Returns the index.
+        '''
+        lod_levels = sorted(set(lod_levels), reverse=True)
+        classes = []
+        meshes = [{} for _ in lod_levels]
+        for value, surface in surfaces:
+            levels = []
+            output, previous = surface, 1.0
+            for level, fraction in enumerate(lod_levels):
+                if fraction < previous:
+                    output = self.decimate_surface(output, 1 - fraction / previous)
+                    previous = fraction
+                if mesh_format == 'npz':
+                    meshes[level][int(value)] = polydata_to_arrays(output)
+                    path = f'{self.case_name}_lod{level}.npz'
+                else:
+                    path = os.path.basename(write_mesh(output, f"{self.out_dir}/{self.case_name}_{int(value)}_lod{level}", mesh_format))
+                levels.append({'path': path, 'n_vertices': output.GetNumberOfPoints(), 'n_faces': output.GetNumberOfPolys()})
+            classes.append({'label': int(value), 'levels': levels})
+
+        if mesh_format == 'npz':
+            for level, level_meshes in enumerate(meshes):
+                write_quantized_meshes(level_meshes, f'{self.out_dir}/{self.case_name}_lod{level}')
+
+        index = {
+            'case': self.case_name,
+            'format': mesh_format,
+            'levels': [{'level': level, 'fraction': fraction} for level, fraction in enumerate(lod_levels)],
+            'classes': classes,
+        }
+        with open(os.path.join(self.out_dir, f'{self.case_name}_lod.json'), 'w') as outfile:
+            json.dump(index, outfile, indent=4)
+        return index
+
+    @staticmethod
+    def contour_surface(image_port, value):
+        '''
+        This function extracts the surface of one class: the volume is thresholded to keep only the class, then contoured at the class value.
+        '''
+        thresh = vtk.vtkImageThreshold ()
+        thresh.SetInputConnection(image_port)
+        thresh.ThresholdBetween(value, value)
+        thresh.ReplaceInOn()
+        thresh.SetInValue(value)
+        thresh.ReplaceOutOn()
+        thresh.SetOutValue(0)
+
+        contour = vtk.vtkContourFilter()
+        contour.SetInputConnection(thresh.GetOutputPort())
+        contour.SetValue(0, value)
+        contour.Update()
+        return contour.GetOutput()
+
+    @staticmethod
+    def discrete_surfaces(image_port, values):
+        '''
+        This function extracts the surfaces of all the classes `values` in one pass over the volume with the discrete marching cubes of vtk, and yields (value, surface) for each class.
+        The triangles are split by their class value, in one sort of the triangles.
+        (`vtkDiscreteFlyingEdges3D` does one pass over the volume per class, which is slower when there are many classes.)
+        '''
+        marching_cubes = vtk.vtkDiscreteMarchingCubes()
+        marching_cubes.SetInputConnection(image_port)
+        for i, value in enumerate(values):
+            marching_cubes.SetValue(i, value)
+        marching_cubes.ComputeNormalsOff()
+        marching_cubes.ComputeGradientsOff()
+        marching_cubes.ComputeScalarsOn()
+        marching_cubes.Update()
+        output = marching_cubes.GetOutput()
+        if output.GetNumberOfCells() == 0:
+            return
+
+        points = vtk_to_numpy(output.GetPoints().GetData())
+        triangle_values = vtk_to_numpy(output.GetCellData().GetScalars())
+        triangles = vtk_to_numpy(output.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+
+        order = np.argsort(triangle_values, kind='stable')
+        split_values, starts = np.unique(triangle_values[order], return_index=True)
+        for value, class_triangles in zip(split_values, np.split(triangles[order], starts[1:])):
+            # Keep only the points of the class (the points between two classes are shared in the output), renumbered in their original order
+            used_points, class_triangles = np.unique(class_triangles, return_inverse=True)
+            yield value, Nifti2StlConverter.make_polydata(points[used_points], class_triangles.reshape(-1, 3))
+
+    @staticmethod
+    def make_polydata(points, triangles):
+        '''
+        This function builds a vtkPolyData from the arrays of the points (n, 3) and of the triangles (m, 3).
+        '''
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_to_vtk(np.ascontiguousarray(points), deep=True))
+        cells = vtk.vtkCellArray()
+        offsets = np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64)
+        cells.SetData(numpy_to_vtkIdTypeArray(offsets, deep=True), numpy_to_vtkIdTypeArray(np.ascontiguousarray(triangles, dtype=np.int64).ravel(), deep=True))
+        polydata = vtk.vtkPolyData()
+        polydata.SetPoints(vtk_points)
+        polydata.SetPolys(cells)
+        return polydata
+
+    @staticmethod
+    def process_surface(surface, smoothing=True, reduce_meshes=True, number_of_iterations=50, percent_reductions=0.5):
+        '''
+        This function smooths and reduces (optionally) a surface (vtkPolyData) and returns it.
+        '''
+        output = surface
+        if smoothing:
+            smoother = vtk.vtkWindowedSincPolyDataFilter()
+            smoother.SetInputData(output)
+            smoother.SetNumberOfIterations(number_of_iterations)
+            smoother.BoundarySmoothingOn()
+            smoother.FeatureEdgeSmoothingOff()
+            smoother.SetFeatureAngle(120.0)
+            smoother.SetPassBand(0.05)
+            smoother.NonManifoldSmoothingOn()
+            smoother.NormalizeCoordinatesOn()
+            smoother.Update()
+            output = smoother.GetOutput()
+
+        if reduce_meshes:
+            output = Nifti2StlConverter.decimate_surface(output, percent_reductions)
+        return output
+
+    @staticmethod
+    def decimate_surface(surface, target_reduction):
+        '''
+        This function reduces the number of triangles of a surface (vtkPolyData) by the fraction `target_reduction` and returns it.
+        '''
+        decimate = vtk.vtkDecimatePro()
+        decimate.SetInputData(surface)
+        decimate.SetTargetReduction(target_reduction)
+        decimate.Update()
+        return decimate.GetOutput()
@@ -3,16 +3,20 @@
 # https://github.com/amine0110/pycad/blob/main/LICENSE
 
 
-import SimpleITK as sitk
 import os
 import logging
 from glob import glob
+from .engine import convert
 
 class NrrdToNiftiConverter:
 
     """
     This converter converts the NRRD files into NIFTI format.
 
+    Params:
+    - compress_level: the gzip compression level of the `.nii.gz` outputs, which are compressed by blocks on multiple threads. With 0, the outputs are written as uncompressed `.nii` files.
+    - threads: the number of threads compressing the outputs, by default the number of CPUs.
+
     ## Example of usage:
     ```Python
     from pycad.converters import NrrdToNiftiConverter
@@ -23,7 +27,9 @@ class NrrdToNiftiConverter:
     converter.convert(input_path, output_dir)
     ```
     """
-    def __init__(self):
+    def __init__(self, compress_level=6, threads=None):
+        self.compress_level = compress_level
+        self.threads = threads
         # Initialize the logger
         self.logger = logging.getLogger('NrrdToNiftiConverter')
         self.logger.setLevel(logging.INFO)
@@ -50,16 +56,15 @@ class NrrdToNiftiConverter:
         Converts a single NRRD file to a NIfTI file.
         """
         try:
-            # Read the NRRD image
-            nrrd_image = sitk.ReadImage(input_file_path)
-
             # Generate the corresponding output file path with .nii extension
             base_name = os.path.basename(input_file_path).split('.')[0]
-            output_file_path = os.path.join(output_dir, f'{base_name}.nii.gz')
+            extension = '.nii.gz' if self.compress_level else '.nii'
+            output_file_path = os.path.join(output_dir, f'{base_name}{extension}')
 
-            # Write the image as a NIfTI file
-            sitk.WriteImage(nrrd_image, output_file_path)
-            self.logger.info(f'Converted {input_file_path} to {output_file_path}')
+            # Read the NRRD image and write it as a NIfTI file
+            report = convert(input_file_path, output_file_path, to='nifti', src_format='nrrd',
+                             compress_level=self.compress_level, threads=self.threads)
+            self.logger.info(f'Converted {input_file_path} to {output_file_path} ({report["timings"]})')
         except Exception as e:
             self.logger.error(f'Failed to convert {input_file_path}: {e}')
 
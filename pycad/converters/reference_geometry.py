@@ -0,0 +1,89 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import numpy as np
+import SimpleITK as sitk
+from pydicom import dcmread
+from .dicom_index import DicomIndex
+from ..utils.nifti_writer import write_nifti
+
+
+class ReferenceGeometry:
+    '''
+    The class ReferenceGeometry holds the geometry of a reference DICOM series (the series a SEG or an RTSTRUCT was drawn on), read from the headers of the files only (the pixel data is never read).
+    The series is found and sorted along the normal of the slices by a `DicomIndex`, and the label volumes built on this geometry have the shape (slices, rows, columns), like the arrays of SimpleITK.\n
+
+    Params:
+    - dicom_dir: the directory of the series, it is scanned recursively.
+    - series_uid: the SeriesInstanceUID of the reference series, to ignore the other files of the directory (for example the SEG or the RTSTRUCT itself), by default the series with the most images is used.
+    - workers: the number of threads reading the headers.
+    '''
+
+    IMAGE_TAGS = ['PixelSpacing', 'Rows', 'Columns']
+
+    def __init__(self, dicom_dir, series_uid=None, workers=None):
+        # The instances with a position and an orientation are images, the SEG and RTSTRUCT files of the directory are not
+        series = {uid: [instance for instance in instances if instance[4] and instance[5] and instance[6]]
+                  for uid, instances in DicomIndex(dicom_dir, workers=workers).scan().items()}
+        if series_uid is None and series:
+            series_uid = max(series, key=lambda uid: len(series[uid]))
+        instances = series.get(series_uid)
+        if not instances:
+            raise ValueError(f'No image of the series {series_uid} was found in {dicom_dir}.')
+        instances = DicomIndex.sort_instances(instances)
+
+        orientation = np.array(instances[0][5], dtype=np.float64)
+        self.row_direction, self.column_direction = orientation[:3], orientation[3:]
+        self.normal = np.cross(self.row_direction, self.column_direction)
+
+        self.series_uid = series_uid
+        self.uids = [instance[6] for instance in instances]
+        self.index = {uid: i for i, uid in enumerate(self.uids)}
+        self.positions = np.array([instance[4] for instance in instances], dtype=np.float64)
+        self.origin = self.positions[0]
+
+        # The slices need distinct positions to define the spacing along the normal (and an invertible geometry)
+        gaps = np.diff(self.positions @ self.normal)
+        if len(gaps) and gaps.min() < 1e-4:
+            raise ValueError(f'The series {series_uid} has slices at the same position (duplicate or zero slice spacing), '
+                             f'the smallest spacing is {gaps.min():.6f} mm, so it has no regular geometry.')
+
+        first = dcmread(instances[0][0], stop_before_pixels=True, specific_tags=self.IMAGE_TAGS)
+        self.shape = (len(instances), int(first.Rows), int(first.Columns))
+
+        # The spacing along the columns (x), the rows (y) and the slices (z)
+        row_spacing, column_spacing = (float(v) for v in first.PixelSpacing)
+        slice_spacing = float(gaps.mean()) if len(gaps) else 1.0
+        self.spacing = (column_spacing, row_spacing, slice_spacing)
+
+        self.pixel_to_patient = np.identity(4)
+        self.pixel_to_patient[:3, 0] = self.row_direction * column_spacing
+        self.pixel_to_patient[:3, 1] = self.column_direction * row_spacing
+        self.pixel_to_patient[:3, 2] = self.normal * slice_spacing
+        self.pixel_to_patient[:3, 3] = self.origin
+        self.patient_to_pixel = np.linalg.inv(self.pixel_to_patient)
+
+    def to_pixels(self, points):
+        '''
+        Converts an (n, 3) array of patient coordinates (mm) to (column, row, slice) coordinates in the volume.
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        return points @ self.patient_to_pixel[:3, :3].T + self.patient_to_pixel[:3, 3]
+
+    def slice_of(self, position):
+        '''
+        Returns the index of the slice closest to a patient position.
+        '''
+        return int(np.rint(self.to_pixels(position)[0, 2]))
+
+    def save_nifti(self, volume, output_path):
+        '''
+        Saves a (slices, rows, columns) volume as a nifti file in the geometry of the series, so it overlays the nifti file converted from the series.
+        '''
+        image = sitk.GetImageFromArray(volume)
+        image.SetOrigin(tuple(float(v) for v in self.origin))
+        image.SetSpacing(self.spacing)
+        image.SetDirection(tuple(float(v) for v in np.stack([self.row_direction, self.column_direction, self.normal], axis=1).ravel()))
+        write_nifti(image, output_path)
@@ -8,4 +8,5 @@ from .png_to_txt_ml import PngToTxtConverterML
 from .data_splitter import DataSplitter
 from .yolo_dataset_yaml import YOLODatasetYaml
 from .monai_dataset_json import MONAIDatasetOrganizer
-from .nifti_merger import MultiClassNiftiMerger
\ No newline at end of file
+from .nifti_merger import MultiClassNiftiMerger
+from .shard_writer import ShardWriter, ShardReader, load_shard_index
\ No newline at end of file
@@ -4,6 +4,7 @@
 
 
 import os
+import json
 import shutil
 import random
 import logging
@@ -49,6 +50,7 @@ class DataSplitter:
     - valid_ratio: the validation ratio, default=0.2
     - test_ratio: the test ratio, default=0.1
     - delete_input: whether you want to delete the input files after split, default=False
+    - shards_dir: the path to shards written by `ShardWriter`, if given the shards are split instead of the images and labels (each split folder gets the shards and an `index.json`, the shards sharing a case stay in the same split), default=None
 
     ### Example of usage:
     ```
@@ -60,8 +62,12 @@ class DataSplitter:
 
     splitter = DataSplitter(img, msk, output, 0.7, 0.2, 0.1, delete_input=False)
     splitter.run()
+
+    # or split the shards of a ShardWriter at the shard level
+    splitter = DataSplitter(output_dir='datasets/dental/split_shards', shards_dir='datasets/dental/shards')
+    splitter.run()
     '''
-    def __init__(self, images_dir, labels_dir, output_dir, train_ratio=0.7, valid_ratio=0.2, test_ratio=0.1, delete_input=False):
+    def __init__(self, images_dir=None, labels_dir=None, output_dir=None, train_ratio=0.7, valid_ratio=0.2, test_ratio=0.1, delete_input=False, shards_dir=None):
         self.images_dir = images_dir
         self.labels_dir = labels_dir
         self.output_dir = output_dir
@@ -69,7 +75,9 @@ class DataSplitter:
         self.valid_ratio = valid_ratio
         self.test_ratio = test_ratio
         self.delete_input = delete_input
-        self.setup_directories()
+        self.shards_dir = shards_dir
+        if self.shards_dir is None:
+            self.setup_directories()
 
     def setup_directories(self):
         self.dirs = {
@@ -90,7 +98,9 @@ class DataSplitter:
         return images, labels
 
     def split_data(self, images, labels):
-        data = list(zip(images, labels))
+        return self.split_items(list(zip(images, labels)))
+
+    def split_items(self, data):
         random.shuffle(data)
         total = len(data)
         train_end = int(total * self.train_ratio)
@@ -109,7 +119,65 @@ class DataSplitter:
                 shutil.copy(os.path.join(self.labels_dir, lbl), self.dirs[split]['labels'])
                 logging.info(f'Copied {img} and {lbl} to {split} set')
 
+    @staticmethod
+    def group_shards(shards):
+        '''
+        Groups the shards that share a group of samples (a case whose slices are in several shards), the shards without groups stay alone.
+        Returns the list of the groups of shards, in the order of the shards.
+        '''
+        parents = list(range(len(shards)))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        first_shard = {}
+        for i, shard in enumerate(shards):
+            for group in shard.get('groups', []):
+                if group in first_shard:
+                    parents[find(i)] = find(first_shard[group])
+                else:
+                    first_shard[group] = i
+
+        units = {}
+        for i, shard in enumerate(shards):
+            units.setdefault(find(i), []).append(shard)
+        return list(units.values())
+
+    def split_shards(self):
+        '''
+        Splits the shards of `shards_dir` into train/valid/test folders, the samples of a shard stay together so only the shard files are copied.
+        The shards sharing a case (the `groups` of the shards written by `ShardWriter`) are kept in the same split, so the slices of a case never leak from train to valid or test.
+        Each split folder gets its shards, their indexes and an `index.json` listing them.
+        '''
+        from .shard_writer import load_shard_index
+
+        index = load_shard_index(self.shards_dir)
+        split_units = self.split_items(self.group_shards(index['shards']))
+        split_shards = {split: [shard for unit in units for shard in unit] for split, units in split_units.items()}
+        for split, shards in split_shards.items():
+            split_dir = os.path.join(self.output_dir, split)
+            os.makedirs(split_dir, exist_ok=True)
+            for shard in shards:
+                shutil.copy(os.path.join(self.shards_dir, shard['name']), split_dir)
+                shutil.copy(os.path.join(self.shards_dir, shard['index']), split_dir)
+                logging.info(f"Copied {shard['name']} to {split} set")
+
+            split_index = dict(index, n_samples=sum(shard['n_samples'] for shard in shards), shards=shards)
+            with open(os.path.join(split_dir, 'index.json'), 'w') as outfile:
+                json.dump(split_index, outfile, indent=4)
+        return split_shards
+
     def run(self):
+        if self.shards_dir is not None:
+            self.split_shards()
+            if self.delete_input:
+                shutil.rmtree(self.shards_dir)
+                logging.info('Deleted original shards directory')
+            return
+
         images, labels = self.get_filenames()
         split_data = self.split_data(images, labels)
         self.copy_files(split_data)
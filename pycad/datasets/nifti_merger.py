@@ -8,6 +8,7 @@ import shutil
 import nibabel as nib
 import numpy as np
 from glob import glob
+from ..utils.nifti_writer import write_nifti
 
 class MultiClassNiftiMerger:
     '''
@@ -19,6 +20,8 @@ class MultiClassNiftiMerger:
     - class_paths: List of paths to the class NIfTI files.
     - output_dir: Directory where the merged files will be saved.
     - move_volumes: Flag to control whether to move corresponding volumes.
+    - compress_level: The gzip compression level of the `.nii.gz` outputs, which are compressed by blocks on multiple threads.
+    - threads: The number of threads compressing the outputs, by default the number of CPUs.
 
     ### Example of usage
 
@@ -33,11 +36,13 @@ class MultiClassNiftiMerger:
     ```
     '''
     
-    def __init__(self, volume_path, class_paths, output_dir, move_volumes=False):
+    def __init__(self, volume_path, class_paths, output_dir, move_volumes=False, compress_level=1, threads=None):
         self.volume_path = volume_path
         self.class_paths = class_paths
         self.output_dir = output_dir
         self.move_volumes = move_volumes
+        self.compress_level = compress_level
+        self.threads = threads
 
         self.segmentations_dir = os.path.join(output_dir, 'segmentations')
         self.volumes_dir = os.path.join(output_dir, 'volumes')
@@ -73,7 +78,7 @@ class MultiClassNiftiMerger:
         # Save the new NIfTI file
         combined_filename = os.path.basename(self.volume_path).replace('volume', 'combined')
         combined_path = os.path.join(self.segmentations_dir, combined_filename)
-        nib.save(combined_nifti, combined_path)
+        write_nifti(combined_nifti, combined_path, compress_level=self.compress_level, threads=self.threads)
 
         # Optionally move the volume file
         if self.move_volumes:
@@ -82,7 +87,7 @@ class MultiClassNiftiMerger:
         print(f"Combined NIfTI file saved at: {combined_path}")
 
     @staticmethod
-    def process_directories(volume_dir, class_dirs, output_dir, ext='.nii.gz', move_volumes=False):
+    def process_directories(volume_dir, class_dirs, output_dir, ext='.nii.gz', move_volumes=False, compress_level=1, threads=None):
         volume_files = glob(os.path.join(volume_dir, f'*{ext}'))
 
         for volume_file in volume_files:
@@ -95,6 +100,8 @@ class MultiClassNiftiMerger:
                     volume_file,
                     class_paths,
                     output_dir,
-                    move_volumes
+                    move_volumes,
+                    compress_level,
+                    threads
                 )
                 merger.combine_classes()
\ No newline at end of file
@@ -0,0 +1,257 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import io
+import os
+import json
+import tarfile
+import logging
+import numpy as np
+from PIL import Image
+
+
+def encode_png(array, compress_level=6):
+    '''
+    Encodes a 2D (gray) or 3D (RGB) uint8 array as png bytes.
+    '''
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(array)).save(buffer, format='PNG', compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def load_shard_index(shard_dir):
+    '''
+    Loads the `index.json` of a shard directory written by `ShardWriter`.
+    '''
+    with open(os.path.join(shard_dir, 'index.json')) as infile:
+        return json.load(infile)
+
+
+class ShardWriter:
+    '''
+    This class writes the samples of a dataset (for example the slices of the volumes with their labels) in shards of a fixed number of samples, instead of one small file per image.
+    On network storage, reading a few big files is much faster than opening millions of small ones.\n
+    Two formats are supported:\n
+    - 'tar': tar archives in the WebDataset layout, the members of a sample are named `key.extension` (for example `case_0012.png` and `case_0012.label.png`), so the shards can be read by WebDataset directly.
+    - 'npz': numpy archives holding the arrays of the samples, named `key.extension` as well.
+    \n
+    Each shard `shard-000000.tar` comes with its index `shard-000000.json` (the offset and size of each member in the tar, for random access), and `index.json` lists all the shards.
+    When the samples are written with a group (for example the case of the slices, see `write_group`), `index.json` also lists the groups of each shard, so `DataSplitter` never puts the samples of a case in two splits.
+
+    ### Params
+    - output_dir: the path to save the shards
+    - shard_size: the number of samples per shard, default=1000
+    - shard_format: 'tar' or 'npz', default='tar'
+    - prefix: the prefix of the shard names, default='shard'
+    - compress_level: the zlib level of the png images encoded from arrays (tar format), default=6
+
+    In a sample, the values can be numpy arrays (encoded as png for the extensions ending with 'png' and as npy otherwise in the tar format), bytes (written as they are) or strings (for example the YOLO txt labels).
+
+    ### Example of usage:
+    ```
+    from pycad.datasets import ShardWriter
+
+    with ShardWriter('datasets/shards', shard_size=1000) as writer:
+        writer.write('case_0012', {'png': image_array, 'label.png': label_array})
+
+    # or to pack an existing images/labels folder (for example a YOLO dataset)
+    ShardWriter('datasets/shards').write_directory('datasets/images', 'datasets/labels')
+    ```
+    '''
+    FORMATS = ('tar', 'npz')
+
+    def __init__(self, output_dir, shard_size=1000, shard_format='tar', prefix='shard', compress_level=6):
+        if shard_format not in self.FORMATS:
+            raise ValueError(f'The shard format {shard_format} is not supported, choose one of {list(self.FORMATS)}.')
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.shard_format = shard_format
+        self.prefix = prefix
+        self.compress_level = compress_level
+        self.shards = []
+        self.n_samples = 0
+        self._tar = None
+        self._arrays = {}
+        self._samples = []
+        self._groups = []
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def shard_name(self, shard_id):
+        return f'{self.prefix}-{str(shard_id).zfill(6)}.{self.shard_format}'
+
+    def write(self, key, sample, group=None):
+        '''
+        Adds one sample to the current shard, a new shard is started every `shard_size` samples.\n
+        - `key`: the name of the sample, it should be unique and without dots (the WebDataset keys end at the first dot)
+        - `sample`: a dict of the members of the sample by extension, for example {'png': image, 'label.png': label}
+        - `group`: the group of the sample, for example the case of a slice, the groups of each shard are listed in `index.json`
+        '''
+        if '.' in key:
+            raise ValueError(f'The sample key {key} cannot contain dots.')
+        if len(self._samples) == 0 and self.shard_format == 'tar':
+            self._tar = tarfile.open(os.path.join(self.output_dir, self.shard_name(len(self.shards))), 'w')
+
+        members = {}
+        for extension, value in sample.items():
+            name = f'{key}.{extension}'
+            if self.shard_format == 'npz':
+                self._arrays[name] = self.to_array(value)
+                members[extension] = name
+            else:
+                data = self.to_bytes(extension, value)
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                self._tar.addfile(info, io.BytesIO(data))
+                # The data ends the member, padded to the 512 bytes tar blocks (the headers can take several blocks for long names)
+                offset_data = self._tar.offset - -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                members[extension] = [offset_data, info.size]
+        self._samples.append({'key': key, 'members': members})
+        if group is not None and group not in self._groups:
+            self._groups.append(group)
+
+        if len(self._samples) == self.shard_size:
+            self.flush()
+
+    def write_group(self, group, samples):
+        '''
+        Adds the samples of a group (for example all the slices of a case) with `write`, starting a new shard first when the group does not fit in the current one.
+        So a group is only split between shards when it is bigger than `shard_size`. The last shard of a split group is not full, and the next groups can be added to it, so a shard can hold the end of a group and other groups (`DataSplitter.group_shards` keeps all these shards in the same split).\n
+        - `group`: the name of the group
+        - `samples`: the list of (key, sample) of the group
+        '''
+        if self._samples and len(self._samples) + len(samples) > self.shard_size:
+            self.flush()
+        for key, sample in samples:
+            self.write(key, sample, group=group)
+
+    def to_bytes(self, extension, value):
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, str):
+            return value.encode('utf-8')
+        if extension.endswith('png'):
+            return encode_png(value, self.compress_level)
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(value))
+        return buffer.getvalue()
+
+    @staticmethod
+    def to_array(value):
+        if isinstance(value, bytes):
+            return np.frombuffer(value, dtype=np.uint8)
+        return np.asarray(value)
+
+    def flush(self):
+        '''
+        Closes the current shard and writes its index.
+        '''
+        if not self._samples:
+            return
+        name = self.shard_name(len(self.shards))
+        if self.shard_format == 'npz':
+            np.savez(os.path.join(self.output_dir, name), **self._arrays)
+            self._arrays = {}
+        else:
+            self._tar.close()
+            self._tar = None
+
+        index_name = os.path.splitext(name)[0] + '.json'
+        with open(os.path.join(self.output_dir, index_name), 'w') as outfile:
+            json.dump({'shard': name, 'samples': self._samples}, outfile)
+        shard = {'name': name, 'index': index_name, 'n_samples': len(self._samples)}
+        if self._groups:
+            shard['groups'] = self._groups
+        self.shards.append(shard)
+        self.n_samples += len(self._samples)
+        logging.info(f'Wrote {name} with {len(self._samples)} samples')
+        self._samples = []
+        self._groups = []
+
+    def close(self):
+        '''
+        Closes the last shard and writes `index.json`.
+        '''
+        self.flush()
+        index = {
+            'format': self.shard_format,
+            'shard_size': self.shard_size,
+            'n_samples': self.n_samples,
+            'shards': self.shards,
+        }
+        with open(os.path.join(self.output_dir, 'index.json'), 'w') as outfile:
+            json.dump(index, outfile, indent=4)
+        return index
+
+    def write_directory(self, images_dir, labels_dir=None, label_extension=None):
+        '''
+        Packs an existing folder of images (and the folder of their labels, png masks or YOLO txt files) into shards, the samples are keyed by the file names without extension.\n
+        - `images_dir`: the path to the images
+        - `labels_dir`: the path to the labels, the labels are matched to the images by file name
+        - `label_extension`: the extension of the labels in the samples, by default 'label.' + the extension of the label files ('label.png', 'label.txt')
+        '''
+        labels = {}
+        if labels_dir:
+            labels = {os.path.splitext(file)[0]: file for file in sorted(os.listdir(labels_dir))}
+
+        for file in sorted(os.listdir(images_dir)):
+            key, extension = os.path.splitext(file)
+            with open(os.path.join(images_dir, file), 'rb') as infile:
+                sample = {extension[1:]: infile.read()}
+            if key in labels:
+                with open(os.path.join(labels_dir, labels[key]), 'rb') as infile:
+                    sample[label_extension or 'label' + os.path.splitext(labels[key])[1]] = infile.read()
+            self.write(key.replace('.', '_'), sample)
+        return self.close()
+
+
+class ShardReader:
+    '''
+    This class gives random access to the samples of the shards written by `ShardWriter`, using the shard indexes.
+
+    ### Example of usage:
+    ```
+    from pycad.datasets import ShardReader
+
+    reader = ShardReader('datasets/shards')
+    sample = reader.read('case_0012') # {'png': b'...', 'label.png': b'...'}
+    ```
+    '''
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.index = load_shard_index(shard_dir)
+        self.samples = {}
+        for shard in self.index['shards']:
+            with open(os.path.join(shard_dir, shard['index'])) as infile:
+                for sample in json.load(infile)['samples']:
+                    self.samples[sample['key']] = (shard['name'], sample['members'])
+
+    def __len__(self):
+        return len(self.samples)
+
+    def keys(self):
+        return list(self.samples)
+
+    def read(self, key):
+        '''
+        Returns the members of a sample by extension: bytes for the tar shards, numpy arrays for the npz shards.
+        '''
+        name, members = self.samples[key]
+        path = os.path.join(self.shard_dir, name)
+        if self.index['format'] == 'npz':
+            with np.load(path) as archive:
+                return {extension: archive[member] for extension, member in members.items()}
+
+        sample = {}
+        with open(path, 'rb') as infile:
+            for extension, (offset, size) in members.items():
+                infile.seek(offset)
+                sample[extension] = infile.read(size)
+        return sample
@@ -8,6 +8,8 @@ import pydicom
 from pydicom.filereader import read_dicomdir
 from glob import glob
 from tqdm import tqdm
+from ..utils.dicom_encoding import save_dicom
+from ..utils.parallel import run_jobs
 
 class DicomAnonymizer:
     '''
@@ -17,6 +19,8 @@ class DicomAnonymizer:
     Params:
     - input_dir: the directory to the input dicom files.
     - output_dir: the directory to the output (anonymized) dicom files.
+    - encoding: the lossless encoding of the output pixel data ('rle', 'deflate', or 'jpeg-ls', 'jpeg2000', 'jpeg-lossless' when an encoder is installed), by default the files keep their original encoding.
+    - workers: the number of threads anonymizing (and encoding) the files, by default the files are processed one after the other.
 
     #### Example of usage:
     ```Python
@@ -28,9 +32,11 @@ class DicomAnonymizer:
     anonymizer.run()
     ```
     '''
-    def __init__(self, input_dir, output_dir):
+    def __init__(self, input_dir, output_dir, encoding=None, workers=None):
         self.input_dir = input_dir
         self.output_dir = output_dir
+        self.encoding = encoding
+        self.workers = workers
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
     
@@ -49,20 +55,24 @@ class DicomAnonymizer:
     
     def anonymize_dicoms(self, fields_to_anonymize, force=False):
         dicom_files = glob(os.path.join(self.input_dir, '*.dcm'))
-        for file_path in tqdm(dicom_files, desc="Anonymizing"):
-            try:
-                # Read the DICOM file
-                dicom = pydicom.read_file(file_path, force=force)
-                
-                # Anonymize the fields specified
-                for field in fields_to_anonymize:
-                    if field in dicom:
-                        dicom.data_element(field).value = 'Anonymized'
-                
-                # Save the anonymized DICOM file
-                dicom.save_as(os.path.join(self.output_dir, os.path.basename(file_path)))
-            except Exception as e:
-                print(f"Error anonymizing {file_path}: {e}")
+        jobs = [(file_path, fields_to_anonymize, force) for file_path in dicom_files]
+        with tqdm(total=len(jobs), desc="Anonymizing") as bar:
+            run_jobs(self.anonymize_file, jobs, workers=self.workers, use_processes=False, progress=lambda done, total: bar.update())
+
+    def anonymize_file(self, file_path, fields_to_anonymize, force=False):
+        try:
+            # Read the DICOM file
+            dicom = pydicom.read_file(file_path, force=force)
+
+            # Anonymize the fields specified
+            for field in fields_to_anonymize:
+                if field in dicom:
+                    dicom.data_element(field).value = 'Anonymized'
+
+            # Save the anonymized DICOM file
+            save_dicom(dicom, os.path.join(self.output_dir, os.path.basename(file_path)), encoding=self.encoding)
+        except Exception as e:
+            print(f"Error anonymizing {file_path}: {e}")
     
     def run(self, force=False):
         # List fields that can be anonymized
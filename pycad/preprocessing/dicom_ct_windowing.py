@@ -10,6 +10,9 @@ import cv2
 import logging
 from glob import glob
 import matplotlib.pyplot as plt
+from pydicom.uid import ExplicitVRLittleEndian
+from ..utils.dicom_encoding import save_dicom
+from ..utils.parallel import run_jobs
 
 class DicomCTWindowing:
     """
@@ -22,6 +25,8 @@ class DicomCTWindowing:
     - window_center: The center of the window used for windowing.
     - window_width: The width of the window used for windowing.
     - visualize: Whether to show an example slice before and after windowing at the end of processing.
+    - encoding: The lossless encoding of the output pixel data ('rle', 'deflate', or 'jpeg-ls', 'jpeg2000', 'jpeg-lossless' when an encoder is installed), by default the pixel data is not compressed.
+    - workers: The number of threads processing (and encoding) the slices, by default the slices are processed one after the other.
     
     ## Example of usage:
     ```Python
@@ -36,10 +41,12 @@ class DicomCTWindowing:
     ```
     """
 
-    def __init__(self, window_center=40, window_width=400, visualize=False):
+    def __init__(self, window_center=40, window_width=400, visualize=False, encoding=None, workers=None):
         self.window_center = window_center
         self.window_width = window_width
         self.visualize = visualize
+        self.encoding = encoding
+        self.workers = workers
         # Initialize the logger
         self.logger = logging.getLogger('DicomCTWindowing')
         self.logger.setLevel(logging.INFO)
@@ -77,10 +84,13 @@ class DicomCTWindowing:
         # Convert to the necessary data type
         image = image.astype(np.int16)  # Most CT images use 16-bit signed integers
         dcm.PixelData = image.tobytes()
+        if dcm.file_meta.TransferSyntaxUID.is_compressed:
+            # The new pixel data is not compressed anymore
+            dcm.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
 
         # Save the modified image
         path_to_save = f'{output_path}/slice_{str(i).zfill(4)}.dcm'
-        dcm.save_as(path_to_save)
+        save_dicom(dcm, path_to_save, encoding=self.encoding)
 
         return original_image, image
 
@@ -97,18 +107,25 @@ class DicomCTWindowing:
             self.logger.warning(f'No DICOM files found in {input_dir}.')
             return
 
-        example_image = None
-        for i, dicom_path in enumerate(sorted(dicom_paths)):
-            try:
-                original_image, preprocessed_image = self.preprocess_ct_image(dicom_path, output_dir, i, force=force)
-                if self.visualize and example_image is None:
-                    example_image = (original_image, preprocessed_image)
-            except Exception as e:
-                self.logger.error(f'Error processing file {dicom_path}: {e}')
-        
+        jobs = [(dicom_path, output_dir, i, force) for i, dicom_path in enumerate(sorted(dicom_paths))]
+        results = run_jobs(self.process_file, jobs, workers=self.workers, use_processes=False)
+
+        example_image = results[0]
         if self.visualize and example_image is not None:
             self.display_example_slice(example_image[0], example_image[1])
 
+    def process_file(self, dicom_path, output_dir, i, force=False):
+        """
+        Processes one DICOM file, the errors are logged and None is returned.
+        Only the first slice returns its images (for `visualize`), so that the results do not hold the pixel data of the whole series.
+        """
+        try:
+            images = self.preprocess_ct_image(dicom_path, output_dir, i, force=force)
+        except Exception as e:
+            self.logger.error(f'Error processing file {dicom_path}: {e}')
+            return None
+        return images if self.visualize and i == 0 else None
+
     def display_example_slice(self, original_image, preprocessed_image):
         """
         Displays an example slice before and after processing.
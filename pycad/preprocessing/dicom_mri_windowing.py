@@ -4,12 +4,16 @@
 
 
 import os
+import threading
 import pydicom
 from pydicom.errors import InvalidDicomError
 import SimpleITK as sitk
 import numpy as np
 from glob import glob
 from tqdm import tqdm  # for progress bar
+from pydicom.uid import ExplicitVRLittleEndian
+from ..utils.dicom_encoding import save_dicom
+from ..utils.parallel import run_jobs
 
 class DicomMriWindowing:
     '''
@@ -18,6 +22,8 @@ class DicomMriWindowing:
     Params:
     - input_dir: path to the dicom directory
     - output_dir: path to the save the dicoms after windowing
+    - encoding: the lossless encoding of the output pixel data ('rle', 'deflate', or 'jpeg-ls', 'jpeg2000', 'jpeg-lossless' when an encoder is installed), by default the pixel data is not compressed
+    - workers: the number of threads writing (and encoding) the slices, by default the slices are written one after the other
 
     ### Example of usage:
     ```Python
@@ -29,9 +35,11 @@ class DicomMriWindowing:
     windower.window_series()
     ```
     '''
-    def __init__(self, input_dir, output_dir):
+    def __init__(self, input_dir, output_dir, encoding=None, workers=None):
         self.input_dir = input_dir
         self.output_dir = output_dir
+        self.encoding = encoding
+        self.workers = workers
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
@@ -65,7 +73,10 @@ class DicomMriWindowing:
         try:
             dcm.PixelData = slice_arr.tobytes()
             dcm.Rows, dcm.Columns = slice_arr.shape
-            dcm.save_as(os.path.join(self.output_dir, f'slice_{str(index).zfill(4)}.dcm'))
+            if dcm.file_meta.TransferSyntaxUID.is_compressed:
+                # The new pixel data is not compressed anymore
+                dcm.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+            save_dicom(dcm, os.path.join(self.output_dir, f'slice_{str(index).zfill(4)}.dcm'), encoding=self.encoding)
             return True
         except Exception as e:
             print(f"Failed to save DICOM slice: {e}")
@@ -83,15 +94,23 @@ class DicomMriWindowing:
         windowed_image = self.apply_windowing(image_3d, coef=coef)
         windowed_array = sitk.GetArrayFromImage(windowed_image).astype(np.int16)
 
-        # Iterate over each slice
-        for i in tqdm(range(len(windowed_array)), desc="Processing"):
-            try:
-                dcm = pydicom.dcmread(dicom_paths[i], force=force)
-                if not self.save_dicom_slice(dcm, windowed_array[i], i):
-                    break
-            except InvalidDicomError:
-                print(f"Invalid DICOM file: {dicom_paths[i]}")
-                break
-            except FileNotFoundError:
-                print(f"File not found: {dicom_paths[i]}")
-                break
\ No newline at end of file
+        # Write each slice, the writing stops at the first failing slice (the slices already being written by other workers are finished)
+        failed = threading.Event()
+        jobs = [(dicom_paths[i], windowed_array[i], i, force, failed) for i in range(len(windowed_array))]
+        with tqdm(total=len(jobs), desc="Processing") as bar:
+            run_jobs(self.window_slice, jobs, workers=self.workers, use_processes=False, progress=lambda done, total: bar.update())
+
+    def window_slice(self, dicom_path, slice_arr, index, force=False, failed=None):
+        if failed is not None and failed.is_set():
+            return False
+        try:
+            dcm = pydicom.dcmread(dicom_path, force=force)
+            if self.save_dicom_slice(dcm, slice_arr, index):
+                return True
+        except InvalidDicomError:
+            print(f"Invalid DICOM file: {dicom_path}")
+        except FileNotFoundError:
+            print(f"File not found: {dicom_path}")
+        if failed is not None:
+            failed.set()
+        return False
\ No newline at end of file
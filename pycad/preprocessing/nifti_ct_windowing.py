@@ -9,6 +9,7 @@ import cv2
 import nibabel as nib
 from glob import glob
 import matplotlib.pyplot as plt
+from ..utils.nifti_writer import write_nifti
 
 class NiftiCTWindowing:
     """
@@ -21,6 +22,8 @@ class NiftiCTWindowing:
     - window_center: The center of the window used for windowing.
     - window_width: The width of the window used for windowing.
     - visualize: Whether to show an example slice before and after windowing.
+    - compress_level: The gzip compression level of the `.nii.gz` outputs, which are compressed by blocks on multiple threads.
+    - threads: The number of threads compressing the outputs, by default the number of CPUs.
 
     ### Example of usage:
     ```Python
@@ -33,10 +36,12 @@ class NiftiCTWindowing:
     ```
     """
 
-    def __init__(self, window_center=40, window_width=400, visualize=False):
+    def __init__(self, window_center=40, window_width=400, visualize=False, compress_level=1, threads=None):
         self.window_center = window_center
         self.window_width = window_width
         self.visualize = visualize
+        self.compress_level = compress_level
+        self.threads = threads
 
     def apply_windowing(self, image):
         # Apply windowing - for example, a soft tissue window
@@ -62,7 +67,7 @@ class NiftiCTWindowing:
 
         # Save the modified image
         new_nifti = nib.Nifti1Image(windowed_image, nifti.affine)
-        nib.save(new_nifti, output_path)
+        write_nifti(new_nifti, output_path, compress_level=self.compress_level, threads=self.threads)
 
         return image, windowed_image
 
@@ -7,6 +7,7 @@ import nibabel as nib
 import numpy as np
 import os
 from tqdm import tqdm
+from ..utils.nifti_writer import write_nifti
 
 class NiftiMriWindowing:
     '''
@@ -15,6 +16,8 @@ class NiftiMriWindowing:
     Params:
     - input_filepath: the path to the input nifti file (.nii / .nii.gz)
     - output_filepath: the path to the output nifti file (.nii / .nii.gz)
+    - compress_level: the gzip compression level of the `.nii.gz` outputs, which are compressed by blocks on multiple threads
+    - threads: the number of threads compressing the outputs, by default the number of CPUs
 
     ### Example of usage:
     ```Python
@@ -26,9 +29,11 @@ class NiftiMriWindowing:
     windower.window_image(coef=4)
     ```
     '''
-    def __init__(self, input_filepath, output_filepath):
+    def __init__(self, input_filepath, output_filepath, compress_level=1, threads=None):
         self.input_filepath = input_filepath
         self.output_filepath = output_filepath
+        self.compress_level = compress_level
+        self.threads = threads
         os.makedirs(os.path.dirname(self.output_filepath), exist_ok=True)
 
     def load_image(self):
@@ -54,7 +59,7 @@ class NiftiMriWindowing:
 
     def save_image(self, image):
         try:
-            nib.save(image, self.output_filepath)
+            write_nifti(image, self.output_filepath, compress_level=self.compress_level, threads=self.threads)
             print(f"Saved windowed image to {self.output_filepath}")
             return True
         except Exception as e:
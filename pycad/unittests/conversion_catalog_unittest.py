@@ -0,0 +1,61 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import SimpleITK as sitk
+from pycad.converters import NiftiToDicomConverter, DicomToNiftiConverter, DicomToNrrdConverter
+
+
+class TestConversionCatalog(unittest.TestCase):
+    '''
+    This is the unit test for the incremental conversions. It checks that the unchanged series are skipped, that the changed series are converted again and that each output format is tracked on its own.
+    '''
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.tmp_dir, 'dicom')
+        self.output_dir = os.path.join(self.tmp_dir, 'out')
+        for name in ['a', 'b', 'c']:
+            image = sitk.GetImageFromArray(np.full((6, 8, 8), ord(name), dtype=np.int16))
+            NiftiToDicomConverter().image2dicom(image, os.path.join(self.input_dir, name), fast=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def convert(self, converter_class=DicomToNiftiConverter):
+        results = converter_class().convert(self.input_dir, self.output_dir, incremental=True)
+        return {os.path.basename(result['series']): result for result in results}
+
+    def test_incremental(self):
+        first = self.convert()
+        self.assertEqual([result['skipped'] for result in first.values()], [False, False, False])
+
+        # Nothing changed
+        second = self.convert()
+        self.assertEqual([result['skipped'] for result in second.values()], [True, True, True])
+        self.assertEqual({name: result['output'] for name, result in second.items()}, {name: result['output'] for name, result in first.items()})
+
+        # A new modification time, then a new size
+        path = os.path.join(self.input_dir, 'a', 'slice0002.dcm')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        with open(os.path.join(self.input_dir, 'b', 'slice0003.dcm'), 'ab') as outfile:
+            outfile.write(b'\0\0')
+        third = self.convert()
+        self.assertEqual({name: result['skipped'] for name, result in third.items()}, {'a': False, 'b': False, 'c': True})
+        self.assertEqual([result['skipped'] for result in self.convert().values()], [True, True, True])
+
+        # The same series to NRRD is a new target, with the same catalog
+        nrrd = self.convert(DicomToNrrdConverter)
+        self.assertEqual([result['skipped'] for result in nrrd.values()], [False, False, False])
+        self.assertTrue(all(result['output'].endswith('.nrrd') for result in nrrd.values()))
+        self.assertEqual([result['skipped'] for result in self.convert(DicomToNrrdConverter).values()], [True, True, True])
+        self.assertEqual([result['skipped'] for result in self.convert().values()], [True, True, True])
+
+        # A deleted output is converted again
+        os.remove(first['c']['output'])
+        self.assertEqual({name: result['skipped'] for name, result in self.convert().items()}, {'a': True, 'b': True, 'c': False})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import random
+import shutil
+import tempfile
+import numpy as np
+import SimpleITK as sitk
+from pydicom import dcmread
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+from pycad.converters import DicomIndex, NiftiToDicomConverter, DicomToNiftiConverter
+
+
+class TestDicomIndex(unittest.TestCase):
+    '''
+    This is the unit test for the header-only DicomIndex. It checks the grouping of a folder holding two series and a file without position, the sorting of the slices along the normal and the names of the series.
+    '''
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mixed_dir = os.path.join(self.tmp_dir, 'patient')
+        os.makedirs(self.mixed_dir)
+
+        # Two oblique series written in the same folder, with shuffled file names
+        direction = sitk.VersorTransform((0.1, 0.3, 0.2), 0.4).GetMatrix()
+        names = [f'file{i:03d}.dcm' for i in range(6 + 4)]
+        random.Random(0).shuffle(names)
+        self.series = {}
+        for series_number, (n_slices, series_uid) in enumerate([(6, '1.2.3.1'), (4, '1.2.3.2')], start=1):
+            image = sitk.GetImageFromArray(np.zeros((n_slices, 8, 8), dtype=np.int16))
+            image.SetSpacing((0.7, 0.7, 2.0))
+            image.SetDirection(direction)
+            series_dir = os.path.join(self.tmp_dir, series_uid)
+            NiftiToDicomConverter().image2dicom(image, series_dir, fast=True, series_uid=series_uid)
+            for i in range(n_slices):
+                ds = dcmread(os.path.join(series_dir, f'slice{i:04d}.dcm'))
+                ds.SeriesNumber = series_number
+                ds.save_as(os.path.join(self.mixed_dir, names.pop()))
+            self.series[series_uid] = [image.TransformIndexToPhysicalPoint((0, 0, i)) for i in range(n_slices)]
+
+        # A file of the patient without position, like a SEG or an RTSTRUCT
+        ds = Dataset()
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.SOPClassUID = '1.2.840.10008.5.1.4.1.1.481.3'
+        ds.SOPInstanceUID = '1.2.3.9.1'
+        ds.SeriesInstanceUID = '1.2.3.9'
+        ds.SeriesNumber = 9
+        ds.Modality = 'RTSTRUCT'
+        ds.save_as(os.path.join(self.mixed_dir, 'rtstruct.dcm'), write_like_original=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_mixed_folder(self):
+        index = DicomIndex(self.tmp_dir, workers=3)
+        instances = index.scan()
+        self.assertEqual(len(instances['1.2.3.1']), 2 * 6)  # the folder of the series and the mixed folder
+        self.assertEqual(instances['1.2.3.9'][0][4], None)
+
+        index = DicomIndex(self.mixed_dir, workers=3)
+        series = {found.series_uid: found for found in index.get_series()}
+        self.assertEqual(sorted(series), ['1.2.3.1', '1.2.3.2', '1.2.3.9'])
+        self.assertEqual(sorted(found.name for found in series.values()), ['patient_1', 'patient_2', 'patient_9'])
+
+        # The slices are sorted along the normal of the slices, whatever the file names are
+        for series_uid, positions in self.series.items():
+            files = series[series_uid].files
+            self.assertEqual(len(files), len(positions))
+            read_positions = [[float(v) for v in dcmread(path, stop_before_pixels=True).ImagePositionPatient] for path in files]
+            self.assertTrue(np.allclose(read_positions, positions, atol=1e-3))
+
+        # With a minimum number of images, the file without position is not a series
+        self.assertEqual(sorted(found.name for found in index.get_series(min_images=2)), ['patient_1', 'patient_2'])
+
+    def test_convert(self):
+        output_dir = os.path.join(self.tmp_dir, 'nifti')
+        results = DicomToNiftiConverter(min_images_per_series=2).convert(self.mixed_dir, output_dir, workers=2, use_index=True)
+        self.assertEqual(sorted(os.path.basename(result['output']) for result in results), ['patient_1.nii.gz', 'patient_2.nii.gz'])
+        self.assertEqual(sitk.ReadImage(os.path.join(output_dir, 'patient_1.nii.gz')).GetSize(), (8, 8, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
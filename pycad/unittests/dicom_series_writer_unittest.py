@@ -0,0 +1,101 @@
+import unittest
+import os
+import shutil
+import numpy as np
+import SimpleITK as sitk
+from pydicom import dcmread
+from pycad.converters import NiftiToDicomConverter
+
+class TestDicomSeriesWriter(unittest.TestCase):
+    '''
+    This is the unit test for the fast dicom series writer. It checks that the fast path writes the same pixels, geometry and UIDs as the slice by slice path.
+    '''
+    def read_series(self, path):
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames(reader.GetGDCMSeriesFileNames(path))
+        return reader.Execute()
+
+    def test_same_as_slice_by_slice(self):
+        array = np.random.default_rng(0).normal(0, 300, size=(12, 20, 24)).astype(np.float32)
+        array[3] = 7.6  # constant slice
+        image = sitk.GetImageFromArray(array)
+        image.SetSpacing((0.7, 0.9, 2.5))
+        image.SetOrigin((5.0, -3.0, 10.0))
+        image.SetDirection(sitk.VersorTransform((0.2, 0.3, 0.1), 0.3).GetMatrix())
+
+        converter = NiftiToDicomConverter()
+        converter.image2dicom(image, 'slow_series', workers=3, series_uid='1.2.3.4')
+        converter.image2dicom(image, 'fast_series', fast=True, workers=3, series_uid='1.2.3.4')
+        slow, fast = self.read_series('slow_series'), self.read_series('fast_series')
+
+        self.assertTrue(np.array_equal(sitk.GetArrayFromImage(slow), sitk.GetArrayFromImage(fast)))
+        self.assertTrue(np.allclose(slow.GetOrigin(), fast.GetOrigin(), atol=1e-4))
+        self.assertTrue(np.allclose(slow.GetSpacing(), fast.GetSpacing(), atol=1e-4))
+        self.assertTrue(np.allclose(slow.GetDirection(), fast.GetDirection(), atol=1e-4))
+
+        # The UIDs only depend on the series UID, not on the order in which the slices are written
+        for name in ['slice0000.dcm', 'slice0007.dcm']:
+            slow_slice = dcmread(os.path.join('slow_series', name))
+            fast_slice = dcmread(os.path.join('fast_series', name))
+            self.assertEqual(slow_slice.SOPInstanceUID, fast_slice.SOPInstanceUID)
+            self.assertEqual(slow_slice.StudyInstanceUID, fast_slice.StudyInstanceUID)
+            self.assertEqual(slow_slice.InstanceNumber, fast_slice.InstanceNumber)
+        shutil.rmtree('slow_series')
+        shutil.rmtree('fast_series')
+
+    def test_default_uids(self):
+        image = sitk.GetImageFromArray(np.zeros((3, 8, 8), dtype=np.int16))
+
+        # The series converted in the same second get different UIDs, with all the other UIDs derived from them
+        converter = NiftiToDicomConverter()
+        converter.image2dicom(image, 'series_a')
+        converter.image2dicom(image, 'series_b', fast=True)
+        a, b = dcmread(os.path.join('series_a', 'slice0001.dcm')), dcmread(os.path.join('series_b', 'slice0001.dcm'))
+        self.assertNotEqual(a.SeriesInstanceUID, b.SeriesInstanceUID)
+        self.assertNotEqual(a.StudyInstanceUID, b.StudyInstanceUID)
+        self.assertNotEqual(a.SOPInstanceUID, b.SOPInstanceUID)
+
+        # A long series UID still gives valid instance UIDs
+        series_uid = '1.2.' + '3' * 60
+        converter.image2dicom(image, 'series_c', fast=True, series_uid=series_uid)
+        c = dcmread(os.path.join('series_c', 'slice0002.dcm'))
+        self.assertEqual(c.SeriesInstanceUID, series_uid)
+        self.assertLessEqual(len(c.SOPInstanceUID), 64)
+        for path in ['series_a', 'series_b', 'series_c']:
+            shutil.rmtree(path)
+
+    def test_multiframe(self):
+        array = np.random.default_rng(1).integers(-1000, 1000, size=(9, 16, 20)).astype(np.int16)
+        image = sitk.GetImageFromArray(array)
+        image.SetSpacing((0.5, 0.6, 3.0))
+        image.SetOrigin((-4.0, 2.0, 7.0))
+
+        NiftiToDicomConverter().image2dicom(image, 'multiframe_series', multiframe=True)
+        ds = dcmread(os.path.join('multiframe_series', 'volume.dcm'))
+        self.assertEqual(ds.NumberOfFrames, 9)
+        self.assertTrue(np.array_equal(ds.pixel_array, array))
+
+        read_image = sitk.ReadImage(os.path.join('multiframe_series', 'volume.dcm'))
+        self.assertTrue(np.allclose(read_image.GetSpacing(), image.GetSpacing()))
+        self.assertTrue(np.allclose(read_image.GetOrigin(), image.GetOrigin()))
+        shutil.rmtree('multiframe_series')
+
+        # The options of the series written slice by slice are refused
+        for options in [{'fast': True}, {'workers': 2}, {'progress': print}]:
+            with self.assertRaises(ValueError):
+                NiftiToDicomConverter().image2dicom(image, 'multiframe_series', multiframe=True, **options)
+
+    def test_encoding(self):
+        array = np.full((5, 32, 32), -1000, dtype=np.int16)
+        array[:, 8:24, 8:24] = 40
+        image = sitk.GetImageFromArray(array)
+
+        for encoding in ['rle', 'deflate']:
+            NiftiToDicomConverter().image2dicom(image, 'encoded_series', encoding=encoding, workers=2)
+            self.assertTrue(np.array_equal(sitk.GetArrayFromImage(self.read_series('encoded_series')), array))
+            ds = dcmread(os.path.join('encoded_series', 'slice0002.dcm'))
+            self.assertTrue(np.array_equal(ds.pixel_array, array[2]))
+            shutil.rmtree('encoded_series')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import SimpleITK as sitk
+from pycad.converters import convert, read_volume, Volume
+
+class TestEngine(unittest.TestCase):
+    '''
+    This is the unit test for the conversion engine. It checks that the 2D, 4D and multi-component images keep their pixels, geometry and metadata between NIfTI and NRRD.
+    '''
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def round_trip(self, image):
+        nifti_path = os.path.join(self.tmp_dir, 'image.nii.gz')
+        sitk.WriteImage(image, nifti_path)
+        original = sitk.ReadImage(nifti_path)
+
+        convert(nifti_path, os.path.join(self.tmp_dir, 'image.nrrd'))
+        convert(os.path.join(self.tmp_dir, 'image.nrrd'), os.path.join(self.tmp_dir, 'back.nii.gz'))
+        for path in ['image.nrrd', 'back.nii.gz']:
+            output = sitk.ReadImage(os.path.join(self.tmp_dir, path))
+            self.assertEqual(output.GetDimension(), original.GetDimension())
+            self.assertEqual(output.GetNumberOfComponentsPerPixel(), original.GetNumberOfComponentsPerPixel())
+            self.assertTrue(np.array_equal(sitk.GetArrayFromImage(output), sitk.GetArrayFromImage(original)))
+            self.assertTrue(np.allclose(output.GetSpacing(), original.GetSpacing()))
+            self.assertTrue(np.allclose(output.GetOrigin(), original.GetOrigin()))
+            self.assertTrue(np.allclose(output.GetDirection(), original.GetDirection()))
+
+    def test_4d(self):
+        image = sitk.GetImageFromArray(np.random.randint(0, 1000, size=(3, 5, 6, 7)).astype(np.int16), isVector=False)
+        image.SetSpacing((0.5, 0.8, 2.0, 1.5))
+        image.SetOrigin((10.0, -5.0, 3.0, 0.0))
+        self.round_trip(image)
+
+    def test_2d(self):
+        image = sitk.GetImageFromArray(np.random.randint(0, 1000, size=(6, 7)).astype(np.int16))
+        image.SetSpacing((0.5, 0.8))
+        image.SetOrigin((10.0, -5.0))
+        self.round_trip(image)
+
+    def test_vector(self):
+        image = sitk.GetImageFromArray(np.random.rand(4, 5, 6, 3).astype(np.float32), isVector=True)
+        image.SetSpacing((0.5, 0.8, 2.0))
+        self.round_trip(image)
+
+    def test_default_geometry(self):
+        # The default geometry follows the dimension of the array
+        for shape, is_vector in [((6, 7), False), ((3, 5, 6, 7), False), ((5, 6, 7, 3), True)]:
+            path = os.path.join(self.tmp_dir, 'image.nrrd')
+            convert(Volume(np.ones(shape, dtype=np.uint8), is_vector=is_vector), path)
+            image = sitk.ReadImage(path)
+            self.assertEqual(image.GetDimension(), len(shape) - is_vector)
+            self.assertEqual(image.GetNumberOfComponentsPerPixel(), shape[-1] if is_vector else 1)
+
+    def test_metadata(self):
+        image = sitk.GetImageFromArray(np.zeros((4, 5, 6), dtype=np.int16))
+        image.SetMetaData('pycad_note', 'liver case')
+        path = os.path.join(self.tmp_dir, 'image.nrrd')
+        sitk.WriteImage(image, path)
+
+        volume = read_volume(path)
+        self.assertEqual(volume.metadata['pycad_note'], 'liver case')
+        convert(volume, os.path.join(self.tmp_dir, 'copy.nrrd'))
+        self.assertEqual(sitk.ReadImage(os.path.join(self.tmp_dir, 'copy.nrrd')).GetMetaData('pycad_note'), 'liver case')
+
+    def test_png_keeps_volume(self):
+        array = np.arange(-200, 200, dtype=np.int16).reshape((4, 10, 10))
+        volume = Volume(array.copy(), name='case')
+        convert(volume, os.path.join(self.tmp_dir, 'png'), to='png', max_v=50, min_v=-50)
+        self.assertTrue(np.array_equal(volume.array, array))
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp_dir, 'png'))), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nib
+import SimpleITK as sitk
+from pydicom import dcmread
+from pycad.converters import NiftiToDicomConverter, StreamingNiftiWriter, DicomIndex
+
+
+class TestStreamingNiftiWriter(unittest.TestCase):
+    '''
+    This is the unit test for the streaming NIfTI writer. It checks that an oblique series with non square pixels gives the same voxels and affine as the SimpleITK path.
+    '''
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dicom_dir = os.path.join(self.tmp_dir, 'series')
+        array = np.random.default_rng(0).integers(-1000, 2000, size=(11, 14, 18)).astype(np.int16)
+        image = sitk.GetImageFromArray(array)
+        image.SetSpacing((0.6, 0.9, 2.5))
+        image.SetOrigin((-12.0, 30.5, 104.0))
+        image.SetDirection(sitk.VersorTransform((0.3, -0.2, 0.4), 0.5).GetMatrix())
+        NiftiToDicomConverter().image2dicom(image, self.dicom_dir, fast=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_as_simpleitk(self):
+        files = DicomIndex(self.dicom_dir).get_series()[0].files
+        self.assertEqual([float(v) for v in dcmread(files[0]).PixelSpacing], [0.9, 0.6])
+
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames(files)
+        sitk.WriteImage(reader.Execute(), os.path.join(self.tmp_dir, 'sitk.nii.gz'))
+        expected = nib.load(os.path.join(self.tmp_dir, 'sitk.nii.gz'))
+
+        # Small slabs, so the volume is written in several pieces, compressed or not
+        for name in ['streaming.nii.gz', 'streaming.nii']:
+            StreamingNiftiWriter(slab_size=3, threads=2).write(files, os.path.join(self.tmp_dir, name))
+            streamed = nib.load(os.path.join(self.tmp_dir, name))
+            self.assertEqual(streamed.shape, expected.shape)
+            self.assertTrue(np.array_equal(streamed.get_fdata(), expected.get_fdata()))
+            self.assertTrue(np.allclose(streamed.affine, expected.affine, atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nib
+import SimpleITK as sitk
+from pydicom import dcmread
+from rt_utils import RTStructBuilder
+from pycad.converters import NiftiToDicomConverter, NiftiToDicomRT, DicomRTToNifti
+
+
+class TestNiftiToDicomRT(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dicom_dir = os.path.join(self.tmp_dir, 'series')
+        volume = np.random.default_rng(0).integers(-1000, 1000, size=(12, 32, 32)).astype(np.int16)
+        image = sitk.GetImageFromArray(volume)
+        image.SetSpacing((0.8, 0.8, 2.0))
+        NiftiToDicomConverter().image2dicom(image, self.dicom_dir, fast=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fast(self):
+        labels = np.zeros((12, 32, 32), dtype=np.uint8)  # the slices are the first axis of the nifti here
+        labels[2:6, 4:14, 6:20] = 1
+        labels[3, 5:8, 8:11] = 0  # a hole
+        labels[8, 0:5, 25:32] = 2  # on the border of the slice
+        mask_path = os.path.join(self.tmp_dir, 'mask.nii.gz')
+        nib.save(nib.Nifti1Image(labels, np.eye(4)), mask_path)
+        classes = {1: 'liver', 2: 'spleen', 3: 'pancreas'}  # 3 is empty
+
+        NiftiToDicomRT(mask_path, self.dicom_dir, os.path.join(self.tmp_dir, 'default.dcm'), classes).convert()
+        NiftiToDicomRT(mask_path, self.dicom_dir, os.path.join(self.tmp_dir, 'fast.dcm'), classes).convert(fast=True, workers=2)
+        default = dcmread(os.path.join(self.tmp_dir, 'default.dcm'))
+        fast = dcmread(os.path.join(self.tmp_dir, 'fast.dcm'))
+
+        self.assertEqual([roi.ROIName for roi in fast.StructureSetROISequence], ['liver', 'spleen'])
+        self.assertEqual([roi.ROIName for roi in default.StructureSetROISequence], ['liver', 'spleen'])
+        for default_roi, fast_roi in zip(default.ROIContourSequence, fast.ROIContourSequence):
+            self.assertEqual(len(default_roi.ContourSequence), len(fast_roi.ContourSequence))
+            for default_contour, fast_contour in zip(default_roi.ContourSequence, fast_roi.ContourSequence):
+                self.assertTrue(np.allclose(default_contour.ContourData, fast_contour.ContourData))
+                self.assertEqual(default_contour.ContourImageSequence[0].ReferencedSOPInstanceUID,
+                                 fast_contour.ContourImageSequence[0].ReferencedSOPInstanceUID)
+
+        # Back to a label map, the same masks as the reader of rt_utils
+        output_path = os.path.join(self.tmp_dir, 'labels.nii.gz')
+        names = DicomRTToNifti(workers=2).convert(os.path.join(self.tmp_dir, 'fast.dcm'), self.dicom_dir, output_path)
+        self.assertEqual(names, {1: 'liver', 2: 'spleen'})
+        label_map = sitk.GetArrayFromImage(sitk.ReadImage(output_path))
+        rtstruct = RTStructBuilder.create_from(self.dicom_dir, os.path.join(self.tmp_dir, 'fast.dcm'))
+        for value, name in names.items():
+            self.assertTrue(np.array_equal(label_map == value, np.moveaxis(rtstruct.get_roi_mask_by_name(name), 2, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
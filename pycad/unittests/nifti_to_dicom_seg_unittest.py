@@ -0,0 +1,135 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nib
+import SimpleITK as sitk
+from pydicom import dcmread
+from pycad.converters import NiftiToDicomConverter, NiftiToDicomSeg, DicomSegToNifti
+from pycad.utils import to_labels
+
+
+class TestNiftiToDicomSeg(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dicom_dir = os.path.join(self.tmp_dir, 'series')
+        volume = np.random.default_rng(0).integers(-1000, 1000, size=(10, 24, 20)).astype(np.int16)
+        image = sitk.GetImageFromArray(volume)
+        image.SetSpacing((0.8, 0.8, 2.0))
+        NiftiToDicomConverter().image2dicom(image, self.dicom_dir, fast=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_mask(self, labels):
+        path = os.path.join(self.tmp_dir, 'mask.nii.gz')
+        nib.save(nib.Nifti1Image(labels, np.eye(4)), path)
+        return path
+
+    def create_seg(self, mask_path, name, **options):
+        converter = NiftiToDicomSeg(self.dicom_dir, mask_path, **options)
+        converter.align_mask()
+        converter.create_segmentation()
+        converter.save_segmentation(os.path.join(self.tmp_dir, name))
+        return dcmread(os.path.join(self.tmp_dir, name))
+
+    def test_lazy(self):
+        labels = np.zeros((20, 24, 10), dtype=np.uint8)
+        labels[5:12, 6:14, 2:5] = 1
+        labels[3:6, 3:6, 8] = 2
+        mask_path = self.create_mask(labels)
+
+        default = self.create_seg(mask_path, 'default.dcm')
+        lazy = self.create_seg(mask_path, 'lazy.dcm', lazy=True)
+
+        # The same frames, at the same positions and referencing the same source images
+        self.assertEqual(lazy.NumberOfFrames, 4)
+        self.assertTrue(np.array_equal(default.pixel_array, lazy.pixel_array))
+        for default_frame, lazy_frame in zip(default.PerFrameFunctionalGroupsSequence, lazy.PerFrameFunctionalGroupsSequence):
+            self.assertEqual(default_frame.PlanePositionSequence[0].ImagePositionPatient, lazy_frame.PlanePositionSequence[0].ImagePositionPatient)
+            self.assertEqual(default_frame.DerivationImageSequence[0].SourceImageSequence[0].ReferencedSOPInstanceUID,
+                             lazy_frame.DerivationImageSequence[0].SourceImageSequence[0].ReferencedSOPInstanceUID)
+
+    def test_multi_label(self):
+        labels = np.zeros((20, 24, 10), dtype=np.uint8)
+        labels[5:12, 6:14, 2:5] = 2
+        labels[3:6, 3:6, 4:9] = 5
+        labels[15:18, 15:18, 0] = 9  # not in the segment labels
+        mask_path = self.create_mask(labels)
+        segment_labels = {2: 'liver', 5: 'spleen', 7: 'pancreas'}  # 7 is not in the mask
+
+        converter = NiftiToDicomSeg(self.dicom_dir, mask_path, lazy=True)
+        converter.align_mask()
+        converter.create_segmentation(segment_labels=segment_labels)
+        self.assertEqual([segment.SegmentLabel for segment in converter.seg_dataset.SegmentSequence], ['liver', 'spleen'])
+        self.assertEqual(converter.seg_dataset.NumberOfFrames, 3 + 5)
+
+        # The segments 1 and 2 are the labels 2 and 5
+        frames = {}
+        for frame, item in zip(converter.seg_dataset.pixel_array, converter.seg_dataset.PerFrameFunctionalGroupsSequence):
+            segment_number = item.SegmentIdentificationSequence[0].ReferencedSegmentNumber
+            uid = item.DerivationImageSequence[0].SourceImageSequence[0].ReferencedSOPInstanceUID
+            frames[segment_number, uid] = frame
+        for i, dataset in enumerate(converter.image_datasets):
+            for segment_number, value in ((1, 2), (2, 5)):
+                expected = np.asarray(converter.labels[i]) == value
+                frame = frames.get((segment_number, dataset.SOPInstanceUID), np.zeros_like(expected))
+                self.assertTrue(np.array_equal(frame.astype(bool), expected))
+
+        # The same from the directory, the case without series is an error
+        os.makedirs(os.path.join(self.tmp_dir, 'masks'))
+        shutil.copy(mask_path, os.path.join(self.tmp_dir, 'masks', 'series.nii.gz'))
+        shutil.copy(mask_path, os.path.join(self.tmp_dir, 'masks', 'other.nii.gz'))
+        manifest = NiftiToDicomSeg.convert_dir(self.tmp_dir, os.path.join(self.tmp_dir, 'masks'), os.path.join(self.tmp_dir, 'segs'), segment_labels=segment_labels)
+        records = {record['case']: record for record in manifest['records']}
+        self.assertEqual((records['series']['status'], records['series']['n_segments']), ('done', 2))
+        self.assertEqual(records['other']['status'], 'error')
+        self.assertTrue(np.array_equal(dcmread(records['series']['path']).pixel_array, converter.seg_dataset.pixel_array))
+
+    def test_label_range(self):
+        self.assertEqual(to_labels(np.array([0, 3, 255])).dtype, np.uint8)
+        self.assertEqual(to_labels(np.array([0.0, 2.9, 300.2])).tolist(), [0, 3, 300])
+        self.assertEqual(to_labels(np.array([0, 65535])).dtype, np.uint16)
+        for labels in [np.array([0, -1, 2]), np.array([0, 65536]), np.array([0.0, -0.7])]:
+            with self.assertRaises(ValueError):
+                to_labels(labels)
+
+    def test_to_nifti(self):
+        labels = np.zeros((20, 24, 10), dtype=np.uint8)
+        labels[5:12, 6:14, 2:5] = 2
+        labels[3:6, 3:6, 4:9] = 5
+        converter = NiftiToDicomSeg(self.dicom_dir, self.create_mask(labels), lazy=True)
+        converter.align_mask()
+        converter.create_segmentation(segment_labels={2: 'liver', 5: 'spleen'})
+        converter.save_segmentation(os.path.join(self.tmp_dir, 'seg.dcm'))
+
+        output_path = os.path.join(self.tmp_dir, 'labels.nii.gz')
+        names = DicomSegToNifti().convert(os.path.join(self.tmp_dir, 'seg.dcm'), self.dicom_dir, output_path)
+        self.assertEqual(names, {1: 'liver', 2: 'spleen'})
+
+        # The label map is in the geometry of the series, with the segment numbers as values
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames(reader.GetGDCMSeriesFileNames(self.dicom_dir))
+        series = reader.Execute()
+        label_map = sitk.ReadImage(output_path)
+        self.assertTrue(np.allclose(label_map.GetOrigin(), series.GetOrigin()))
+        self.assertTrue(np.allclose(label_map.GetSpacing(), series.GetSpacing()))
+        self.assertTrue(np.allclose(label_map.GetDirection(), series.GetDirection()))
+
+        slices = {dcmread(path, stop_before_pixels=True).SOPInstanceUID: i for i, path in enumerate(reader.GetFileNames())}
+        expected = np.zeros(sitk.GetArrayFromImage(series).shape, dtype=np.uint8)
+        for i, dataset in enumerate(converter.image_datasets):
+            expected[slices[dataset.SOPInstanceUID]] = np.asarray(converter.labels[i] == 2) + 2 * np.asarray(converter.labels[i] == 5)
+        self.assertTrue(np.array_equal(sitk.GetArrayFromImage(label_map), expected))
+
+        # A series with two slices at the same position has no regular geometry
+        duplicate = dcmread(os.path.join(self.dicom_dir, 'slice0003.dcm'))
+        duplicate.SOPInstanceUID = duplicate.file_meta.MediaStorageSOPInstanceUID = '1.2.3.4.5'
+        duplicate.save_as(os.path.join(self.dicom_dir, 'duplicate.dcm'))
+        with self.assertRaises(ValueError):
+            DicomSegToNifti().convert(os.path.join(self.tmp_dir, 'seg.dcm'), self.dicom_dir, output_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
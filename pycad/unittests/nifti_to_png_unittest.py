@@ -0,0 +1,104 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import SimpleITK as sitk
+from PIL import Image
+from pycad.converters import NiftiToPngConverter
+
+
+class TestNiftiToPngConverter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.vol_dir = os.path.join(self.tmp_dir, 'volumes')
+        self.seg_dir = os.path.join(self.tmp_dir, 'segmentations')
+        self.out_dir = os.path.join(self.tmp_dir, 'png')
+        os.makedirs(self.vol_dir)
+        os.makedirs(self.seg_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_case(self, name, shape=(6, 16, 16), seg_shape=None):
+        """
+        Create a volume and its segmentation with a small object in the middle slices.
+        """
+        volume = np.random.default_rng(0).integers(-500, 500, shape).astype(np.int16)
+        seg = np.zeros(seg_shape or shape, dtype=np.uint8)
+        seg[2:4, 4:8, 4:8] = 1
+        sitk.WriteImage(sitk.GetImageFromArray(volume), os.path.join(self.vol_dir, name + '.nii.gz'))
+        sitk.WriteImage(sitk.GetImageFromArray(seg), os.path.join(self.seg_dir, name + '.nii.gz'))
+        return volume, seg
+
+    def test_paired(self):
+        volume, seg = self.create_case('case1')
+        self.create_case('case2', seg_shape=(5, 16, 16))  # shape mismatch
+        self.create_case('case3')
+        os.remove(os.path.join(self.seg_dir, 'case3.nii.gz'))  # missing segmentation
+
+        converter = NiftiToPngConverter(max_v=200, min_v=-200, mode='gray')
+        converter.run(self.vol_dir, self.seg_dir, self.out_dir, paired=True)
+
+        # Only the valid case is written
+        self.assertEqual(sorted(os.listdir(os.path.join(self.out_dir, 'images'))), [f'case1_{i:04d}.png' for i in range(6)])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.out_dir, 'labels'))), [f'case1_{i:04d}.png' for i in range(6)])
+        self.assertEqual(sorted(converter.rejected_cases), ['case2', 'case3'])
+
+        # Same slices as the unpaired conversion
+        label = np.array(Image.open(os.path.join(self.out_dir, 'labels', 'case1_0002.png')))
+        np.testing.assert_array_equal(label, np.rot90(seg[2], 2))
+        image = np.array(Image.open(os.path.join(self.out_dir, 'images', 'case1_0002.png')))
+        np.testing.assert_array_equal(image, np.rot90(converter.prepare_image(volume[2].copy()), 2))
+
+        with open(os.path.join(self.out_dir, 'manifest.json')) as infile:
+            manifest = json.load(infile)
+        records = {record['case']: record for record in manifest['cases']}
+        self.assertEqual((manifest['converted'], manifest['rejected']), (1, 2))
+        self.assertEqual(records['case1']['n_slices'], 6)
+        self.assertTrue(records['case2']['reason'].startswith('shape mismatch'))
+        self.assertEqual(records['case3']['reason'], 'missing segmentation')
+
+    def test_sampling(self):
+        self.create_case('case1', shape=(20, 16, 16))  # slices 2 and 3 have labels
+
+        converter = NiftiToPngConverter(sampling='foreground+strided', negative_step=5)
+        manifest = converter.convert_pairs_dir(self.vol_dir, self.seg_dir, self.out_dir)
+        # The files keep the slice indices of the volume
+        expected = [f'case1_{i:04d}.png' for i in (0, 2, 3, 7, 12, 17)]  # every 5th of the empty slices
+        self.assertEqual(sorted(os.listdir(os.path.join(self.out_dir, 'images'))), expected)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.out_dir, 'labels'))), expected)
+        self.assertEqual((manifest['cases'][0]['n_slices'], manifest['cases'][0]['n_foreground']), (6, 2))
+
+        seg = np.zeros((20, 16, 16), dtype=np.uint8)
+        seg[2:4, 4:8, 4:8] = 1
+        np.testing.assert_array_equal(NiftiToPngConverter(sampling='foreground').sample_slices(seg), [2, 3])
+        random_sampler = NiftiToPngConverter(sampling='foreground+random', n_negatives=3, seed=7)
+        indices = random_sampler.sample_slices(seg, 'case1')
+        self.assertEqual(len(indices), 5)
+        self.assertTrue({2, 3} <= set(indices))
+        np.testing.assert_array_equal(indices, random_sampler.sample_slices(seg, 'case1'))  # reproducible
+
+    def test_planes_and_2_5d(self):
+        volume, _ = self.create_case('case1')
+        converter = NiftiToPngConverter(max_v=200, min_v=-200, mode='2.5d', planes=('axial', 'coronal', 'sagittal'))
+        converter.convert_nifti_to_png(os.path.join(self.vol_dir, 'case1.nii.gz'), self.out_dir, 'vol')
+        self.assertEqual(len(os.listdir(self.out_dir)), 6 + 16 + 16)
+
+        gray = NiftiToPngConverter(max_v=200, min_v=-200, mode='gray')
+        axial = lambda i: np.rot90(gray.prepare_image(volume[i].copy()), 2)
+        image = np.array(Image.open(os.path.join(self.out_dir, 'case1_0003.png')))
+        for channel, i in enumerate((2, 3, 4)):
+            np.testing.assert_array_equal(image[..., channel], axial(i))
+        image = np.array(Image.open(os.path.join(self.out_dir, 'case1_0000.png')))
+        np.testing.assert_array_equal(image[..., 0], axial(0))  # the edge slice is repeated
+
+        image = np.array(Image.open(os.path.join(self.out_dir, 'case1_coronal_0005.png')))
+        np.testing.assert_array_equal(image[..., 1], gray.prepare_image(volume[::-1, 5, :].copy()))
+        image = np.array(Image.open(os.path.join(self.out_dir, 'case1_sagittal_0007.png')))
+        np.testing.assert_array_equal(image[..., 1], gray.prepare_image(volume[::-1, :, 7].copy()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nib
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from pycad.converters import Nifti2StlConverter
+from pycad.converters.nifti_to_stl import write_quantized_meshes, read_quantized_meshes
+
+
+class TestNifti2Stl(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.labels = np.zeros((40, 36, 30), dtype=np.uint8)
+        self.labels[5:15, 6:16, 4:14] = 1
+        self.labels[20:33, 18:30, 10:25] = 2
+        x, y, z = np.ogrid[:40, :36, :30]
+        self.labels[(x - 26) ** 2 + (y - 8) ** 2 + (z - 22) ** 2 <= 25] = 4  # a ball
+        self.mask_path = self.create_mask('case.nii.gz', self.labels)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_mask(self, name, labels):
+        path = os.path.join(self.tmp_dir, name)
+        nib.save(nib.Nifti1Image(labels, np.eye(4)), path)
+        return path
+
+    def test_bounding_boxes(self):
+        boxes = Nifti2StlConverter.label_bounding_boxes(self.labels)
+        self.assertEqual(sorted(boxes), [1, 2, 4])
+        for class_value, box in boxes.items():
+            # The box holds the whole class with a margin, and starts on the downsampling grid
+            indices = np.nonzero(self.labels == class_value)
+            for axis, (start, stop) in enumerate((box_axis.start, box_axis.stop) for box_axis in box):
+                self.assertEqual(start % 2, 0)
+                self.assertLessEqual(start, max(0, indices[axis].min() - 2))
+                self.assertGreaterEqual(stop, min(self.labels.shape[axis], indices[axis].max() + 3))
+
+        # Meshing the crop gives the same surface as meshing the whole volume
+        for case_name, class_value, crop, offset, path in Nifti2StlConverter(self.mask_path, self.tmp_dir).class_jobs(self.mask_path, self.tmp_dir):
+            cropped = Nifti2StlConverter.mesh_class(case_name, class_value, crop, offset, path, 20, 'npz')
+            whole = Nifti2StlConverter.mesh_class(case_name, class_value, self.labels == class_value, [0, 0, 0], path, 20, 'npz')
+            self.assertEqual(cropped['n_faces'], whole['n_faces'])
+            self.assertTrue(np.allclose(np.sort(cropped['mesh'][0], axis=0), np.sort(whole['mesh'][0], axis=0), atol=1e-3))
+
+    def read_surfaces(self, engine):
+        reader = vtk.vtkNIFTIImageReader()
+        reader.SetFileName(self.mask_path)
+        reader.Update()
+        if engine == 'discrete':
+            return dict(Nifti2StlConverter.discrete_surfaces(reader.GetOutputPort(), [1, 2, 4]))
+        return {value: Nifti2StlConverter.contour_surface(reader.GetOutputPort(), value) for value in [1, 2, 4]}
+
+    def test_discrete_engine(self):
+        discrete, contour = self.read_surfaces('discrete'), self.read_surfaces('contour')
+        self.assertEqual(sorted(discrete), [1, 2, 4])
+        for value in [1, 2, 4]:
+            # Each class gets only its own triangles: the surface is on the boundary of the voxels of the class,
+            # half a voxel outside the contour surface that passes through the centers of the boundary voxels
+            indices = np.nonzero(self.labels == value)
+            class_box = np.stack([[axis.min(), axis.max()] for axis in indices], axis=1).astype(float)
+            discrete_points = vtk_to_numpy(discrete[value].GetPoints().GetData())
+            contour_points = vtk_to_numpy(contour[value].GetPoints().GetData())
+            self.assertTrue(np.allclose([discrete_points.min(axis=0), discrete_points.max(axis=0)], class_box + [[-0.5], [0.5]]))
+            self.assertTrue(np.allclose([contour_points.min(axis=0), contour_points.max(axis=0)], class_box))
+
+            # The discrete surfaces have more triangles before the reduction, about twice on the rounded shapes
+            self.assertGreater(discrete[value].GetNumberOfPolys(), contour[value].GetNumberOfPolys())
+        self.assertTrue(1.6 < discrete[4].GetNumberOfPolys() / contour[4].GetNumberOfPolys() < 2.6)
+
+        out_dir = os.path.join(self.tmp_dir, 'discrete')
+        Nifti2StlConverter(self.mask_path, out_dir).nifti2stl_vtk_multi_class(engine='discrete')
+        self.assertEqual(sorted(os.listdir(out_dir)), ['case_1.stl', 'case_2.stl', 'case_4.stl'])
+
+    def test_directory_manifest(self):
+        in_dir = os.path.join(self.tmp_dir, 'cases')
+        os.makedirs(in_dir)
+        shutil.move(self.mask_path, in_dir)
+        empty = np.zeros((10, 10, 10), dtype=np.uint8)
+        nib.save(nib.Nifti1Image(empty, np.eye(4)), os.path.join(in_dir, 'empty.nii.gz'))
+        with open(os.path.join(in_dir, 'broken.nii.gz'), 'wb') as outfile:
+            outfile.write(b'not a nifti file')
+
+        for workers in [None, 2]:
+            out_dir = os.path.join(self.tmp_dir, f'meshes_{workers}')
+            manifest = Nifti2StlConverter(in_dir, out_dir).nifti2stl_vedo_dir(workers=workers, number_of_iterations=10)
+            self.assertEqual((manifest['cases'], manifest['meshes'], manifest['errors']), (3, 3, 1))
+            with open(os.path.join(out_dir, 'manifest.json')) as infile:
+                self.assertEqual(json.load(infile)['records'], manifest['records'])
+
+            # The broken case is one error record, the empty case has no record
+            records = {(record['case'], record['label']): record for record in manifest['records']}
+            self.assertEqual(sorted(records, key=str), sorted([('broken', None), ('case', 1), ('case', 2), ('case', 4)], key=str))
+            self.assertEqual(records['broken', None]['status'], 'error')
+            self.assertIn('error', records['broken', None])
+            for label in [1, 2, 4]:
+                record = records['case', label]
+                self.assertEqual(record['status'], 'done')
+                self.assertTrue(os.path.exists(record['path']))
+                self.assertGreater(record['n_faces'], 0)
+
+    def test_quantized_meshes(self):
+        rng = np.random.default_rng(0)
+        meshes = {1: (rng.uniform(-50, 200, size=(300, 3)).astype(np.float32), rng.integers(0, 300, size=(500, 3))),
+                  3: (rng.uniform(0, 10, size=(20, 3)).astype(np.float32), rng.integers(0, 20, size=(30, 3))),
+                  5: (np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int64))}
+        path = write_quantized_meshes(meshes, os.path.join(self.tmp_dir, 'case'))
+        self.assertTrue(path.endswith('case.npz'))
+
+        # The error of the vertices is at most half a quantization step of the box of all the meshes
+        all_vertices = np.concatenate([vertices for vertices, _ in meshes.values()])
+        step = (all_vertices.max(axis=0) - all_vertices.min(axis=0)) / 65535
+        read_meshes = read_quantized_meshes(path)
+        self.assertEqual(sorted(read_meshes), [1, 3, 5])
+        for class_value, (vertices, triangles) in meshes.items():
+            read_vertices, read_triangles = read_meshes[class_value]
+            self.assertEqual(read_vertices.shape, vertices.shape)
+            self.assertTrue(np.all(np.abs(read_vertices - vertices) <= step / 2 + 1e-4))
+            self.assertTrue(np.array_equal(read_triangles, triangles))
+        with np.load(path) as archive:
+            self.assertEqual(archive['triangles_3'].dtype, np.uint8)
+            self.assertEqual(archive['vertices_1'].dtype, np.uint16)
+
+    def test_mesh_formats(self):
+        converter = Nifti2StlConverter(self.mask_path, os.path.join(self.tmp_dir, 'formats'))
+        converter.nifti2stl_vtk_multi_class(reduce_meshes=False, mesh_format='stl')
+        converter.nifti2stl_vtk_multi_class(reduce_meshes=False, mesh_format='npz')
+
+        # The stl files are binary: an 80 bytes header, the number of triangles and 50 bytes per triangle
+        meshes = read_quantized_meshes(os.path.join(self.tmp_dir, 'formats', 'case.npz'))
+        for class_value in [1, 2, 4]:
+            path = os.path.join(self.tmp_dir, 'formats', f'case_{class_value}.stl')
+            n_triangles = len(meshes[class_value][1])
+            self.assertEqual(np.fromfile(path, dtype=np.uint32, count=1, offset=80)[0], n_triangles)
+            self.assertEqual(os.path.getsize(path), 84 + 50 * n_triangles)
+
+        with self.assertRaises(ValueError):
+            converter.nifti2stl_vtk_multi_class(mesh_format='obj')
+
+    def test_levels_of_detail(self):
+        for mesh_format in ['stl', 'npz']:
+            out_dir = os.path.join(self.tmp_dir, f'lod_{mesh_format}')
+            index = Nifti2StlConverter(self.mask_path, out_dir).nifti2stl_vtk_multi_class(lod_levels=(0.05, 1.0, 0.25), mesh_format=mesh_format)
+            with open(os.path.join(out_dir, 'case_lod.json')) as infile:
+                self.assertEqual(json.load(infile), index)
+
+            # The levels go from the finest to the coarsest
+            self.assertEqual((index['case'], index['format']), ('case', mesh_format))
+            self.assertEqual(index['levels'], [{'level': 0, 'fraction': 1.0}, {'level': 1, 'fraction': 0.25}, {'level': 2, 'fraction': 0.05}])
+            self.assertEqual([item['label'] for item in index['classes']], [1, 2, 4])
+            for item in index['classes']:
+                faces = [level['n_faces'] for level in item['levels']]
+                for level, fraction in zip(item['levels'], [1.0, 0.25, 0.05]):
+                    # Each level keeps about its fraction of the triangles of the finest level
+                    self.assertLessEqual(level['n_faces'], max(fraction * faces[0] * 1.1, 8))
+                    self.assertTrue(os.path.exists(os.path.join(out_dir, level['path'])))
+                self.assertEqual(faces, sorted(faces, reverse=True))
+                if mesh_format == 'stl':
+                    self.assertEqual([level['path'] for level in item['levels']], [f"case_{item['label']}_lod{i}.stl" for i in range(3)])
+                else:
+                    for i, level in enumerate(item['levels']):
+                        self.assertEqual(len(read_quantized_meshes(os.path.join(out_dir, level['path']))[item['label']][1]), level['n_faces'])
+
+        with self.assertRaises(ValueError):
+            Nifti2StlConverter(self.mask_path, self.tmp_dir).nifti2stl_vtk_multi_class(lod_levels=(1.0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import gzip
+import os
+import numpy as np
+import nibabel as nib
+import SimpleITK as sitk
+from pycad.utils import write_nifti, BlockGzipWriter
+
+class TestNiftiWriter(unittest.TestCase):
+    '''
+    This is the unit test for the multi-threaded NIfTI writer. It checks that the multi-member gzip files can be read back by gzip, nibabel and SimpleITK.
+    '''
+    def test_block_gzip(self):
+        data = os.urandom(1000) * 50
+        with BlockGzipWriter('blocks.gz', compress_level=1, threads=4, block_size=4096) as f:
+            f.write(data[:777])
+            f.write(data[777:])
+
+        with gzip.open('blocks.gz', 'rb') as f:
+            self.assertEqual(f.read(), data)
+        os.remove('blocks.gz')
+
+    def test_write_nifti(self):
+        array = np.random.randint(-1000, 1000, size=(7, 9, 11)).astype(np.int16)
+        image = sitk.GetImageFromArray(array)
+        image.SetSpacing((0.5, 0.8, 2.0))
+        image.SetOrigin((10.0, -5.0, 3.0))
+
+        for filename in ['image.nii.gz', 'image.nii']:
+            write_nifti(image, filename, threads=2, block_size=128)
+
+            # Read back with SimpleITK
+            read_image = sitk.ReadImage(filename)
+            self.assertTrue(np.array_equal(sitk.GetArrayFromImage(read_image), array))
+            self.assertTrue(np.allclose(read_image.GetSpacing(), image.GetSpacing()))
+            self.assertTrue(np.allclose(read_image.GetOrigin(), image.GetOrigin()))
+
+            # Read back with nibabel, the array is in the (x, y, z) order
+            nifti = nib.load(filename)
+            self.assertTrue(np.array_equal(np.asanyarray(nifti.dataobj), array.transpose()))
+            os.remove(filename)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import time
+from pycad.utils.parallel import run_jobs
+
+
+def slow_square(x):
+    # The first jobs are the slowest, so they finish last in the pools
+    time.sleep(0.02 * (5 - x % 5))
+    return x * x
+
+
+def fail_on_three(x):
+    if x == 3:
+        raise ValueError('job 3 failed')
+    return x
+
+
+class TestRunJobs(unittest.TestCase):
+    '''
+    This is the unit test for `run_jobs`. It checks that the results are in the order of the jobs in every mode, that the progress is reported once per job and that the errors of the workers are raised.
+    '''
+    def test_order(self):
+        jobs = [(x,) for x in range(10)]
+        expected = [x * x for x in range(10)]
+        for options in [{}, {'workers': 4, 'use_processes': False}, {'workers': 3, 'use_processes': True}]:
+            self.assertEqual(run_jobs(slow_square, jobs, **options), expected)
+
+    def test_progress(self):
+        for options in [{}, {'workers': 4, 'use_processes': False}, {'workers': 2, 'use_processes': True}]:
+            calls = []
+            run_jobs(slow_square, [(x,) for x in range(6)], progress=lambda done, total: calls.append((done, total)), **options)
+            self.assertEqual(calls, [(done, 6) for done in range(1, 7)])
+
+    def test_errors(self):
+        for options in [{}, {'workers': 4, 'use_processes': False}, {'workers': 2, 'use_processes': True}]:
+            with self.assertRaisesRegex(ValueError, 'job 3 failed'):
+                run_jobs(fail_on_three, [(x,) for x in range(6)], **options)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import os
+import io
+import json
+import shutil
+import tarfile
+import tempfile
+import numpy as np
+from PIL import Image
+from pycad.datasets import ShardWriter, ShardReader, DataSplitter
+
+
+class TestShardWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_samples(self, shard_format, n_samples=25, shard_size=10):
+        shard_dir = os.path.join(self.tmp_dir, shard_format)
+        images = {f'case_{i:04d}': np.full((8, 8), i, dtype=np.uint8) for i in range(n_samples)}
+        with ShardWriter(shard_dir, shard_size=shard_size, shard_format=shard_format) as writer:
+            for key, image in images.items():
+                writer.write(key, {'png': image, 'txt': f'0 0.5 0.5 {key}'})
+        return shard_dir, images
+
+    def test_tar(self):
+        shard_dir, images = self.write_samples('tar')
+        with open(os.path.join(shard_dir, 'index.json')) as infile:
+            index = json.load(infile)
+        self.assertEqual([shard['n_samples'] for shard in index['shards']], [10, 10, 5])
+
+        # WebDataset layout
+        with tarfile.open(os.path.join(shard_dir, 'shard-000000.tar')) as tar:
+            self.assertEqual(tar.getnames()[:2], ['case_0000.png', 'case_0000.txt'])
+
+        reader = ShardReader(shard_dir)
+        self.assertEqual(len(reader), 25)
+        sample = reader.read('case_0017')
+        np.testing.assert_array_equal(np.array(Image.open(io.BytesIO(sample['png']))), images['case_0017'])
+        self.assertEqual(sample['txt'], b'0 0.5 0.5 case_0017')
+
+    def test_npz(self):
+        shard_dir, images = self.write_samples('npz')
+        np.testing.assert_array_equal(ShardReader(shard_dir).read('case_0022')['png'], images['case_0022'])
+
+    def test_split_shards(self):
+        shard_dir, _ = self.write_samples('tar', n_samples=100)
+        output_dir = os.path.join(self.tmp_dir, 'split')
+        DataSplitter(output_dir=output_dir, shards_dir=shard_dir).run()
+        n_samples = {split: len(ShardReader(os.path.join(output_dir, split))) for split in ('train', 'valid', 'test')}
+        self.assertEqual(n_samples, {'train': 70, 'valid': 20, 'test': 10})
+
+    def test_split_shards_by_case(self):
+        # 11 cases of 7 slices and one case of 20 slices, in shards of 15 slices
+        shard_dir = os.path.join(self.tmp_dir, 'cases')
+        with ShardWriter(shard_dir, shard_size=15) as writer:
+            for case in range(12):
+                n_slices = 20 if case == 11 else 7
+                writer.write_group(f'case_{case:02d}', [(f'case_{case:02d}_{i}', {'png': np.zeros((4, 4), dtype=np.uint8)}) for i in range(n_slices)])
+        with open(os.path.join(shard_dir, 'index.json')) as infile:
+            index = json.load(infile)
+        self.assertEqual([shard['n_samples'] for shard in index['shards']], [14, 14, 14, 14, 14, 7, 15, 5])
+        self.assertEqual(index['shards'][0]['groups'], ['case_00', 'case_01'])
+
+        # The two shards of the big case stay together, and no case is in two splits
+        output_dir = os.path.join(self.tmp_dir, 'split')
+        splits = DataSplitter(output_dir=output_dir, shards_dir=shard_dir, train_ratio=0.5, valid_ratio=0.3, test_ratio=0.2).split_shards()
+        self.assertEqual([len(splits[split]) > 0 for split in ('train', 'valid', 'test')], [True, True, True])
+        cases = {}
+        for split in ('train', 'valid', 'test'):
+            for key in ShardReader(os.path.join(output_dir, split)).keys():
+                cases.setdefault(key[:7], set()).add(split)
+        self.assertEqual(len(cases), 12)
+        self.assertTrue(all(len(split_names) == 1 for split_names in cases.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,8 @@
 # Copyright (c) 2023 PYCAD
 # This file is part of the PYCAD library and is released under the MIT License:
-# https://github.com/amine0110/pycad/blob/main/LICENSE
\ No newline at end of file
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+from .nifti_writer import write_nifti, BlockGzipWriter
+from .dicom_encoding import save_dicom, encode_dataset, available_encodings
+from .labels import load_labels, to_labels
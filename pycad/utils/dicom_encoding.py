@@ -0,0 +1,111 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import zlib
+from pydicom.dataset import FileDataset
+from pydicom.encaps import encapsulate
+from pydicom.encoders import get_encoder
+from pydicom.uid import (RLELossless, JPEGLSLossless, JPEG2000Lossless, JPEGLosslessSV1,
+                         DeflatedExplicitVRLittleEndian, ExplicitVRLittleEndian)
+
+
+# The lossless transfer syntaxes that can be written, by name
+ENCODINGS = {
+    'rle': RLELossless,
+    'jpeg-ls': JPEGLSLossless,
+    'jpeg2000': JPEG2000Lossless,
+    'jpeg-lossless': JPEGLosslessSV1,
+    'deflate': DeflatedExplicitVRLittleEndian,
+}
+
+
+def encoder_available(encoding):
+    '''
+    Returns True if the pixel data can be encoded with `encoding` in this environment (the JPEG encoders depend on optional plugins).
+    '''
+    uid = ENCODINGS[encoding]
+    if uid == DeflatedExplicitVRLittleEndian:
+        return True  # the whole dataset is deflated with zlib
+    try:
+        return get_encoder(uid).is_available
+    except NotImplementedError:
+        return False
+
+
+def available_encodings():
+    '''
+    Returns the names of the encodings that can be used in this environment.
+    '''
+    return [encoding for encoding in ENCODINGS if encoder_available(encoding)]
+
+
+def transfer_syntax(encoding):
+    '''
+    Returns the transfer syntax UID of an encoding name, `None` gives the uncompressed explicit VR little endian.
+    Raises a ValueError if the encoding is unknown or if no encoder is available for it.
+    '''
+    if encoding is None:
+        return ExplicitVRLittleEndian
+    if encoding not in ENCODINGS:
+        raise ValueError(f'Unknown encoding {encoding}, choose one of {list(ENCODINGS)}.')
+    if not encoder_available(encoding):
+        raise ValueError(f'No encoder is available for {encoding} in this environment, the available encodings are {available_encodings()}.')
+    return ENCODINGS[encoding]
+
+
+def encode_dataset(ds, encoding):
+    '''
+    Encodes the pixel data of a dataset in place with a lossless transfer syntax (see `ENCODINGS`), `None` leaves the dataset unchanged.
+    The already compressed datasets are decompressed first.
+    '''
+    if encoding is None:
+        return ds
+    uid = transfer_syntax(encoding)
+    if ds.file_meta.TransferSyntaxUID.is_compressed:
+        ds.decompress()
+
+    if uid == DeflatedExplicitVRLittleEndian:
+        ds.file_meta.TransferSyntaxUID = uid
+        ds.is_little_endian = True
+        ds.is_implicit_VR = False
+    else:
+        ds.compress(uid)
+    return ds
+
+
+def save_dicom(ds, path, encoding=None):
+    '''
+    Saves a dataset, with its pixel data encoded with `encoding` if given (for example 'rle').
+    The datasets read from files keep their original layout when they are not encoded.
+    '''
+    write_like_original = encoding is None and isinstance(ds, FileDataset)
+    encode_dataset(ds, encoding).save_as(path, write_like_original=write_like_original)
+    return path
+
+
+def encode_frame(pixels, encoding, photometric_interpretation='MONOCHROME2'):
+    '''
+    Encodes one 2D frame (a numpy array) and returns the encapsulated bytes of the pixel data element value.
+    '''
+    frame = get_encoder(transfer_syntax(encoding)).encode(
+        pixels,
+        rows=pixels.shape[0],
+        columns=pixels.shape[1],
+        samples_per_pixel=1,
+        bits_allocated=pixels.dtype.itemsize * 8,
+        bits_stored=pixels.dtype.itemsize * 8,
+        pixel_representation=int(pixels.dtype.kind == 'i'),
+        photometric_interpretation=photometric_interpretation,
+        number_of_frames=1,
+    )
+    return encapsulate([frame])
+
+
+def deflate(data, compress_level=6):
+    '''
+    Compresses the dataset bytes (everything after the file meta information) for the deflated transfer syntax.
+    '''
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
@@ -0,0 +1,26 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import numpy as np
+
+
+def to_labels(labels):
+    '''
+    Converts a mask to uint8 labels (or uint16 for more than 255 labels), the float masks are rounded first.
+    Raises a ValueError when a label is negative or above 65535, instead of letting them wrap around.
+    '''
+    if labels.dtype.kind == 'f':
+        labels = np.rint(labels)
+    min_label, max_label = labels.min(initial=0), labels.max(initial=0)
+    if min_label < 0 or max_label > 65535:
+        raise ValueError(f'The labels should be between 0 and 65535, the mask has labels from {min_label} to {max_label}.')
+    return labels.astype(np.uint8 if max_label < 256 else np.uint16, copy=False)
+
+
+def load_labels(nifti_file):
+    '''
+    Loads the labels of a nifti mask (a nibabel image) through `dataobj`, as uint8 (or uint16 for more than 255 labels) instead of the float64 of `get_fdata`.
+    '''
+    return to_labels(np.asanyarray(nifti_file.dataobj))
@@ -0,0 +1,162 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import nibabel as nib
+import SimpleITK as sitk
+
+
+def compress_block(block, compress_level):
+    '''
+    Compresses one block as a complete gzip member, zlib releases the GIL so the blocks can be compressed on threads.
+    '''
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+
+class BlockGzipWriter:
+    '''
+    The class BlockGzipWriter is a write-only file object that compresses the data by independent blocks on a pool of threads.
+    The blocks are written as a multi-member gzip stream, which is a valid gzip file that any reader (gzip, zlib, nibabel, ITK...) can open.\n
+
+    Params:
+    - path: the path to the output file.
+    - compress_level: the gzip compression level, from 0 (no compression) to 9 (best compression).
+    - threads: the number of threads compressing the blocks, by default the number of CPUs.
+    - block_size: the size in bytes of the uncompressed blocks.\n
+
+    ### Example of usage:
+    ```Python
+    from pycad.utils import BlockGzipWriter
+
+    with BlockGzipWriter('path/to/file.gz', compress_level=1) as f:
+        f.write(data)
+    ```
+    '''
+
+    def __init__(self, path, compress_level=6, threads=None, block_size=4 << 20):
+        self.file = open(path, 'wb')
+        self.compress_level = compress_level
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.pool = ThreadPoolExecutor(max_workers=self.threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        written = len(data)
+        self.position += written
+
+        # Submit the full blocks directly from the input, and keep the remainder for the next write
+        if self.buffer:
+            missing = self.block_size - len(self.buffer)
+            self.buffer += data[:missing]
+            data = data[missing:]
+            if len(self.buffer) == self.block_size:
+                self.submit(bytes(self.buffer))
+                self.buffer = bytearray()
+        while len(data) >= self.block_size:
+            self.submit(data[:self.block_size].tobytes())
+            data = data[self.block_size:]
+        self.buffer += data
+        return written
+
+    def submit(self, block):
+        self.pending.append(self.pool.submit(compress_block, block, self.compress_level))
+        # Limit the number of blocks in memory, the compressed blocks are written in order
+        while len(self.pending) > 2 * self.threads:
+            self.file.write(self.pending.popleft().result())
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            if self.buffer or self.position == 0:
+                self.submit(bytes(self.buffer))
+                self.buffer = bytearray()
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+        finally:
+            self.pool.shutdown()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sitk_to_nifti(image):
+    '''
+    Converts a SimpleITK image into a nibabel NIfTI image, the pixel array is transposed from the ITK (z, y, x) order to the NIfTI (x, y, z) order.
+    '''
+    array = sitk.GetArrayFromImage(image)
+    dimension = image.GetDimension()
+
+    matrix = np.asarray(image.GetDirection(), dtype=float).reshape(dimension, dimension) * np.asarray(image.GetSpacing())
+    affine = np.eye(4)
+    affine[:min(dimension, 3), :min(dimension, 3)] = matrix[:3, :3]
+    affine[:min(dimension, 3), 3] = image.GetOrigin()[:3]
+    # ITK is in LPS and NIfTI in RAS
+    affine = np.diag([-1, -1, 1, 1]) @ affine
+
+    nifti = nib.Nifti1Image(array.transpose(), affine)
+    nifti.set_qform(affine, code=1)
+    nifti.set_sform(affine, code=1)
+    nifti.header.set_xyzt_units('mm', 'sec')
+    return nifti
+
+
+def write_nifti(image, output_path, compress_level=6, threads=None, block_size=4 << 20):
+    '''
+    Writes a NIfTI image, the `.nii.gz` outputs are compressed by blocks on a pool of threads (see `BlockGzipWriter`) and the `.nii` outputs are written without compression.\n
+    - `image`: a SimpleITK image or a nibabel NIfTI image
+    - `output_path`: the path to the output file (.nii or .nii.gz)
+    - `compress_level`: the gzip compression level of the `.nii.gz` outputs
+    - `threads`: the number of compression threads, by default the number of CPUs
+    - `block_size`: the size in bytes of the blocks compressed independently
+    '''
+    if isinstance(image, sitk.Image):
+        if image.GetNumberOfComponentsPerPixel() > 1 or image.GetDimension() > 3:
+            # The vector and 4D images are left to ITK which handles their specific layouts
+            sitk.WriteImage(image, output_path, useCompression=output_path.endswith('.gz'))
+            return output_path
+        image = sitk_to_nifti(image)
+
+    data = np.asanyarray(image.dataobj)
+    if not data.dtype.isnative:
+        data = data.astype(data.dtype.newbyteorder('='))
+    image.update_header()
+    header = image.header.copy()
+    if header.endianness != nib.volumeutils.native_code:
+        header = header.as_byteswapped(nib.volumeutils.native_code)
+    header.extensions.clear()
+    header.set_data_dtype(data.dtype)
+    header.set_data_shape(data.shape)
+    header.set_slope_inter(None, None)
+    header['vox_offset'] = 352
+
+    # The NIfTI data is in Fortran order, which is the C order of the transposed array
+    raw = np.ascontiguousarray(data.T)
+
+    if output_path.endswith('.gz'):
+        f = BlockGzipWriter(output_path, compress_level=compress_level, threads=threads, block_size=block_size)
+    else:
+        f = open(output_path, 'wb')
+    with f:
+        header.write_to(f)  # writes the header and the extension flag
+        f.write(b'\0' * (352 - f.tell()))
+        f.write(raw.view(np.uint8).reshape(-1))
+    return output_path
@@ -0,0 +1,45 @@
+# Copyright (c) 2023 PYCAD
+# This file is part of the PYCAD library and is released under the MIT License:
+# https://github.com/amine0110/pycad/blob/main/LICENSE
+
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+
+def run_jobs(func, jobs, workers=None, executor=None, use_processes=True, progress=None):
+    '''
+    Runs `func(*job)` for every job and returns the results in the same order as the jobs, whatever the mode.\n
+    - `func`: the function to call, it needs to be picklable (module level function or method of a picklable object) when a process pool is used
+    - `jobs`: a list of tuples, each tuple is unpacked as the arguments of one call
+    - `workers`: the number of workers of the pool, `None` or `1` runs the jobs one after the other in the current process
+    - `executor`: an already created `concurrent.futures` executor to submit the jobs to (it is not shut down here), this has priority over `workers`
+    - `use_processes`: whether the pool created from `workers` is a process pool (CPU bound work) or a thread pool (I/O bound work)
+    - `progress`: an optional callable called as `progress(done, total)` every time a job is finished
+    '''
+    jobs = list(jobs)
+    total = len(jobs)
+
+    if executor is None and (not workers or workers <= 1 or total <= 1):
+        results = []
+        for done, job in enumerate(jobs, start=1):
+            results.append(func(*job))
+            if progress:
+                progress(done, total)
+        return results
+
+    if executor is not None:
+        return _run_on_executor(executor, func, jobs, progress)
+
+    pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool_class(max_workers=min(workers, total)) as pool:
+        return _run_on_executor(pool, func, jobs, progress)
+
+
+def _run_on_executor(executor, func, jobs, progress):
+    futures = {executor.submit(func, *job): idx for idx, job in enumerate(jobs)}
+    results = [None] * len(jobs)
+    for done, future in enumerate(as_completed(futures), start=1):
+        results[futures[future]] = future.result()
+        if progress:
+            progress(done, len(jobs))
+    return results
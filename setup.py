@@ -25,6 +25,7 @@ setup(
         'pydicom==2.4.3',
         'vtk==9.2.6',
         'vedo==2023.4.6',
+        'scipy==1.11.3',
         'scikit-image==0.22.0',
         'opencv-python==4.8.1.78',
         'pytest-shutil',